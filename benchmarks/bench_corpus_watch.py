@@ -0,0 +1,174 @@
+"""Time live corpus updates under a watcher against re-ingesting, while songs keep generating.
+
+A corpus of --files files is made from the files under midi_files/, each
+with a unique trailing chunk (ignored by the parser) so every copy is new
+content to analyze, and learned cold into a scratch cache. Then, for each
+watcher (inotify and polling), a thread keeps generating songs from the
+generator's learned patterns while files are added, rewritten, removed and
+a new genre folder appears. Reported per change: time from the change on
+disk to the new patterns being in the generator, and the files analyzed
+for it. The final patterns must equal a cold ingest of the final corpus,
+and no generation may fail while the tables are swapped under it.
+
+    python benchmarks/bench_corpus_watch.py [--files 1000] [--interval 0.1]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_watcher import CorpusWatcher, InotifyWatcher  # noqa: E402
+from gen_song import MIDI_ROOT_DIR, ViralMusicGenerator, generate_viral_song_from_patterns  # noqa: E402
+from midi_analysis import AnalysisCache, ingest_corpus, iter_corpus_files  # noqa: E402
+
+GENRES = ('Pop', 'Rock', 'Jazz')
+
+
+def unique_copy(source, path, serial):
+    """Copy a MIDI file with an extra chunk, so its content hash is new"""
+    with open(source, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data + b'XSRL' + struct.pack('>II', 4, serial))
+
+
+def same_patterns(expected, actual):
+    for name, table in expected.items():
+        if name == 'viral_elements':
+            if table.keys() != actual[name].keys() or any(
+                    abs(table[stat][field] - actual[name][stat][field]) > 1e-6 * max(1.0, abs(table[stat][field]))
+                    for stat in table for field in table[stat]):
+                return False
+        elif table != actual[name]:
+            return False
+    return True
+
+
+class Generations:
+    """Generates songs from the generator's current patterns in a thread until stopped"""
+
+    def __init__(self, generator, output_file):
+        self.generator = generator
+        self.output_file = output_file
+        self.songs = self.failed = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while self.running:
+            patterns = self.generator.learned_patterns
+            if generate_viral_song_from_patterns(patterns, seed=self.songs, output_file=self.output_file) is None:
+                self.failed += 1
+            self.songs += 1
+
+
+def changes(root, sources, serial):
+    """(description, files involved, action) for each step of the scenario"""
+    pop = os.path.join(root, 'Pop')
+    existing = sorted(path for path, _ in iter_corpus_files(root))
+
+    def add(first, count):
+        def action():
+            for index in range(serial + first, serial + first + count):
+                unique_copy(sources[index % len(sources)], os.path.join(pop, f"new_{index}.mid"), index)
+        return action
+
+    def rewrite():
+        for index, path in enumerate(existing[:5]):
+            unique_copy(sources[(index + 1) % len(sources)], path, serial + 100 + index)
+
+    def remove():
+        for path in existing[-5:]:
+            os.remove(path)
+
+    def new_genre():
+        staging = os.path.join(os.path.dirname(root), 'incoming')
+        os.makedirs(staging)
+        for index in range(3):
+            unique_copy(sources[index % len(sources)], os.path.join(staging, f"drop_{index}.mid"), serial + 200 + index)
+        os.rename(staging, os.path.join(root, 'Ambient'))
+
+    return (('add 1 file', 1, add(0, 1)), ('add 20 files', 20, add(1, 20)), ('rewrite 5 files', 5, rewrite),
+            ('remove 5 files', 5, remove), ('new genre folder', 3, new_genre))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--interval', type=float, default=0.1, help="Watcher poll interval in seconds")
+    args = parser.parse_args()
+
+    sources = [path for path, _ in iter_corpus_files(MIDI_ROOT_DIR)]
+    scratch = tempfile.mkdtemp()
+    ok = True
+    for mode in ('inotify', 'polling'):
+        if mode == 'inotify':
+            try:
+                InotifyWatcher(scratch).close()
+            except (OSError, AttributeError):
+                print("   inotify unavailable here, skipped")
+                continue
+        root = os.path.join(scratch, mode, 'corpus')
+        for index in range(args.files):
+            directory = os.path.join(root, GENRES[index % len(GENRES)])
+            os.makedirs(directory, exist_ok=True)
+            unique_copy(sources[index % len(sources)], os.path.join(directory, f"song_{index:06d}.mid"), index)
+        cache = AnalysisCache(os.path.join(scratch, mode, 'cache'))
+        started = time.perf_counter()
+        accumulator, _ = cache.ingest(root, workers=1)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        cache.ingest(root, workers=1)
+        warm = time.perf_counter() - started
+        print(f"📦 {mode}: {args.files} files learned cold in {cold:.2f}s; a full re-ingest with nothing"
+              f" changed still stats every file, {warm * 1e3:.1f} ms")
+
+        generator = ViralMusicGenerator()
+        generator.learned_patterns = accumulator.patterns()
+        applied = []
+        watcher = CorpusWatcher(generator, cache, root, workers=1, interval=args.interval, polling=mode == 'polling',
+                                on_update=applied.append)
+        generations = Generations(generator, os.path.join(scratch, mode, 'song.mid'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            watcher.start()
+            generations.thread.start()
+            timings = []
+            for description, expected, action in changes(root, sources, args.files):
+                before = watcher.updates
+                started = time.perf_counter()
+                action()
+                while watcher.updates == before:
+                    time.sleep(0.001)
+                elapsed = time.perf_counter() - started
+                # Let the rest of a change that arrived in two batches land
+                time.sleep(args.interval * 3)
+                handled = applied[before:]
+                timings.append((description, expected, elapsed,
+                                sum(stats.files + stats.reused + stats.removed for stats in handled),
+                                sum(stats.files for stats in handled)))
+            generations.running = False
+            generations.thread.join()
+            watcher.stop()
+            expected_patterns = ingest_corpus(root, workers=1)[0].patterns()
+
+        for description, files, elapsed, touched, analyzed in timings:
+            print(f"{description:>18}  live in {elapsed * 1e3:>7.1f} ms   {touched:>3} files updated,"
+                  f" {analyzed} analyzed (expected {files})")
+        same = same_patterns(expected_patterns, generator.learned_patterns)
+        ok = ok and same and not generations.failed
+        print(f"{'✅' if same else '❌'} live patterns {'match' if same else 'DIFFER FROM'} a cold ingest;"
+              f" {generations.songs} songs generated during the changes, {generations.failed} failed")
+    shutil.rmtree(scratch)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
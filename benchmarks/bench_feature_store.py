@@ -0,0 +1,139 @@
+"""Time filtered top-k queries on the feature store against Counters.
+
+The corpus is synthetic: every file under midi_files/ is analyzed once,
+then copied into --files files with random genre folders, tempos, keys and
+transpositions. The store is built from them, reopened, and asked for the
+top progressions (and melodies) of each query. The baseline is what the
+generators did before: fold every file's features into Counters and call
+most_common. Both answers are checked against each other; peak traced
+memory is reported per approach (the baseline starts from features already
+in memory, so its peak excludes loading them).
+
+    python benchmarks/bench_feature_store.py [--files 20000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureStore, FeatureStoreBuilder  # noqa: E402
+from gen_song import MIDI_ROOT_DIR  # noqa: E402
+from midi_analysis import PITCH_NAMES, analyze_midi_file, iter_corpus_files  # noqa: E402
+from music_theory import NOTE_CLASSES  # noqa: E402
+
+GENRES = ('Pop', 'Rock', 'Jazz', 'Blues', 'Electronic', 'Ambient')
+QUERIES = (
+    ('Pop 110-130 BPM', {'genre': 'Pop', 'tempo': (110, 130)}),
+    ('Jazz, A minor', {'genre': 'Jazz', 'key': 'A minor'}),
+    ('90-100 BPM', {'tempo': (90, 100)}),
+    ('whole corpus', {}),
+)
+
+
+def transpose(chord, shift):
+    match = re.match(r'([A-G][#b]?)(.*)', chord)
+    return PITCH_NAMES[(NOTE_CLASSES[match.group(1)] + shift) % 12] + match.group(2)
+
+
+def synthetic_corpus(files, seed=0):
+    rng = random.Random(seed)
+    bases = [analyze_midi_file(path, genre) for path, genre in iter_corpus_files(MIDI_ROOT_DIR)]
+    for _ in range(files):
+        base = rng.choice(bases)
+        shift = rng.randrange(12)
+        yield dict(base,
+                   genre=rng.choice(GENRES),
+                   tempo=round(rng.uniform(70, 170), 1),
+                   key=f"{rng.choice(PITCH_NAMES)} {rng.choice(('major', 'minor'))}",
+                   progressions={tuple(transpose(chord, shift) for chord in progression): count
+                                 for progression, count in base['progressions'].items()})
+
+
+def matches(features, genre=None, key=None, tempo=None):
+    return ((genre is None or features['genre'].lower() == genre.lower())
+            and (key is None or features['key'] == key)
+            and (tempo is None or tempo[0] <= features['tempo'] <= tempo[1]))
+
+
+def counter_top(corpus, query, k):
+    progressions, melodies = Counter(), Counter()
+    for features in corpus:
+        if matches(features, **query):
+            progressions.update(features['progressions'])
+            melodies.update(features['melody_patterns'])
+    return progressions.most_common(k), melodies.most_common(k)
+
+
+def store_top(store, query, k):
+    return store.top('progression', k, **query), store.top('melody', k, **query)
+
+
+def same_ranking(expected, actual):
+    """Same counts in order, and every value returned with its true count (ties may order differently)"""
+    return ([count for _, count in expected] == [count for _, count in actual]
+            and all(dict(expected).get(value, count) == count for value, count in actual))
+
+
+def measured(fn, repeat):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return result, (time.perf_counter() - started) / repeat, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = list(synthetic_corpus(args.files))
+    directory = os.path.join(tempfile.mkdtemp(), 'feature_store')
+    started = time.perf_counter()
+    builder = FeatureStoreBuilder()
+    for features in corpus:
+        builder.add(features)
+    builder.write(directory)
+    built = time.perf_counter() - started
+    size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    print(f"📦 {args.files} files: store built in {built:.2f}s, {size / 1e6:.1f} MB on disk,"
+          f" {sum(len(files) for files, _, _ in builder.occurrences)} occurrences,"
+          f" {len(builder.string_ids)} interned strings")
+
+    started = time.perf_counter()
+    store = FeatureStore(directory)
+    store_top(store, QUERIES[0][1], args.top)
+    print(f"   open + first query: {(time.perf_counter() - started) * 1e3:.1f} ms")
+
+    print(f"{'query':>16} {'files':>7} {'counter ms':>11} {'peak':>9} {'store ms':>9} {'peak':>9} {'speedup':>8}  result")
+    for name, query in QUERIES:
+        expected, counter_elapsed, counter_peak = measured(lambda: counter_top(corpus, query, args.top), 1)
+        actual, store_elapsed, store_peak = measured(lambda: store_top(store, query, args.top), args.repeat)
+        selected = store.select(**query)
+        same = all(same_ranking(e, a) for e, a in zip(expected, actual))
+        print(f"{name:>16} {store.files if selected is None else len(selected):>7}"
+              f" {counter_elapsed * 1e3:>11.1f} {counter_peak / 1024:>7.0f}KB"
+              f" {store_elapsed * 1e3:>9.2f} {store_peak / 1024:>7.0f}KB {counter_elapsed / store_elapsed:>7.0f}x"
+              f"  {'same' if same else 'DIFFERENT'}")
+
+    print(f"   top progressions, {QUERIES[0][0]}:")
+    for progression, count in store.top('progression', args.top, **QUERIES[0][1]):
+        print(f"     {' → '.join(progression)} ({count})")
+    shutil.rmtree(os.path.dirname(directory))
+
+
+if __name__ == '__main__':
+    main()
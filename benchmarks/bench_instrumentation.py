@@ -0,0 +1,84 @@
+"""Measure what instrumentation costs, switched off and on.
+
+Renders the same songs (to memory) with instrumentation off, with a
+recorder (what batch workers use) and with every exporter. It also
+times a bare disabled stage() and count check, the whole per-song cost
+when instrumentation is off, against the render time per song.
+
+    python benchmarks/bench_instrumentation.py [--songs 2000] [--sections 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import ViralMusicGenerator  # noqa: E402
+from instrumentation import (ChromeTraceExporter, Instrumentation, LogExporter, PrometheusExporter,  # noqa: E402
+                             RecordingExporter)
+from song_sinks import MemorySink  # noqa: E402
+
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+STAGES_PER_SONG = 7
+
+
+def render_songs(generator, songs, sections):
+    elements = generator.parse_text_prompt("catchy happy pop hit", seed=0)
+    elements['structure'] = (STRUCTURE * (sections // len(STRUCTURE) + 1))[:sections]
+    sink = MemorySink()
+    started = time.perf_counter()
+    for seed in range(songs):
+        elements['seed'] = seed % 64
+        generator.render_song(elements, sink=sink, name='song.mid')
+    return (time.perf_counter() - started) / songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    recorder = RecordingExporter()
+    configurations = [
+        ('off', lambda: None),
+        ('recorder', lambda: Instrumentation([recorder])),
+        ('all exporters', lambda: Instrumentation([
+            ChromeTraceExporter(os.path.join(directory, 'trace.json')),
+            PrometheusExporter(os.path.join(directory, 'metrics.prom')),
+            LogExporter(write=lambda line: None)])),
+    ]
+
+    baseline = None
+    print(f"{args.songs} songs of {args.sections} sections, best of {args.repeat}")
+    for name, make in configurations:
+        generator = ViralMusicGenerator(instrumentation=make())
+        render_songs(generator, 64, args.sections)
+        per_song = min(render_songs(generator, args.songs, args.sections) for _ in range(args.repeat))
+        recorder.drain()
+        baseline = baseline or per_song
+        print(f"{name:>14} {per_song * 1e6:>9.1f} µs/song {(per_song / baseline - 1) * 100:>+6.1f}%")
+
+    # The disabled path on its own: one stage() per stage and one None check per song
+    generator = ViralMusicGenerator()
+    calls = 1_000_000
+    started = time.perf_counter()
+    for _ in range(calls):
+        with generator.stage('melody'):
+            pass
+    disabled = (time.perf_counter() - started) / calls
+    per_song = disabled * STAGES_PER_SONG
+    print(f"   disabled stage(): {disabled * 1e9:.0f} ns, {per_song * 1e6:.2f} µs/song"
+          f" = {per_song / baseline * 100:.3f}% of a render")
+
+    for entry in os.scandir(directory):
+        os.remove(entry.path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Time rendering a song in all 24 keys by transposition against rendering each key.
+
+Each key is rendered three ways: from scratch (an empty section cache per
+song), through render_song with the section cache shared between keys
+(each key is then a cache hit plus an array add per track), and by
+render_keys, which composes the song once and transposes the finished
+notes. The MIDI bytes of render_keys must match render_song's in every key.
+
+    python benchmarks/bench_keys.py [--prompts 8] [--sections 8]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import ALL_KEYS, ViralMusicGenerator  # noqa: E402
+from note_engine import SectionCache  # noqa: E402
+from song_sinks import MemorySink  # noqa: E402
+
+PROMPTS = [
+    "upbeat pop song for summer vibes",
+    "dark dramatic rock anthem, fast and heavy",
+    "smooth late night jazz in A minor",
+    "chill ambient electronic track for studying",
+    "sad slow blues ballad",
+    "happy playful song in F major",
+    "energetic dance hit",
+    "mysterious E minor swing",
+]
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+
+
+def key_elements(elements, song_info):
+    return elements.copy(key=song_info.key, chord_progression=song_info.chord_progression)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prompts', type=int, default=len(PROMPTS))
+    parser.add_argument('--sections', type=int, default=8)
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    sink = MemorySink()
+    timings = {'from scratch': 0.0, 'cached sections': 0.0, 'render_keys': 0.0}
+    mismatches = songs = 0
+    for index in range(args.prompts):
+        elements = generator.parse_text_prompt(PROMPTS[index % len(PROMPTS)], seed=index)
+        elements['structure'] = (STRUCTURE * (args.sections // len(STRUCTURE) + 1))[:args.sections]
+
+        started = time.perf_counter()
+        results = generator.render_keys(elements, ALL_KEYS, sink=sink)
+        timings['render_keys'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for song_info in results:
+            generator.section_cache = SectionCache()
+            generator.render_song(key_elements(elements, song_info), sink=sink, name='key.mid')
+        timings['from scratch'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for song_info in results:
+            rendered = generator.render_song(key_elements(elements, song_info), sink=sink, name='key.mid')
+            mismatches += rendered['midi_data'] != song_info['midi_data']
+            songs += 1
+        timings['cached sections'] += time.perf_counter() - started
+        sink.songs.clear()
+
+    print(f"{args.prompts} songs of {args.sections} sections in {len(ALL_KEYS)} keys")
+    for name, elapsed in timings.items():
+        print(f"{name:>16} {elapsed / args.prompts * 1000:>8.2f} ms per song in every key"
+              f" {timings['from scratch'] / elapsed:>6.1f}x")
+    single = timings['from scratch'] / len(ALL_KEYS)
+    print(f"   render_keys: {len(ALL_KEYS)} keys for the time of {timings['render_keys'] / single:.1f} songs"
+          f" from scratch, most of it one MIDI encoding per key")
+    print(f"{'✅' if not mismatches else '❌'} {songs - mismatches} of {songs} transposed songs match render_song")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
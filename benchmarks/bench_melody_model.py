@@ -0,0 +1,104 @@
+"""Time melody model training on the corpus and whole-phrase sampling.
+
+Training extracts melody phrases from every file under midi_files/ and
+counts the transition tables; counting is also timed on the phrases
+repeated --scale times, to show how it grows with a larger corpus.
+Sampling draws --phrases phrases of --length notes with the vectorized
+sampler and, for comparison, with a per-note Python loop over the same
+tables. The interval distribution of the samples is checked against the
+training melodies (total variation distance, 0 = identical).
+
+    python benchmarks/bench_melody_model.py [--phrases 10000] [--length 16] [--scale 100]
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import MIDI_ROOT_DIR  # noqa: E402
+from melody_model import INTERVAL_STATES, MelodyModel, melody_phrase_batch  # noqa: E402
+from midi_analysis import MAX_INTERVAL, iter_corpus_files  # noqa: E402
+
+
+def loop_sample(model, rng, phrases, length):
+    """One phrase and one note at a time, bisecting each context's cdf row"""
+    interval_rows = model.interval_cdf.tolist()
+    start = (INTERVAL_STATES,) * (model.order - 1)
+    sampled = []
+    for _ in range(phrases):
+        context = start
+        phrase = []
+        for _ in range(length):
+            row = interval_rows
+            for state in context:
+                row = row[state]
+            state = min(bisect.bisect_right(row, rng.random()), INTERVAL_STATES - 1)
+            phrase.append(state - MAX_INTERVAL)
+            context = context[1:] + (state,)
+        sampled.append(phrase)
+    return sampled
+
+
+def interval_histogram(intervals):
+    counts = np.bincount(np.asarray(intervals).ravel() + MAX_INTERVAL, minlength=INTERVAL_STATES)
+    return counts / counts.sum()
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--phrases', type=int, default=10000)
+    parser.add_argument('--length', type=int, default=16)
+    parser.add_argument('--order', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=100, help="Repeat the corpus phrases this many times")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    files = list(iter_corpus_files(MIDI_ROOT_DIR))
+    phrases, extract = best_of(lambda: melody_phrase_batch(files), args.repeat)
+    model, count = best_of(lambda: MelodyModel.train(phrases, args.order), args.repeat)
+    print(f"🧠 {len(files)} files: {len(phrases)} phrases, {model.notes} notes;"
+          f" extract {extract * 1e3:.1f} ms, count {count * 1e3:.2f} ms")
+    scaled, scaled_count = best_of(lambda: MelodyModel.train(phrases * args.scale, args.order), args.repeat)
+    print(f"   x{args.scale} phrases: {scaled.notes} notes counted in {scaled_count * 1e3:.1f} ms"
+          f" ({scaled.notes / scaled_count / 1e6:.1f}M notes/s)")
+
+    path = os.path.join(tempfile.mkdtemp(), 'melody_model.npz')
+    model.save(path)
+    loaded, load = best_of(lambda: MelodyModel.load(path), args.repeat)
+    print(f"   saved {os.path.getsize(path) / 1024:.0f} KB, load {load * 1e3:.2f} ms,"
+          f" fingerprint {'same' if loaded.fingerprint == model.fingerprint else 'DIFFERENT'}")
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    rng = np.random.default_rng(0)
+    (intervals, _), vectorized = best_of(lambda: model.sample(rng, args.phrases, args.length), args.repeat)
+    py_rng = random.Random(0)
+    looped, loop = best_of(lambda: loop_sample(model, py_rng, args.phrases, args.length), 1)
+
+    trained = interval_histogram(np.concatenate([states for states, _ in phrases]) - MAX_INTERVAL)
+    print(f"🎲 {args.phrases} phrases x {args.length} notes:")
+    for name, elapsed, sampled in (('per-note loop', loop, looped), ('vectorized', vectorized, intervals)):
+        distance = 0.5 * np.abs(interval_histogram(sampled) - trained).sum()
+        print(f"{name:>15} {elapsed * 1e3:>9.1f} ms {args.phrases * args.length / elapsed / 1e6:>6.2f}M notes/s"
+              f"   interval TV distance {distance:.3f}")
+    print(f"   speedup {loop / vectorized:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Compare the native SMF writer against midiutil.
+
+For every genre, vibe, tempo and catchiness combination (and a few seeds)
+the song is composed once, then serialized both through midiutil's
+MIDIFile and through midi_writer.encode_midi. The bytes must be identical;
+the script exits non-zero on the first mismatch and reports the time each
+writer spent per song.
+
+    python benchmarks/bench_midi_writer.py [--seeds 3] [--sections 8 64]
+"""
+import argparse
+import io
+import itertools
+import os
+import sys
+import time
+
+from midiutil import MIDIFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import (CHORD_PROGRESSIONS, MELODY_PATTERNS, TEMPO_RANGES, TRACK_NAMES,  # noqa: E402
+                      ViralMusicGenerator)
+from midi_writer import encode_midi  # noqa: E402
+from note_engine import NoteTable  # noqa: E402
+
+
+def midiutil_bytes(notes, tempo):
+    """Serialize the way gen_song did before the native writer"""
+    midi_file = MIDIFile(len(TRACK_NAMES))
+    midi_file.addTrackName(0, 0, TRACK_NAMES[0])
+    midi_file.addTempo(0, 0, tempo)
+    for track, name in enumerate(TRACK_NAMES[1:], start=1):
+        midi_file.addTrackName(track, 0, name)
+    notes.add_to(midi_file)
+    buffer = io.BytesIO()
+    midi_file.writeFile(buffer)
+    return buffer.getvalue()
+
+
+def overlapping_notes():
+    """Edge cases midiutil rewrites: overlaps, duplicates and long rests"""
+    return NoteTable.concat([
+        NoteTable.block(0, 0, [60, 60, 64, 62], [0.0, 0.5, 0.5, 40.0], [2.0, 1.0, 0.25, 1.0], [90, 80, 70, 60]),
+        NoteTable.block(1, 1, [48, 48], [0.0, 0.0], [1.0, 1.0], [100, 50]),
+        NoteTable.block(3, 9, [36, 42], [0.0, 3000.0], [0.25, 0.125], 110),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--sections', type=int, nargs='+', default=[8, 64])
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    cases = []
+    for genre, vibe, tempo_category, catchiness, seed, sections in itertools.product(
+            CHORD_PROGRESSIONS, MELODY_PATTERNS, TEMPO_RANGES, (3, 6, 9), range(args.seeds), args.sections):
+        elements = generator.parse_text_prompt(f"{genre} {vibe}", seed=seed)
+        elements.update(tempo_category=tempo_category, catchiness=catchiness,
+                        structure=['verse'] * sections)
+        cases.append(generator.compose(elements)[1:])
+    cases.append((97, overlapping_notes()))
+
+    timings = {'midiutil': 0.0, 'native': 0.0}
+    for tempo, notes in cases:
+        started = time.perf_counter()
+        expected = midiutil_bytes(notes, tempo)
+        timings['midiutil'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = encode_midi(notes, tempo, TRACK_NAMES)
+        timings['native'] += time.perf_counter() - started
+
+        if actual != expected:
+            print(f"❌ Output differs from midiutil ({len(notes)} notes, tempo {tempo})")
+            return 1
+
+    print(f"✅ {len(cases)} songs byte-identical to midiutil")
+    for name, elapsed in timings.items():
+        print(f"{name:>9}: {elapsed / len(cases) * 1000:8.3f} ms/song")
+    print(f"  speedup: {timings['midiutil'] / timings['native']:8.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
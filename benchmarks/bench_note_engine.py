@@ -0,0 +1,159 @@
+"""Compare per-note track generation against the columnar NoteTable engine.
+
+Counts Python-level operations (traced line events) and wall time for
+generating every track of a song at growing structure lengths. The legacy
+functions below reproduce the per-note addNote loops the generators used
+before the NoteTable engine, writing into a recorder instead of a MIDIFile.
+
+    python benchmarks/bench_note_engine.py [--sections 8 64 512]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import CHORD_PROGRESSIONS, MELODY_PATTERNS, ViralMusicGenerator, track_rng  # noqa: E402
+
+HARMONY_MAP = {
+    'C': [60, 64, 67], 'G': [67, 71, 74], 'Am': [57, 60, 64], 'F': [65, 69, 72],
+    'Dm': [62, 65, 69], 'Em': [64, 67, 71], 'D': [62, 66, 69], 'E': [64, 68, 71],
+}
+ROOT_MAP = {'C': 36, 'G': 43, 'Am': 33, 'F': 41, 'Dm': 38, 'Em': 40, 'D': 38, 'E': 40}
+
+
+class NoteRecorder:
+    """Stand-in for MIDIFile that just collects addNote calls"""
+
+    def __init__(self):
+        self.notes = []
+
+    def addNote(self, track, channel, pitch, time, duration, volume):
+        self.notes.append((track, channel, pitch, time, duration, volume))
+
+
+def legacy_melody(midi_file, elements, track, rng):
+    time_ = 0
+    pattern = MELODY_PATTERNS[elements['vibe']][0]
+    pattern = pattern + pattern[:3] + pattern
+    for section in range(len(elements['structure'])):
+        pitch = 60 + (section % 3) * 2
+        for rep in range(2):
+            for interval in pattern:
+                pitch = max(48, min(84, pitch + int(interval)))
+                duration = float(rng.choice([0.5, 1.0, 1.5, 2.0]))
+                velocity = int(rng.integers(85, 106))
+                midi_file.addNote(track, 0, pitch, time_, duration, velocity)
+                time_ += duration
+
+
+def legacy_harmony(midi_file, elements, track):
+    time_ = 0
+    for section in range(len(elements['structure'])):
+        for chord_name in elements['chord_progression']:
+            clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').strip()
+            for i, pitch in enumerate(HARMONY_MAP.get(clean, [60, 64, 67])):
+                midi_file.addNote(track, 1, pitch, time_, 2.0, 70 + elements['catchiness'] * 2)
+            time_ += 2.0
+
+
+def legacy_bass(midi_file, elements, track):
+    time_ = 0
+    for section in range(len(elements['structure'])):
+        for chord_name in elements['chord_progression']:
+            clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').strip()
+            root = ROOT_MAP.get(clean, 36)
+            for i, (pitch, duration) in enumerate(zip([root, root, root + 7, root], [0.5] * 4)):
+                midi_file.addNote(track, 2, pitch, time_ + i * duration, duration, 90 + elements['catchiness'])
+            time_ += 2.0
+
+
+def legacy_drums(midi_file, elements, track):
+    time_ = 0
+    for bar in range(len(elements['structure']) * 4):
+        for beat in range(16):
+            beat_time = time_ + beat * 0.25
+            if beat % 8 == 0 or beat % 8 == 6:
+                midi_file.addNote(track, 9, 36, beat_time, 0.25, 100)
+            if beat % 8 == 4:
+                midi_file.addNote(track, 9, 38, beat_time, 0.25, 90)
+            if beat % 2 == 1:
+                midi_file.addNote(track, 9, 42, beat_time, 0.125, 60)
+        time_ += 4.0
+
+
+def legacy_song(elements):
+    recorder = NoteRecorder()
+    legacy_melody(recorder, elements, 0, track_rng(1, 'melody'))
+    legacy_harmony(recorder, elements, 1)
+    legacy_bass(recorder, elements, 2)
+    legacy_drums(recorder, elements, 3)
+    return len(recorder.notes)
+
+
+def vectorized_song(generator, elements):
+    tables = [
+        generator.generate_enhanced_melody(elements, 0, 1),
+        generator.generate_enhanced_harmony(elements, 1),
+        generator.generate_enhanced_bass(elements, 2),
+        generator.generate_enhanced_drums(elements, 3),
+    ]
+    return sum(len(table) for table in tables)
+
+
+def count_operations(fn):
+    """Run fn under a line tracer and return (result, Python line events)"""
+    counter = [0]
+
+    def tracer(frame, event, arg):
+        if event == 'line':
+            counter[0] += 1
+        return tracer
+
+    sys.settrace(tracer)
+    try:
+        result = fn()
+    finally:
+        sys.settrace(None)
+    return result, counter[0]
+
+
+def best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[8, 64, 512])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    print(f"{'sections':>8} {'notes':>8} {'legacy ops':>12} {'table ops':>10} {'ops ratio':>9}"
+          f" {'legacy ms':>10} {'table ms':>9} {'speedup':>8}")
+    for sections in args.sections:
+        elements = {
+            'genre': 'pop', 'vibe': 'catchy', 'tempo_category': 'medium', 'catchiness': 9, 'key': 'C',
+            'chord_progression': CHORD_PROGRESSIONS['pop'][0], 'structure': ['verse'] * sections,
+        }
+        legacy_notes, legacy_ops = count_operations(lambda: legacy_song(elements))
+        table_notes, table_ops = count_operations(lambda: vectorized_song(generator, elements))
+        assert legacy_notes == table_notes, (legacy_notes, table_notes)
+
+        legacy_time = best_time(lambda: legacy_song(elements), args.repeats)
+        table_time = best_time(lambda: vectorized_song(generator, elements), args.repeats)
+        print(f"{sections:>8} {table_notes:>8} {legacy_ops:>12} {table_ops:>10} {legacy_ops / table_ops:>8.1f}x"
+              f" {legacy_time * 1e3:>10.2f} {table_time * 1e3:>9.2f} {legacy_time / table_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    np.seterr(all='raise')
+    main()
@@ -0,0 +1,96 @@
+"""Compare the compiled prompt matcher against the old keyword scans.
+
+The corpus is every sentence of a JSONL file of requests (title and body
+fields, default requests.jsonl) plus synthetic prompts mixing keywords from
+every element, repeated to the requested size. Reports prompts/sec for the
+legacy per-dict substring scans, the single-regex matcher without its cache,
+and the cached matcher on a corpus with repeats, plus how often legacy and
+compiled results agree (they differ only where a keyword matched inside a
+longer word, e.g. 'fun' in 'funky').
+
+    python benchmarks/bench_prompt_matcher.py [--corpus requests.jsonl] [--prompts 50000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import PROMPT_KEYWORDS, match_prompt  # noqa: E402
+
+
+def legacy_match(prompt):
+    """The per-call substring scans parse_text_prompt used to run"""
+    prompt_lower = prompt.lower()
+    found = {}
+    keywords = {element: {value: list(words) for value, words in values.items()}
+                for element, values in PROMPT_KEYWORDS.items()}
+    for element, values in keywords.items():
+        for value, words in values.items():
+            if any(word in prompt_lower for word in words):
+                found[element] = value
+                break
+    return tuple(sorted(found.items()))
+
+
+def load_corpus(path, size, seed=0):
+    rng = random.Random(seed)
+    sentences = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    request = json.loads(line)
+                    text = f"{request.get('title', '')}. {request.get('body', '')}"
+                    sentences.extend(part.strip() for part in re.split(r'[.!?\n]', text) if part.strip())
+
+    words = [word for values in PROMPT_KEYWORDS.values() for group in values.values() for word in group]
+    filler = ['song', 'track', 'for', 'a', 'with', 'and', 'party', 'night', 'summer', 'tune', 'beat']
+    prompts = []
+    while len(prompts) < size:
+        if sentences and rng.random() < 0.5:
+            prompts.append(f"{rng.choice(sentences)} #{len(prompts)}")
+        else:
+            picked = rng.sample(words, 3) + rng.sample(filler, 4)
+            rng.shuffle(picked)
+            prompts.append(' '.join(picked) + f" #{len(prompts)}")
+    return prompts
+
+
+def timed(fn, prompts):
+    started = time.perf_counter()
+    results = [fn(prompt) for prompt in prompts]
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'requests.jsonl'))
+    parser.add_argument('--prompts', type=int, default=50000)
+    args = parser.parse_args()
+
+    prompts = load_corpus(args.corpus, args.prompts)
+    legacy, legacy_elapsed = timed(legacy_match, prompts)
+    compiled, compiled_elapsed = timed(match_prompt.__wrapped__, prompts)
+
+    # Live traffic repeats itself: replay a small pool of distinct prompts
+    match_prompt.cache_clear()
+    pool, rng = prompts[:1000], random.Random(1)
+    repeated = [rng.choice(pool) for _ in prompts]
+    _, cached_elapsed = timed(match_prompt, repeated)
+
+    agree = sum(a == b for a, b in zip(legacy, compiled))
+    print(f"📚 {len(prompts)} prompts, {agree / len(prompts):.1%} identical to the legacy scans")
+    for name, elapsed in (('legacy', legacy_elapsed), ('compiled', compiled_elapsed), ('cached', cached_elapsed)):
+        print(f"{name:>9}: {len(prompts) / elapsed:12,.0f} prompts/s  {elapsed / len(prompts) * 1e6:7.2f} µs/prompt")
+    print(f"  cache: {match_prompt.cache_info()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Time bulk rhythm sampling against a per-note duration choice, and check tick exactness.
+
+Draws --sections x --notes melody durations for every rhythm pattern, once
+with rng.choice per note and once with sample_durations, then renders a
+song per genre, vibe and rhythm and checks that every note start and
+duration is a whole number of MIDI ticks, so writing it truncates nothing.
+
+    python benchmarks/bench_rhythm.py [--sections 10000] [--notes 32]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from gen_song import CHORD_PROGRESSIONS, MELODY_PATTERNS, RHYTHM_PATTERNS, ViralMusicGenerator  # noqa: E402
+from midi_writer import TICKS_PER_BEAT  # noqa: E402
+from rhythm_engine import compile_rhythm, sample_durations  # noqa: E402
+
+
+def per_note(pattern, rng, sections, notes):
+    durations = np.empty((sections, notes))
+    for row in range(sections):
+        for column in range(notes):
+            durations[row, column] = rng.choice(pattern)
+    return durations
+
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=10000)
+    parser.add_argument('--notes', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{args.sections} x {args.notes} durations per rhythm, best of {args.repeat}")
+    for name, patterns in RHYTHM_PATTERNS.items():
+        rhythm = compile_rhythm(patterns[0])
+        loop = best_of(1, lambda: per_note(patterns[0], rng, args.sections, args.notes))
+        bulk = best_of(args.repeat, lambda: sample_durations(rhythm, rng, args.sections, args.notes))
+        print(f"{name:>11}  per note {loop * 1e3:>8.1f} ms   bulk {bulk * 1e3:>6.2f} ms   {loop / bulk:>6.0f}x")
+
+    generator = ViralMusicGenerator()
+    songs = inexact = 0
+    for genre in CHORD_PROGRESSIONS:
+        for vibe in MELODY_PATTERNS:
+            for rhythm in (None, *RHYTHM_PATTERNS):
+                elements = generator.parse_text_prompt(f"{genre} {vibe}", seed=songs)
+                elements['rhythm'] = rhythm
+                _, _, notes = generator.compose(elements)
+                for times in (notes.start, notes.duration):
+                    ticks = times * TICKS_PER_BEAT
+                    inexact += int(np.count_nonzero(ticks != np.round(ticks)))
+                songs += 1
+    print(f"{'✅' if not inexact else '❌'} {songs} songs, {inexact} note times off the {TICKS_PER_BEAT} tick grid")
+    return 1 if inexact else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
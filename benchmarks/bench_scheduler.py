@@ -0,0 +1,180 @@
+"""Load test the song scheduler: interactive latency while a bulk job of --bulk songs runs.
+
+Interactive requests arrive at --rate per second (open loop, one tenant)
+first on an idle scheduler, then while a catalog tenant's --bulk songs are
+queued at bulk priority all at once. Every second of the bulk run prints
+the bulk queue depth, songs done, and interactive latency and queue wait
+as the scheduler's metrics report them. Alongside, a tenant queues bulk
+jobs and cancels them, and another queues jobs with a deadline too short
+to meet; both must end up counted and never rendered. For comparison, the
+same interactive load runs on one FIFO queue behind --fifo-bulk bulk songs.
+Passes if the interactive p99 during the bulk job stays within --max-ratio
+of the idle p99 (plus a millisecond of timer noise).
+
+    python benchmarks/bench_scheduler.py [--bulk 10000] [--rate 20] [--workers 2] [--fifo-bulk 2000]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import CHORD_PROGRESSIONS, MELODY_PATTERNS  # noqa: E402
+from parallel import percentile  # noqa: E402
+from song_scheduler import DeadlineExceeded, SongScheduler  # noqa: E402
+
+PROMPTS = [f"{vibe} {genre} song" for genre in CHORD_PROGRESSIONS for vibe in MELODY_PATTERNS]
+SUBMIT_CHUNK = 500          # Bulk jobs queued between yields to the event loop
+
+
+def spec(index):
+    return {'prompt': PROMPTS[index % len(PROMPTS)], 'seed': index}
+
+
+class Interactive:
+    """Open-loop interactive requests at a fixed rate, with their latencies in ms"""
+
+    def __init__(self, scheduler, rate, priority='interactive', tenant='app'):
+        self.scheduler = scheduler
+        self.interval = 1.0 / rate
+        self.priority = priority
+        self.tenant = tenant
+        self.latencies = []
+        self.tasks = set()
+
+    async def request(self, index):
+        started = time.perf_counter()
+        result = await self.scheduler.generate(spec(index), self.priority, self.tenant)
+        if result['status'] == 'ok':
+            self.latencies.append((time.perf_counter() - started) * 1000.0)
+
+    async def run(self, until):
+        index = 0
+        next_at = time.perf_counter()
+        while not until():
+            task = asyncio.create_task(self.request(1_000_000 + index))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            index += 1
+            next_at += self.interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        await asyncio.gather(*self.tasks)
+
+
+async def submit_bulk(scheduler, count, tenant='catalog', priority='bulk', timeout=None):
+    jobs = []
+    for first in range(0, count, SUBMIT_CHUNK):
+        jobs.extend(scheduler.submit(spec(index), priority, tenant, timeout)
+                    for index in range(first, min(count, first + SUBMIT_CHUNK)))
+        await asyncio.sleep(0)
+    return jobs
+
+
+def p99(values):
+    return percentile(sorted(values), 0.99)
+
+
+async def idle_phase(args):
+    scheduler = SongScheduler(workers=args.workers)
+    await scheduler.start()
+    interactive = Interactive(scheduler, args.rate)
+    deadline = time.perf_counter() + args.idle_seconds
+    await interactive.run(lambda: time.perf_counter() >= deadline)
+    await scheduler.close()
+    return interactive.latencies
+
+
+async def bulk_phase(args, report):
+    scheduler = SongScheduler(workers=args.workers, tenant_limits={'cancelled': 1, 'late': 1})
+    await scheduler.start()
+    interactive = Interactive(scheduler, args.rate)
+    started = time.perf_counter()
+    jobs = await submit_bulk(scheduler, args.bulk)
+    cancelled = await submit_bulk(scheduler, 500, tenant='cancelled')
+    for job in cancelled:
+        scheduler.cancel(job)
+    late = await submit_bulk(scheduler, 50, tenant='late', priority='standard', timeout=0.001)
+    finished = asyncio.gather(*(job.future for job in jobs))
+    client = asyncio.create_task(interactive.run(finished.done))
+
+    seen = 0
+    while not finished.done():
+        await asyncio.sleep(1.0)
+        metrics = scheduler.metrics()['classes']
+        window = interactive.latencies[seen:]
+        seen = len(interactive.latencies)
+        report(time.perf_counter() - started, metrics, window)
+    await client
+    elapsed = time.perf_counter() - started
+    results = await finished
+    expired = sum(isinstance(job.future.exception(), DeadlineExceeded) for job in late)
+    metrics = scheduler.metrics()
+    await scheduler.close()
+    return interactive.latencies, elapsed, sum(result['status'] == 'ok' for result in results), expired, metrics
+
+
+async def fifo_phase(args):
+    # Everything in one class and one tenant's queue: interactive requests wait behind the backlog
+    scheduler = SongScheduler(workers=args.workers, reserved=0)
+    await scheduler.start()
+    interactive = Interactive(scheduler, args.rate, priority='bulk', tenant='catalog')
+    jobs = await submit_bulk(scheduler, args.fifo_bulk)
+    finished = asyncio.gather(*(job.future for job in jobs))
+    await interactive.run(finished.done)
+    await finished
+    await scheduler.close()
+    return interactive.latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bulk', type=int, default=10000)
+    parser.add_argument('--rate', type=float, default=20.0, help="Interactive requests per second")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--fifo-bulk', type=int, default=2000, help="Bulk songs for the FIFO comparison (0 skips it)")
+    parser.add_argument('--max-ratio', type=float, default=3.0)
+    args = parser.parse_args()
+
+    def report(elapsed, metrics, window):
+        bulk, fast = metrics['bulk'], metrics['interactive']
+        print(f"{elapsed:>6.1f}s {bulk['queue_depth']:>10} {bulk['completed']:>9} {bulk['wait_ms']['p99']:>12.0f}"
+              f" {len(window):>8} {p99(window):>14.1f} {fast['wait_ms']['p99']:>14.1f}", file=sys.__stdout__)
+
+    print(f"⏱️  idle: {args.rate:g} interactive requests/s for {args.idle_seconds:g}s on {args.workers} workers")
+    with contextlib.redirect_stdout(io.StringIO()):
+        idle = asyncio.run(idle_phase(args))
+    print(f"   interactive p50 {percentile(sorted(idle), 0.5):.1f} ms, p99 {p99(idle):.1f} ms ({len(idle)} requests)")
+
+    print(f"📦 bulk: {args.bulk} songs queued at once alongside the same interactive load")
+    print(f"{'time':>7} {'bulk queue':>10} {'bulk done':>9} {'bulk wait p99':>12} {'requests':>8}"
+          f" {'interactive p99':>14} {'its wait p99':>14}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        busy, elapsed, done, expired, metrics = asyncio.run(bulk_phase(args, report))
+    classes = metrics['classes']
+    print(f"   {done} bulk songs in {elapsed:.1f}s ({done / elapsed:.0f}/s);"
+          f" interactive p50 {percentile(sorted(busy), 0.5):.1f} ms, p99 {p99(busy):.1f} ms ({len(busy)} requests)")
+    print(f"   cancelled while queued: {classes['bulk']['cancelled']} of 500;"
+          f" past their deadline: {expired} of 50; bulk jobs rendered {classes['bulk']['dispatched']}")
+
+    if args.fifo_bulk:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fifo = asyncio.run(fifo_phase(args))
+        print(f"🚫 one FIFO queue behind {args.fifo_bulk} bulk songs: interactive p50"
+              f" {percentile(sorted(fifo), 0.5):.0f} ms, p99 {p99(fifo):.0f} ms")
+
+    steady = p99(busy) <= args.max_ratio * p99(idle) + 1.0
+    counted = classes['bulk']['cancelled'] == 500 and expired == 50 and classes['bulk']['dispatched'] == args.bulk
+    ok = steady and counted and done == args.bulk
+    print(f"{'✅' if ok else '❌'} interactive p99 {p99(busy):.1f} ms during the bulk job vs {p99(idle):.1f} ms idle"
+          f" ({p99(busy) / p99(idle):.1f}x, limit {args.max_ratio:g}x); cancellations and deadlines"
+          f" {'all' if counted else 'NOT all'} accounted for")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Time song composition as the structure grows.
+
+Each song repeats the standard intro/verse/chorus/bridge/outro structure
+until it has the requested number of sections. 'cold' composes with an
+empty section cache. 'warm' composes the same song again, so every block
+is reused. 'unique' gives every section its own type, which is the worst
+case with no reuse. Blocks counts the section libraries (one per track,
+holding a block per section type) each run had to render. Last, a song
+with an empty structure must compose to no notes rather than fail.
+
+    python benchmarks/bench_sections.py [--sections 8 64 512 4096]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import ViralMusicGenerator  # noqa: E402
+
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+
+
+def timed_compose(generator, elements):
+    misses = generator.section_cache.misses
+    started = time.perf_counter()
+    _, _, notes = generator.compose(elements)
+    return time.perf_counter() - started, len(notes), generator.section_cache.misses - misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[8, 64, 512, 4096])
+    args = parser.parse_args()
+
+    print(f"{'sections':>8} {'notes':>8} {'cold ms':>9} {'blocks':>6} {'warm ms':>9} {'blocks':>6}"
+          f" {'unique ms':>10} {'blocks':>6} {'warm µs/section':>16}")
+    for sections in args.sections:
+        elements = ViralMusicGenerator().parse_text_prompt("catchy happy pop hit", seed=7)
+        elements['structure'] = (STRUCTURE * (sections // len(STRUCTURE) + 1))[:sections]
+
+        generator = ViralMusicGenerator()
+        cold, notes, cold_blocks = timed_compose(generator, elements)
+        warm, _, warm_blocks = timed_compose(generator, elements)
+
+        unique_elements = dict(elements, structure=[f"section{index}" for index in range(sections)])
+        unique, _, unique_blocks = timed_compose(ViralMusicGenerator(), unique_elements)
+
+        print(f"{sections:>8} {notes:>8} {cold * 1e3:>9.2f} {cold_blocks:>6} {warm * 1e3:>9.2f} {warm_blocks:>6}"
+              f" {unique * 1e3:>10.2f} {unique_blocks:>6} {warm / sections * 1e6:>16.2f}")
+
+    elements = dict(ViralMusicGenerator().parse_text_prompt("catchy happy pop hit", seed=7), structure=[])
+    try:
+        _, notes, _ = timed_compose(ViralMusicGenerator(), elements)
+        outcome = f"{notes} notes"
+    except Exception as e:
+        notes, outcome = None, f"{type(e).__name__}: {e}"
+    ok = notes == 0
+    print(f"{'✅' if ok else '❌'} empty structure: {outcome}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Measure worker memory with attached (memory-mapped) learned tables against per-worker copies.
+
+A synthetic corpus of --files files is written as a feature store, and a
+random order --order melody model is saved as .npz and published to a
+directory. For each worker count, that many processes are started (spawn,
+so nothing is inherited from this one) in three modes:
+
+    empty     imports only, the baseline every worker pays
+    copied    learned patterns as Counters and the .npz model, what each
+              worker held before: its own copy of every table
+    attached  init_pattern_worker's memory-mapped store and MelodyModel.load
+              of the published directory
+
+Every worker renders --songs songs from the patterns, samples the model,
+then reads every table page, and reports /proc/self/smaps_rollup while all
+workers of its run are alive. The tables' share is the workers' total PSS
+(proportional set size: shared pages split between the processes mapping
+them) less the empty workers'; attached it should stay flat as workers grow.
+
+    python benchmarks/bench_shared_tables.py [--files 100000] [--workers 1 2 4 8] [--order 4]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from feature_store import FeatureStoreBuilder  # noqa: E402
+from melody_model import DURATION_GRID, INTERVAL_STATES, MelodyModel  # noqa: E402
+
+GENRES = ('Pop', 'Rock', 'Jazz', 'Blues', 'Electronic', 'Ambient')
+CHORDS = ('C', 'Dm', 'Em', 'F', 'G', 'Am', 'Bdim', 'D', 'E', 'A', 'Bb', 'Eb')
+PITCHES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+MODES = ('empty', 'copied', 'attached')
+MEMORY_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+
+def synthetic_features(files, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(files):
+        yield {
+            'genre': GENRES[rng.integers(len(GENRES))],
+            'key': f"{PITCHES[rng.integers(12)]} {('major', 'minor')[rng.integers(2)]}",
+            'tempo': round(float(rng.uniform(70, 170)), 1),
+            'stats': {'note_density': float(rng.uniform(1, 8)), 'pitch_range': float(rng.integers(12, 36)),
+                      'repetition': float(rng.random()), 'velocity': float(rng.uniform(60, 110))},
+            'progressions': {tuple(CHORDS[index] for index in rng.integers(len(CHORDS), size=4)): int(count)
+                             for count in rng.integers(1, 6, size=6)},
+            'melody_patterns': {tuple(int(step) for step in rng.integers(-7, 8, size=4)): int(count)
+                                for count in rng.integers(1, 9, size=8)},
+            'rhythm_patterns': {tuple(float(beats) for beats in rng.choice(DURATION_GRID[:4], size=4)): 1},
+            'structure': ('intro', 'verse', 'chorus', 'verse', 'chorus', 'outro'),
+            'hooks': [tuple(int(step) for step in rng.integers(-5, 6, size=3)) for _ in range(2)],
+        }
+
+
+def memory():
+    """This process's smaps_rollup totals in bytes"""
+    totals = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in MEMORY_FIELDS:
+                totals[name] = int(rest.split()[0]) * 1024
+    return totals
+
+
+def touch(array):
+    """Read every page of an array"""
+    flat = np.asarray(array).reshape(-1).view(np.uint8)
+    return int(flat[::4096].sum()) if flat.shape[0] else 0
+
+
+def worker(mode, store_dir, model_npz, model_dir, songs, output_dir, ready, done, results):
+    import gen_song
+    from melody_model import MelodyModel
+
+    if mode == 'copied':
+        from feature_store import FeatureStore
+        store = FeatureStore(store_dir)
+        patterns = {name: Counter(dict(table.most_common())) if hasattr(table, 'most_common') else table
+                    for name, table in store.patterns().items()}
+        patterns['optimal_tempos'] = np.array(patterns['optimal_tempos'])
+        store.arrays.clear()
+        del store
+        gen_song._worker_patterns = patterns
+        model = MelodyModel.load(model_npz)
+    elif mode == 'attached':
+        gen_song.init_pattern_worker(store_dir)
+        model = MelodyModel.load(model_dir)
+
+    if mode != 'empty':
+        gen_song.render_pattern_chunk(range(songs), output_dir)
+        model.sample(np.random.default_rng(0), 64, 16)
+        tables = [model.interval_counts, model.duration_counts, model.interval_cdf, model.duration_cdf]
+        patterns = gen_song._worker_patterns
+        if mode == 'attached':
+            for table in patterns.values():
+                if hasattr(table, 'most_common'):
+                    len(table)
+            store = patterns['chord_progressions'].store
+            tables.extend(store.arrays.values())
+            tables.append(store.strings)
+        else:
+            tables.append(patterns['optimal_tempos'])
+        for table in tables:
+            touch(table)
+
+    ready.wait()
+    results.put(memory())
+    done.wait()
+
+
+def run(context, mode, workers, args, paths):
+    ready, done = context.Barrier(workers), context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, *paths, args.songs, paths[0] + '.songs', ready, done,
+                                                      results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    done.wait()
+    for process in processes:
+        process.join()
+    return {field: sum(memory.get(field, 0) for memory in measured) for field in MEMORY_FIELDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100_000)
+    parser.add_argument('--order', type=int, default=4, help="Melody model order (tables grow 26x per order)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--songs', type=int, default=4, help="Songs each worker renders from the patterns")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    store_dir = os.path.join(scratch, 'feature_store')
+    builder = FeatureStoreBuilder()
+    for features in synthetic_features(args.files):
+        builder.add(features)
+    builder.write(store_dir)
+    del builder
+
+    rng = np.random.default_rng(1)
+    model = MelodyModel(rng.integers(0, 4, size=(INTERVAL_STATES + 1,) * (args.order - 1) + (INTERVAL_STATES,))
+                        .astype(np.float64),
+                        rng.integers(0, 4, size=(DURATION_GRID.shape[0] + 1,) * (args.order - 1)
+                                     + (DURATION_GRID.shape[0],)).astype(np.float64))
+    model_npz, model_dir = os.path.join(scratch, 'melody_model.npz'), os.path.join(scratch, 'melody_model')
+    model.save(model_npz)
+    model.publish(model_dir)
+    del model
+
+    size = sum(entry.stat().st_size for directory in (store_dir, model_dir) for entry in os.scandir(directory))
+    print(f"📦 {args.files} files and an order-{args.order} melody model: {size / 2**20:.1f} MB of tables on disk")
+    print(f"{'workers':>8} {'mode':>9} {'RSS/worker':>11} {'PSS total':>10} {'private':>9} {'tables PSS':>11}")
+
+    context = multiprocessing.get_context('spawn')
+    paths = (store_dir, model_npz, model_dir)
+    tables = {mode: [] for mode in MODES[1:]}
+    for workers in args.workers:
+        totals = {mode: run(context, mode, workers, args, paths) for mode in MODES}
+        for mode in MODES:
+            total = totals[mode]
+            share = total['Pss'] - totals['empty']['Pss']
+            if mode != 'empty':
+                tables[mode].append(share)
+            private = total['Private_Clean'] + total['Private_Dirty']
+            print(f"{workers:>8} {mode:>9} {total['Rss'] / workers / 2**20:>9.1f}MB {total['Pss'] / 2**20:>8.1f}MB"
+                  f" {private / 2**20:>7.1f}MB {share / 2**20 if mode != 'empty' else 0:>9.1f}MB")
+    shutil.rmtree(scratch)
+
+    growth = {mode: shares[-1] / max(shares[0], 1) for mode, shares in tables.items()}
+    flat = growth['attached'] < 1.5
+    print(f"{'✅' if flat else '❌'} from {args.workers[0]} to {args.workers[-1]} workers the tables' memory grew"
+          f" {growth['attached']:.2f}x attached, {growth['copied']:.2f}x copied")
+    return 0 if flat else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
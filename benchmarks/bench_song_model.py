@@ -0,0 +1,102 @@
+"""Measure the memory of 100k song specs held at once, and of note track variations.
+
+Specs are built from JSONL lines the way batch workers build them
+(spec_to_elements), half from prompts and half with element overrides, and
+held in a list; the same specs as the dicts spec_to_elements used to
+return (a new structure list each) are measured for comparison. Note
+tracks: --variations velocity variations of one long melody, made with
+NoteTrack.replace (sharing the other columns) against full copies, and
+how fast tracks hash.
+
+    python benchmarks/bench_song_model.py [--specs 100000] [--variations 1000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from gen_song import ViralMusicGenerator, spec_to_elements  # noqa: E402
+from note_engine import NoteTrack  # noqa: E402
+
+PROMPTS = ["upbeat pop song for summer", "sad slow jazz in A minor", "energetic rock anthem", "smooth electronic"]
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+
+
+def spec_lines(count):
+    for index in range(count):
+        if index % 2:
+            yield json.dumps({'elements': {'genre': 'rock', 'key': 'G', 'catchiness': 8, 'structure': STRUCTURE,
+                                           'chord_progression': ['G', 'C', 'D', 'G']}, 'seed': index})
+        else:
+            yield json.dumps({'prompt': PROMPTS[index % len(PROMPTS)], 'seed': index})
+
+
+def held(build):
+    """(objects, traced bytes they hold, seconds to build them)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    objects = build()
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, size, elapsed
+
+
+def legacy_dict(spec):
+    elements = spec.to_dict()
+    elements['structure'] = list(elements['structure'])
+    return elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--specs', type=int, default=100_000)
+    parser.add_argument('--variations', type=int, default=1000)
+    parser.add_argument('--sections', type=int, default=64, help="Sections in the melody the variations share")
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    lines = list(spec_lines(args.specs))
+    specs, spec_bytes, spec_time = held(lambda: [spec_to_elements(generator, json.loads(line)) for line in lines])
+    dicts, dict_bytes, _ = held(lambda: [legacy_dict(spec) for spec in specs])
+    print(f"{args.specs} specs held at once")
+    print(f"{'SongSpec':>14} {spec_bytes / 2**20:>8.1f} MB {spec_bytes / args.specs:>6.0f} B/spec"
+          f"   built at {args.specs / spec_time:,.0f} specs/s")
+    print(f"{'dicts':>14} {dict_bytes / 2**20:>8.1f} MB {dict_bytes / args.specs:>6.0f} B/spec"
+          f"   {dict_bytes / spec_bytes:.1f}x the memory")
+    del specs, dicts
+
+    elements = generator.parse_text_prompt("catchy pop hit", seed=1)
+    elements['structure'] = (STRUCTURE * (args.sections // len(STRUCTURE) + 1))[:args.sections]
+    melody = generator.compose_tracks(elements)[2][0]
+    rng = np.random.default_rng(0)
+    louder = [rng.integers(60, 127, size=len(melody)) for _ in range(args.variations)]
+    shared, shared_bytes, shared_time = held(lambda: [melody.replace(velocity=velocity) for velocity in louder])
+    copies, copy_bytes, copy_time = held(lambda: [NoteTrack(melody.channel, melody.pitch.copy(), melody.start.copy(),
+                                                            melody.duration.copy(), velocity)
+                                                  for velocity in louder])
+    print(f"{args.variations} velocity variations of a {len(melody)} note melody")
+    print(f"{'replace':>14} {shared_bytes / 2**20:>8.2f} MB {shared_time * 1e6 / args.variations:>6.1f} µs each")
+    print(f"{'full copies':>14} {copy_bytes / 2**20:>8.2f} MB {copy_time * 1e6 / args.variations:>6.1f} µs each"
+          f"   {copy_bytes / shared_bytes:.1f}x the memory")
+
+    started = time.perf_counter()
+    distinct = len(set(shared))
+    per_hash = (time.perf_counter() - started) / len(shared)
+    same = melody.replace(velocity=melody.velocity.copy())
+    ok = distinct == len({velocity.tobytes() for velocity in louder}) and same == melody and hash(same) == hash(melody)
+    print(f"{'✅' if ok else '❌'} hashed {len(shared)} tracks at {per_hash * 1e6:.1f} µs each,"
+          f" {distinct} distinct; equal notes hash equal")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Load test the HTTP song service locally.
+
+Starts SongService in-process on a free port, then runs --clients
+keep-alive connections that POST --requests generation specs in total.
+Checks that a seeded request returns the same bytes as rendering directly,
+and prints client-side throughput and latency next to the service's own
+/metrics. With --distinct the requests repeat a smaller pool of seeded
+specs, and --cache-mb puts a result cache in front of the workers.
+
+    python benchmarks/bench_song_service.py [--requests 2000] [--clients 32] [--workers 2]
+        [--distinct 200 --cache-mb 16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import CHORD_PROGRESSIONS, MELODY_PATTERNS, ViralMusicGenerator  # noqa: E402
+from parallel import percentile  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+from song_service import SongService  # noqa: E402
+from song_sinks import MemorySink  # noqa: E402
+
+
+async def request(reader, writer, method, path, body=b''):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                 .encode() + body)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('iso-8859-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in head[1:] if ': ' in line)
+    payload = await reader.readexactly(int(headers['Content-Length']))
+    return int(head[0].split()[1]), headers, payload
+
+
+async def client(host, port, specs, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for spec in specs:
+            started = time.perf_counter()
+            status, _, _ = await request(reader, writer, 'POST', '/generate', json.dumps(spec).encode())
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run(args):
+    cache = ResultCache(int(args.cache_mb * (1 << 20))) if args.cache_mb else None
+    service = SongService(workers=args.workers, batch_size=args.batch_size, queue_size=args.queue_size,
+                          cache=cache)
+    host, port = await service.start('127.0.0.1', 0)
+    try:
+        # A seeded request must match a direct render byte for byte
+        spec = {'prompt': 'catchy happy pop hit', 'seed': 1234}
+        reader, writer = await asyncio.open_connection(host, port)
+        status, headers, payload = await request(reader, writer, 'POST', '/generate', json.dumps(spec).encode())
+        writer.close()
+        generator = ViralMusicGenerator()
+        expected = generator.render_song(generator.parse_text_prompt(spec['prompt'], seed=1234),
+                                         sink=MemorySink())['midi_data']
+        if status != 200 or payload != expected:
+            print(f"❌ Service output differs from a direct render (HTTP {status})")
+            return 1
+        print(f"✅ Seeded request matches direct render ({len(payload)} bytes, seed {headers['X-Song-Seed']})")
+
+        rng = random.Random(0)
+        pool = [{'prompt': f"{rng.choice(list(MELODY_PATTERNS))} {rng.choice(list(CHORD_PROGRESSIONS))} song",
+                 'seed': rng.randrange(1 << 32)} for _ in range(args.distinct or args.requests)]
+        specs = [rng.choice(pool) for _ in range(args.requests)] if args.distinct else pool
+        latencies, statuses = [], {}
+        started = time.perf_counter()
+        await asyncio.gather(*(client(host, port, specs[index::args.clients], latencies, statuses)
+                               for index in range(args.clients)))
+        elapsed = time.perf_counter() - started
+
+        reader, writer = await asyncio.open_connection(host, port)
+        _, _, payload = await request(reader, writer, 'GET', '/metrics')
+        writer.close()
+        metrics = json.loads(payload)
+    finally:
+        await service.close()
+
+    latencies.sort()
+    print(f"🎵 {args.requests} requests from {args.clients} clients in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.0f} requests/s), statuses {statuses}")
+    print(f"📈 Client latency: p50 {percentile(latencies, 0.5):.1f}ms | p90 {percentile(latencies, 0.9):.1f}ms | "
+          f"p99 {percentile(latencies, 0.99):.1f}ms | max {latencies[-1]:.1f}ms")
+    print(f"📊 Service metrics: {json.dumps(metrics)}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--queue-size', type=int, default=256)
+    parser.add_argument('--distinct', type=int, default=None, help="Draw requests from this many distinct specs")
+    parser.add_argument('--cache-mb', type=float, default=0.0, help="Result cache size (0: no cache)")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Compare streaming a song bar by bar with rendering it whole.
+
+For each structure length the song is rendered whole (compose plus
+encode_midi) and streamed through midi_stream.SMFStreamSink into a
+temporary file, each timed and then run again under tracemalloc for its
+peak traced memory.
+Streaming should stay flat while the whole render grows with the song. The
+last row streams an endless loop for the given number of bars. Streamed
+note ons are checked against the whole render for every structure.
+
+    python benchmarks/bench_streaming.py [--sections 8 80 800 4000] [--loop-bars 10000]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import TRACK_NAMES, ViralMusicGenerator  # noqa: E402
+from midi_analysis import read_midi, read_midi_file  # noqa: E402
+from midi_stream import SMFStreamSink  # noqa: E402
+from midi_writer import encode_midi  # noqa: E402
+
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+
+
+def measured(fn):
+    """(result, seconds, peak traced bytes) for fn(), timed in a separate untraced run"""
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def note_ons(midi):
+    return Counter((start, channel, pitch, velocity) for track in midi.tracks
+                   for start, _, channel, pitch, velocity in track)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[8, 80, 800, 4000])
+    parser.add_argument('--loop-bars', type=int, default=10000)
+    parser.add_argument('--prompt', default="catchy happy pop hit")
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    base = generator.parse_text_prompt(args.prompt, seed=7)
+    path = os.path.join(tempfile.mkdtemp(), 'stream.mid')
+
+    def whole(elements):
+        _, tempo, notes = generator.compose(elements)
+        return encode_midi(notes, tempo, TRACK_NAMES)
+
+    def streamed(elements, **options):
+        with SMFStreamSink(path) as sink:
+            return generator.stream_song(elements, sink, **options)
+
+    print(f"{'sections':>8} {'bars':>7} {'events':>9} {'whole ms':>9} {'whole peak':>11}"
+          f" {'stream ms':>10} {'stream peak':>12} {'bars/s':>9}  ons")
+    for sections in args.sections:
+        elements = dict(base, structure=(STRUCTURE * (sections // len(STRUCTURE) + 1))[:sections])
+        whole(elements)     # Warm the section cache so both runs start alike
+        midi_data, whole_elapsed, whole_peak = measured(lambda: whole(elements))
+        info, stream_elapsed, stream_peak = measured(lambda: streamed(elements))
+        same = note_ons(read_midi(io.BytesIO(midi_data))) == note_ons(read_midi_file(path))
+        print(f"{sections:>8} {info['bars']:>7} {info['events']:>9} {whole_elapsed * 1e3:>9.1f}"
+              f" {whole_peak / 1024:>9.0f}KB {stream_elapsed * 1e3:>10.1f} {stream_peak / 1024:>10.0f}KB"
+              f" {info['bars'] / stream_elapsed:>9.0f}  {'same' if same else 'DIFFERENT'}")
+
+    info, elapsed, peak = measured(lambda: streamed(dict(base), loop=True, max_bars=args.loop_bars))
+    print(f"{'endless':>8} {info['bars']:>7} {info['events']:>9} {'':>9} {'':>11}"
+          f" {elapsed * 1e3:>10.1f} {peak / 1024:>10.0f}KB {info['bars'] / elapsed:>9.0f}")
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Time best-of-N variation search against rendering every variation.
+
+The baseline is the interactive loop run N times: create_variation then
+generate_from_elements, writing every variation's MIDI file. The search
+composes and scores the variations across --workers processes and only
+writes the top few. Each worker count reports throughput and its
+efficiency against linear scaling from one worker; the winners must be
+the same for every worker count.
+
+    python benchmarks/bench_variation_search.py [--variations 1000] [--workers 1 2 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gen_song import ViralMusicGenerator, derive_seed, search_variations  # noqa: E402
+
+
+def render_every_variation(generator, elements, count, seed, directory):
+    for index in range(count):
+        variation = generator.create_variation(elements, derive_seed(seed, index) & 0xFFFFFFFF)
+        generator.render_song(variation, output_file=os.path.join(directory, f"variation_{index}.mid"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--variations', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--prompt', default='catchy pop song for summer')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    generator = ViralMusicGenerator()
+    elements = generator.parse_text_prompt(args.prompt, seed=args.seed)
+    directory = tempfile.mkdtemp()
+    print(f"🎲 {args.variations} variations of '{args.prompt}' on {os.cpu_count()} CPUs")
+
+    started = time.perf_counter()
+    render_every_variation(generator, elements, args.variations, args.seed, directory)
+    baseline = time.perf_counter() - started
+    files = len(os.listdir(directory))
+    print(f"{'render all':>12} {baseline:>8.2f}s {args.variations / baseline:>8.0f}/s   {files} files written")
+    shutil.rmtree(directory)
+
+    single = None
+    winners = None
+    for workers in args.workers:
+        directory = tempfile.mkdtemp()
+        started = time.perf_counter()
+        summary = search_variations(generator, elements, count=args.variations, top=args.top, workers=workers,
+                                    base_seed=args.seed, output_dir=directory)
+        elapsed = time.perf_counter() - started
+        files = len(os.listdir(directory))
+        shutil.rmtree(directory)
+        single = single or elapsed * workers
+        seeds = [song_info['seed'] for song_info in summary['winners']]
+        winners = winners or seeds
+        print(f"{f'{workers} workers':>12} {elapsed:>8.2f}s {args.variations / elapsed:>8.0f}/s"
+              f"   {files} files written, {baseline / elapsed:.1f}x baseline,"
+              f" {single / workers / elapsed * 100:.0f}% of linear, winners {'same' if seeds == winners else 'DIFFERENT'}")
+
+    print("   best:", ', '.join(f"{song_info['score']:.3f} (seed {song_info['seed']})"
+                                 for song_info in summary['winners']))
+
+
+if __name__ == '__main__':
+    main()
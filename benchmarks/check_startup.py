@@ -0,0 +1,99 @@
+"""Check gen_song's cold start time and which modules the light paths import.
+
+Runs each scenario in fresh interpreters with -X importtime and takes the
+fastest of --runs, leaving out what the interpreter imports on its own.
+Bytecode is written first (PYTHONDONTWRITEBYTECODE is cleared), so the
+numbers are what an installed copy would see. Scenarios that only parse
+prompts or print help must stay under --max-ms and must not import any of
+the HEAVY modules; the batch coordinator really runs a two-worker batch
+and only NumPy is ruled out of its own process (the workers need it; their
+import lines are mixed in, so it is not timed). Exits 1 on any failure.
+
+    python benchmarks/check_startup.py [--runs 5] [--max-ms 60]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('numpy', 'midiutil', 'concurrent.futures.process', 'multiprocessing', 'tarfile', 'zipfile')
+
+BATCH = """
+import os, shutil, tempfile, gen_song
+directory = tempfile.mkdtemp()
+spec = os.path.join(directory, 'songs.jsonl')
+with open(spec, 'w') as f:
+    f.write('{"prompt": "upbeat pop", "seed": 1}\\n' * 4)
+assert gen_song.run_batch(spec, workers=2, output_dir=directory)['failed'] == 0
+shutil.rmtree(directory)
+"""
+
+# (name, code, modules it must not import, timed)
+SCENARIOS = (
+    ('import gen_song', "import gen_song", HEAVY, True),
+    ('parse a prompt', "import gen_song; gen_song.ViralMusicGenerator().parse_text_prompt('upbeat pop for summer')",
+     HEAVY, True),
+    ('--help', "import sys, gen_song\ntry:\n    gen_song.main(['--help'])\nexcept SystemExit:\n    pass", HEAVY, True),
+    ('batch coordinator', BATCH, ('numpy', 'midiutil'), False),
+)
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+MODULES_MARK = '--- modules ---'
+
+
+def importtime(code, startup=()):
+    """(µs spent importing for code, {module: cumulative µs}, modules loaded) in a fresh interpreter.
+
+    Modules in startup (what the interpreter imports before running any
+    code) are left out of the total.
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    code += f"\nimport sys\nprint({MODULES_MARK!r})\nprint('\\n'.join(sys.modules))"
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(completed.stderr[-2000:])
+    timings = {}
+    total = 0
+    for _, cumulative, indent, name in IMPORT_LINE.findall(completed.stderr):
+        timings[name] = int(cumulative)
+        if len(indent) == 1 and name not in startup:
+            total += int(cumulative)
+    loaded = set(completed.stdout.split(MODULES_MARK, 1)[1].split())
+    return total, timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=60.0, help="Import time allowed per timed scenario")
+    parser.add_argument('--top', type=int, default=5, help="Slowest gen_song dependencies to list")
+    args = parser.parse_args()
+
+    importtime("import gen_song")     # Writes bytecode for every module
+    startup = set(importtime("pass")[1])
+    failures = 0
+    for name, code, forbidden, timed in SCENARIOS:
+        total, _, loaded = min((importtime(code, startup) for _ in range(args.runs if timed else 1)),
+                               key=lambda run: run[0])
+        heavy = sorted(module for module in forbidden if module in loaded)
+        ok = not heavy and (not timed or total / 1000 <= args.max_ms)
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {name:<18} {f'{total / 1000:.1f} ms' if timed else 'untimed':>9}"
+              + (f"   imported {', '.join(heavy)}" if heavy else ''))
+
+    _, timings, _ = min((importtime("import gen_song", startup) for _ in range(args.runs)), key=lambda run: run[0])
+    slowest = sorted(((us, module) for module, us in timings.items()
+                      if module != 'gen_song' and module not in startup), reverse=True)
+    print("   slowest imports: " + ', '.join(f"{module} {us / 1000:.1f} ms" for us, module in slowest[:args.top]))
+    print(f"{'❌' if failures else '✅'} {failures} of {len(SCENARIOS)} scenarios failed"
+          f" (limit {args.max_ms:.0f} ms, no {', '.join(HEAVY)})")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Benchmark suite for every generation and analysis hot path.
+
+Each case is timed asv style: the call is repeated enough times per round
+to last at least --min-time, and the best and median of --rounds rounds
+are reported per call. Peak traced memory (tracemalloc) comes from one
+extra call. Track methods are timed with an empty section cache, so each
+call renders; the end-to-end cases run on a warm generator with a new seed
+every call, the way batches run. Cases with parameters run once per
+combination of --structure (sections in the song) and --catchiness.
+
+--json writes the results with the commit and machine they came from;
+--compare reads such a file and flags cases that got slower than
+--threshold, exiting 1 if any did, so releases can be checked in CI.
+
+    python benchmarks/suite.py [--filter melody] [--structure 8 64 512] [--catchiness 3 7 10]
+                               [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gen_song  # noqa: E402
+from gen_song import TRACK_NAMES, ViralMusicGenerator, generate_viral_song_from_patterns  # noqa: E402
+from midi_analysis import AnalysisCache, ingest_corpus  # noqa: E402
+from midi_writer import encode_midi  # noqa: E402
+from note_engine import SectionCache  # noqa: E402
+from song_sinks import MemorySink  # noqa: E402
+
+STRUCTURE = ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
+PROMPTS = [
+    "upbeat pop song for summer vibes",
+    "dark dramatic rock anthem, fast and heavy",
+    "smooth late night jazz in A minor",
+    "chill ambient electronic track for studying",
+]
+CORPUS_GENRE = 'Pop'
+
+CASES = []
+
+
+def case(name, params=()):
+    """Register setup(**params) -> zero-argument callable under name"""
+    def register(setup):
+        CASES.append((name, params, setup))
+        return setup
+    return register
+
+
+def song_elements(structure, catchiness, seed=7):
+    elements = ViralMusicGenerator().parse_text_prompt("catchy happy pop hit", seed=seed)
+    elements['structure'] = (STRUCTURE * (structure // len(STRUCTURE) + 1))[:structure]
+    elements['catchiness'] = catchiness
+    return elements
+
+
+@case('parse_text_prompt')
+def parse_prompts():
+    generator = ViralMusicGenerator()
+    prompts = itertools.cycle(PROMPTS)
+    return lambda: generator.parse_text_prompt(next(prompts), seed=1)
+
+
+def enhanced_track(method, with_seed):
+    def setup(structure, catchiness):
+        generator = ViralMusicGenerator()
+        elements = song_elements(structure, catchiness)
+        generate = getattr(generator, method)
+
+        def run():
+            generator.section_cache = SectionCache()
+            return generate(elements, 0, elements['seed']) if with_seed else generate(elements, 0)
+        return run
+    return setup
+
+
+for _method, _with_seed in (('generate_enhanced_melody', True), ('generate_enhanced_harmony', False),
+                            ('generate_enhanced_bass', False), ('generate_enhanced_drums', False)):
+    case(_method, ('structure', 'catchiness'))(enhanced_track(_method, _with_seed))
+
+
+@case('generate_from_elements', ('structure', 'catchiness'))
+def generate_from_elements(structure, catchiness):
+    generator = ViralMusicGenerator()
+    elements = song_elements(structure, catchiness)
+    seeds = itertools.count()
+    sink = MemorySink()
+
+    def run():
+        elements['seed'] = next(seeds)
+        generator.generate_from_elements(elements, sink=sink, name='song.mid')
+    return run
+
+
+@case('midi_write', ('structure', 'catchiness'))
+def midi_write(structure, catchiness):
+    _, tempo, notes = ViralMusicGenerator().compose(song_elements(structure, catchiness))
+    path = os.path.join(workspace(), 'song.mid')
+
+    def run():
+        with open(path, 'wb') as f:
+            f.write(encode_midi(notes, tempo, TRACK_NAMES))
+    return run
+
+
+@case('generate_viral_song_from_patterns')
+def song_from_patterns():
+    accumulator, _ = ingest_corpus(gen_song.MIDI_ROOT_DIR, genres=[CORPUS_GENRE], workers=1)
+    patterns = accumulator.patterns()
+    # The function always writes OUTPUT_MIDI; point it into the workspace
+    gen_song.OUTPUT_MIDI = os.path.join(workspace(), 'patterns.mid')
+    seeds = itertools.count()
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_viral_song_from_patterns(patterns, seed=next(seeds))
+    return run
+
+
+@case('ingest_corpus')
+def ingest_cold():
+    return lambda: ingest_corpus(gen_song.MIDI_ROOT_DIR, genres=[CORPUS_GENRE], workers=1)
+
+
+@case('ingest_corpus_cached')
+def ingest_cached():
+    cache = AnalysisCache(os.path.join(workspace(), 'pattern_cache'))
+    cache.ingest(gen_song.MIDI_ROOT_DIR, genres=[CORPUS_GENRE], workers=1)
+    return lambda: cache.ingest(gen_song.MIDI_ROOT_DIR, genres=[CORPUS_GENRE], workers=1)
+
+
+_workspace = []
+
+
+def workspace():
+    """Scratch directory for cases that write files, removed at exit"""
+    if not _workspace:
+        _workspace.append(tempfile.mkdtemp(prefix='song_bench_'))
+    return _workspace[0]
+
+
+def measure(run, rounds, min_time):
+    """(best, median) seconds per call and peak traced bytes of one call"""
+    run()
+    # Enough calls per round to make it last min_time
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    timings = [elapsed / number]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - started) / number)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), statistics.median(timings), number, peak
+
+
+def selected_cases(pattern, grid):
+    for name, params, setup in CASES:
+        if pattern and not re.search(pattern, name):
+            continue
+        for values in itertools.product(*(grid[param] for param in params)):
+            yield name, dict(zip(params, values)), setup
+
+
+def case_id(name, params):
+    return name + ''.join(f"[{param}={value}]" for param, value in params.items())
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', default=None, help="Only cases whose name matches this regex")
+    parser.add_argument('--structure', type=int, nargs='+', default=[8, 64, 512])
+    parser.add_argument('--catchiness', type=int, nargs='+', default=[3, 7, 10])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help="Seconds each round lasts at least")
+    parser.add_argument('--json', default=None, help="Write results to this file")
+    parser.add_argument('--compare', default=None, help="Results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Slowdown reported as a regression")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {result['id']: result for result in json.load(f)['results']}
+
+    grid = {'structure': args.structure, 'catchiness': args.catchiness}
+    results = []
+    regressions = 0
+    print(f"{'case':<58} {'best':>10} {'median':>10} {'calls':>6} {'peak':>9}  vs baseline")
+    try:
+        for name, params, setup in selected_cases(args.filter, grid):
+            best, median, number, peak = measure(setup(**params), args.rounds, args.min_time)
+            result = {'id': case_id(name, params), 'name': name, 'params': params, 'best_sec': best,
+                      'median_sec': median, 'calls_per_round': number, 'rounds': args.rounds, 'peak_bytes': peak}
+            results.append(result)
+
+            change = ''
+            if result['id'] in baseline:
+                ratio = best / baseline[result['id']]['best_sec']
+                slower = ratio > 1 + args.threshold
+                regressions += slower
+                change = f"{ratio:.2f}x{'  ⚠️ slower' if slower else ''}"
+            print(f"{result['id']:<58} {best * 1e3:>8.3f}ms {median * 1e3:>8.3f}ms {number:>6}"
+                  f" {peak / 1024:>7.0f}KB  {change}", flush=True)
+    finally:
+        if _workspace:
+            shutil.rmtree(_workspace[0], ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'machine': machine_info(), 'results': results}, f, indent=1)
+        print(f"📝 Results: {args.json}")
+    if baseline:
+        print(f"{'⚠️' if regressions else '✅'} {regressions} of {len(results)} cases more than"
+              f" {args.threshold:.0%} slower than {args.compare}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from midi_analysis import MIDI_EXTENSIONS, PatternAccumulator, StaleCacheError, iter_corpus_files
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Files count as changed once written and closed or moved in, never mid-write
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')        # wd, mask, cookie, name length
+SETTLE_SECONDS = 0.05                       # Gather the rest of a burst of events before reporting it
+INDEX_SAVE_SECONDS = 5.0                    # Longest the saved index lags a steady stream of changes
+
+
+class InotifyWatcher:
+    """Reports changed corpus files from Linux inotify events on every folder under root.
+
+    changes() returns the paths touched since the last call, or None when
+    the kernel dropped events or a folder went away, and only a rescan can
+    tell what changed.
+    """
+
+    name = 'inotify'
+
+    def __init__(self, root, genres=None):
+        self.root = root
+        self.genres = genres
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}       # watch descriptor -> folder
+        self.add_tree(root)
+
+    def add_tree(self, path):
+        """Watch a folder and every folder below it; returns the files already in them"""
+        files = set()
+        for dirpath, _, filenames in os.walk(path):
+            descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), f"cannot watch {dirpath}")
+            self.directories[descriptor] = dirpath
+            files.update(os.path.join(dirpath, name) for name in filenames if name.lower().endswith(MIDI_EXTENSIONS))
+        return files
+
+    def changes(self, timeout):
+        """Paths changed within timeout seconds (an empty set if none), or None to rescan"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        time.sleep(SETTLE_SECONDS)
+        changed = set()
+        rescan = False
+        for descriptor, mask, name in self._events():
+            directory = self.directories.get(descriptor)
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+            elif mask & IN_IGNORED:
+                self.directories.pop(descriptor, None)
+            elif directory is None:
+                continue
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # The folder's files left with it; the index knows which they were
+                rescan = True
+            elif mask & IN_ISDIR:
+                path = os.path.join(directory, name)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self.add_tree(path))
+                else:
+                    rescan = True
+            elif not mask & IN_CREATE:     # New files are reported when closed after writing
+                changed.add(os.path.join(directory, name))
+        return None if rescan else changed
+
+    def _events(self):
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        position = 0
+        while position < len(data):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + length].rstrip(b'\0'))
+            position += length
+            yield descriptor, mask, name
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Reports changed corpus files by comparing (size, mtime) snapshots taken every poll.
+
+    A file is reported once its stat has stayed the same for a whole poll,
+    so files still being copied in are picked up when they are complete.
+    """
+
+    name = 'polling'
+
+    def __init__(self, root, genres=None):
+        self.root = root
+        self.genres = genres
+        self.previous = self.scan()
+        self.reported = dict(self.previous)
+
+    def scan(self):
+        snapshot = {}
+        for path, _ in iter_corpus_files(self.root, self.genres):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        """Paths whose changes settled within timeout seconds (an empty set if none)"""
+        time.sleep(timeout)
+        current = self.scan()
+        settled = {path for path in current.keys() & self.previous.keys() if current[path] == self.previous[path]}
+        # Removals need no settling
+        changed = {path for path in settled | (self.reported.keys() - current.keys())
+                   if current.get(path) != self.reported.get(path)}
+        for path in changed:
+            if path in current:
+                self.reported[path] = current[path]
+            else:
+                del self.reported[path]
+        self.previous = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(root, genres=None, polling=False):
+    """An InotifyWatcher for root, or a PollingWatcher where inotify is unavailable or polling is asked for"""
+    if not polling:
+        try:
+            return InotifyWatcher(root, genres)
+        except (OSError, AttributeError):     # Not Linux, or out of inotify watches
+            pass
+    return PollingWatcher(root, genres)
+
+
+class CorpusWatcher:
+    """Keeps a generator's learned patterns in step with the MIDI corpus as files come and go.
+
+    The scope's index and pattern totals are loaded once, at the first
+    change, and kept in memory. Each batch of changes is analyzed on its own
+    and applied to them in place (AnalysisCache.apply); the rest of the
+    corpus is not touched. The new pattern tables then replace
+    generator.learned_patterns in one reference assignment, so a generation
+    already running keeps the tables it started with and the next one sees
+    the new tables, with no lock and no pause. The index is written back
+    once the changes settle, at least every INDEX_SAVE_SECONDS, and on stop.
+    """
+
+    def __init__(self, generator, cache, root, genres=None, workers=None, interval=1.0, polling=False,
+                 on_update=None):
+        self.generator = generator
+        self.cache = cache                  # The AnalysisCache the generator learned root with
+        self.root = root
+        self.genres = genres
+        self.workers = workers
+        self.interval = interval
+        self.on_update = on_update          # Called with the IngestionStats of every applied change
+        self.watcher = open_watcher(root, genres, polling)
+        self.entries = None                 # The scope's index, path -> entry, once loaded
+        self.accumulator = None
+        self.cold_seconds = None
+        self.unsaved = None                 # When the oldest change not in the saved index was applied
+        self.updates = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self, timeout=None):
+        """Wait for one batch of changes and apply it; returns its IngestionStats, or None if nothing changed"""
+        changed = self.watcher.changes(self.interval if timeout is None else timeout)
+        if changed is not None and not changed:
+            self.save(settled=True)
+            return None
+        stats = self._apply(changed)
+        if not (stats.files or stats.reused or stats.removed or stats.failed):
+            return None
+        if self.unsaved is None:
+            self.unsaved = time.monotonic()
+        self.generator.learned_patterns = self.accumulator.patterns() if self.accumulator.files else None
+        self.updates += 1
+        if self.on_update is not None:
+            self.on_update(stats)
+        self.save()
+        return stats
+
+    def _apply(self, changed):
+        """Apply changed paths, or a rescan of the whole corpus for None, to the index in memory"""
+        if self.entries is None:
+            index = self.cache.load_index(self.root, self.genres)
+            if index is None:
+                changed = None
+            self._reset(index)
+        try:
+            stats = self.cache.apply(self.root, self.entries, self.accumulator, changed, self.genres, self.workers)
+        except StaleCacheError:
+            # A file's cached features are gone, so it cannot be taken back: start over
+            self._reset(None)
+            stats = self.cache.apply(self.root, self.entries, self.accumulator, None, self.genres, self.workers)
+        if self.cold_seconds is None:
+            self.cold_seconds = stats.elapsed
+        stats.cold_elapsed = self.cold_seconds
+        return stats
+
+    def _reset(self, index):
+        self.entries = index['files'] if index else {}
+        self.accumulator = PatternAccumulator.from_state(index['state']) if index else PatternAccumulator()
+        self.cold_seconds = index['cold_seconds'] if index else None
+
+    def save(self, settled=False):
+        """Write the index back if changes were applied since the last save, once settled or overdue"""
+        if self.unsaved is None or not (settled or time.monotonic() - self.unsaved >= INDEX_SAVE_SECONDS):
+            return
+        self.cache.save(self.root, self.genres, self.entries, self.accumulator, self.cold_seconds)
+        self.unsaved = None
+
+    def run(self):
+        """Apply changes until stop() is called"""
+        try:
+            while not self._stop.is_set():
+                self.poll()
+        finally:
+            self.save(settled=True)
+            self.watcher.close()
+
+    def start(self):
+        """Run in a background thread; generations carry on in the caller's threads"""
+        self._thread = threading.Thread(target=self.run, name='corpus-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
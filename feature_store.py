@@ -0,0 +1,428 @@
+import contextlib
+import hashlib
+import json
+import marshal
+import os
+import shutil
+
+import numpy as np
+
+from midi_analysis import load_features, scope_id
+
+STORE_VERSION = 2           # Bump whenever the on-disk layout changes
+TEMPO_BUCKET_BPM = 10       # Width of the tempo index buckets
+
+# Per-file pattern counts, stored kind by kind: (name, features field, value type)
+FEATURE_KINDS = (
+    ('progression', 'progressions', str),
+    ('melody', 'melody_patterns', int),
+    ('rhythm', 'rhythm_patterns', float),
+    ('structure', 'structure', str),
+    ('hook', 'hooks', int),
+)
+KIND_INDEX = {name: index for index, (name, _, _) in enumerate(FEATURE_KINDS)}
+FILE_STATS = ('note_density', 'pitch_range', 'repetition', 'velocity')
+
+# Tuples are interned as their items joined by a separator
+VALUE_SEPARATOR = '|'
+
+
+def encode_value(value):
+    if isinstance(value, tuple):
+        return VALUE_SEPARATOR.join(str(item) for item in value)
+    return str(value)
+
+
+def decode_value(text, value_type):
+    return tuple(value_type(item) for item in text.split(VALUE_SEPARATOR)) if text else ()
+
+
+class FeatureStoreBuilder:
+    """Collects per-file features into columns, then writes a FeatureStore.
+
+    Strings (genres, keys, paths and every pattern) are interned once in
+    first-seen order, so ranking ties break the same way Counter.most_common
+    does for files added in the same order.
+    """
+
+    def __init__(self):
+        self.string_ids = {}
+        self.genre = []
+        self.key = []
+        self.path = []
+        self.tempo = []
+        self.stats = []
+        self.occurrences = [([], [], []) for _ in FEATURE_KINDS]    # file, value, count per kind
+
+    def intern(self, text):
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.string_ids)
+        return string_id
+
+    def add(self, features, path=None):
+        """Append one file's analyze_midi output"""
+        file_id = len(self.genre)
+        self.genre.append(self.intern(str(features['genre'])))
+        self.key.append(self.intern(features['key']) if features['key'] else -1)
+        self.path.append(self.intern(path) if path is not None else -1)
+        self.tempo.append(features['tempo'])
+        self.stats.append([features['stats'].get(name, np.nan) for name in FILE_STATS])
+
+        for (_, field, _), (files, values, counts) in zip(FEATURE_KINDS, self.occurrences):
+            patterns = features[field]
+            if patterns is None:
+                continue
+            if not isinstance(patterns, dict):
+                # A single value (structure) or a list counted once each (hooks)
+                patterns = {patterns: 1} if isinstance(patterns, tuple) else dict.fromkeys(patterns, 1)
+            for value, count in patterns.items():
+                files.append(file_id)
+                values.append(self.intern(encode_value(value)))
+                counts.append(count)
+
+    def write(self, directory, source=None):
+        """Write the store to directory, replacing any previous one in a single rename"""
+        staging = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        def save(name, array):
+            np.save(os.path.join(staging, name + '.npy'), array)
+
+        # Intern table: one UTF-8 blob plus offsets
+        encoded = [text.encode('utf-8') for text in self.string_ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        save('string_offsets', offsets)
+        with open(os.path.join(staging, 'strings.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+
+        files = len(self.genre)
+        genre = np.array(self.genre, dtype=np.int32)
+        key = np.array(self.key, dtype=np.int32)
+        tempo = np.array(self.tempo, dtype=np.float64)
+        bucket = (tempo // TEMPO_BUCKET_BPM).astype(np.int32)
+        save('file_genre', genre)
+        save('file_key', key)
+        save('file_path', np.array(self.path, dtype=np.int32))
+        save('file_tempo', tempo)
+        save('file_stats', np.array(self.stats, dtype=np.float64).reshape(files, len(FILE_STATS)))
+        # Whole-corpus tables patterns() hands out as memory-mapped views
+        save('sorted_tempo', np.sort(tempo))
+        for name, column in (('key', key), ('genre', genre)):
+            named = column[column >= 0]
+            total_values, total_counts = rank(named, np.ones(named.shape[0], dtype=np.int64))
+            save(f'total_file_{name}_values', total_values)
+            save(f'total_file_{name}_counts', total_counts)
+
+        # Posting lists: file ids grouped by genre, key and tempo bucket
+        for name, column in (('genre', genre), ('key', key), ('bucket', bucket)):
+            order = np.argsort(column, kind='stable').astype(np.int32)
+            values, starts = np.unique(column[order], return_index=True)
+            save(f'{name}_index_values', values)
+            save(f'{name}_index_offsets', np.append(starts, files).astype(np.int64))
+            save(f'{name}_index_files', order)
+
+        # Occurrences kind by kind, file by file, with CSR offsets per kind
+        offsets = np.zeros((len(FEATURE_KINDS), files + 1), dtype=np.int64)
+        values, counts = [], []
+        position = 0
+        for index, (kind_files, kind_values, kind_counts) in enumerate(self.occurrences):
+            offsets[index] = position + np.searchsorted(np.array(kind_files, dtype=np.int64), np.arange(files + 1))
+            position += len(kind_files)
+            values.append(np.array(kind_values, dtype=np.int32))
+            counts.append(np.array(kind_counts, dtype=np.int32))
+
+            # Whole-corpus ranking, so unfiltered top-k is a slice
+            total_values, total_counts = rank(values[-1], counts[-1])
+            save(f'total_{FEATURE_KINDS[index][0]}_values', total_values)
+            save(f'total_{FEATURE_KINDS[index][0]}_counts', total_counts)
+        save('occurrence_offsets', offsets)
+        save('occurrence_values', np.concatenate(values))
+        save('occurrence_counts', np.concatenate(counts))
+
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump({'version': STORE_VERSION, 'files': files, 'strings': len(encoded),
+                       'kinds': [name for name, _, _ in FEATURE_KINDS], 'stats': FILE_STATS,
+                       'tempo_bucket_bpm': TEMPO_BUCKET_BPM, 'source': source}, f)
+
+        previous = f"{directory}.{os.getpid()}.old"
+        if os.path.exists(directory):
+            os.replace(directory, previous)
+        os.replace(staging, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def rank(values, counts, k=None):
+    """Sum counts per value id; the k best (value ids, totals), by descending total then id"""
+    if not values.shape[0]:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    distinct, inverse = np.unique(values, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=distinct.shape[0]).astype(np.int64)
+    if k is None or k >= distinct.shape[0]:
+        order = np.lexsort((distinct, -totals))
+    else:
+        # Only sort the k best: descending total, ascending id, packed into one key
+        packed = -totals * (1 << 32) + distinct
+        best = np.argpartition(packed, k)[:k]
+        order = best[np.argsort(packed[best])]
+    return distinct[order].astype(np.int32), totals[order]
+
+
+class RankedFeature:
+    """Counter-like read-only view of one ranked feature: most_common, len, bool"""
+
+    def __init__(self, store, ranking, value_type=None):
+        self.store = store
+        self.ranking = ranking          # k -> the k best (value ids, counts); None for all
+        self.value_type = value_type
+        self._ranked = None
+
+    def most_common(self, n=None):
+        if self._ranked is not None:
+            values, counts = self._ranked
+            values, counts = values[:n], counts[:n]
+        else:
+            values, counts = self.ranking(n)
+        return [(self.store.value(value_id, self.value_type), int(count))
+                for value_id, count in zip(values.tolist(), counts.tolist())]
+
+    def _all(self):
+        if self._ranked is None:
+            self._ranked = self.ranking(None)
+        return self._ranked
+
+    def __len__(self):
+        return int(self._all()[0].shape[0])
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class FeatureStore:
+    """Read-only, memory-mapped columnar store of per-file corpus features.
+
+    Files are rows of the file_* columns; pattern counts live in
+    occurrence_* columns grouped by kind and file. Posting lists by genre,
+    key and tempo bucket narrow a query to its files, so a filtered top-k
+    only touches those files' occurrences; unfiltered top-k reads the
+    precomputed whole-corpus ranking.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"feature store version {self.manifest.get('version')}, expected {STORE_VERSION}")
+        self.files = self.manifest['files']
+        self.arrays = {}
+        strings_path = os.path.join(directory, 'strings.bin')
+        # np.memmap refuses empty files
+        self.strings = (np.memmap(strings_path, dtype=np.uint8, mode='r') if os.path.getsize(strings_path)
+                        else np.zeros(0, dtype=np.uint8))
+        self.lookup = {}
+
+    def column(self, name):
+        """One stored array, memory-mapped on first use"""
+        array = self.arrays.get(name)
+        if array is None:
+            array = self.arrays[name] = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+        return array
+
+    @classmethod
+    def open(cls, directory):
+        """The store in directory, or None if there is no readable one"""
+        try:
+            return cls(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def string(self, string_id):
+        offsets = self.column('string_offsets')
+        start, end = offsets[string_id], offsets[string_id + 1]
+        return bytes(self.strings[start:end]).decode('utf-8')
+
+    def value(self, string_id, value_type=None):
+        text = self.string(string_id)
+        return decode_value(text, value_type) if value_type is not None else text
+
+    def _id(self, index, name):
+        """String id of a genre or key name in an index (case-insensitive), or None"""
+        lookup = self.lookup.get(index)
+        if lookup is None:
+            values = self.column(f'{index}_index_values')
+            lookup = self.lookup[index] = {self.string(int(value)).lower(): int(value)
+                                           for value in values if value >= 0}
+        return lookup.get(name.lower())
+
+    def _posting(self, index, value):
+        values = self.column(f'{index}_index_values')
+        position = np.searchsorted(values, value)
+        if position >= values.shape[0] or values[position] != value:
+            return np.zeros(0, dtype=np.int32)
+        offsets = self.column(f'{index}_index_offsets')
+        return self.column(f'{index}_index_files')[offsets[position]:offsets[position + 1]]
+
+    def select(self, genre=None, key=None, tempo=None):
+        """Sorted ids of the files matching every given filter; None when unfiltered.
+
+        tempo is an inclusive (low, high) BPM range.
+        """
+        selected = None
+
+        def narrow(files):
+            return np.sort(files) if selected is None else np.intersect1d(selected, files, assume_unique=True)
+
+        if genre is not None:
+            genre_id = self._id('genre', genre)
+            selected = narrow(self._posting('genre', genre_id) if genre_id is not None else np.zeros(0, np.int32))
+        if key is not None:
+            key_id = self._id('key', key)
+            selected = narrow(self._posting('key', key_id) if key_id is not None else np.zeros(0, np.int32))
+        if tempo is not None:
+            low, high = tempo
+            values = self.column('bucket_index_values')
+            offsets = self.column('bucket_index_offsets')
+            first = np.searchsorted(values, low // TEMPO_BUCKET_BPM, side='left')
+            last = np.searchsorted(values, high // TEMPO_BUCKET_BPM, side='right')
+            files = np.asarray(self.column('bucket_index_files')[offsets[first]:offsets[last]])
+            tempos = self.column('file_tempo')[files]
+            selected = narrow(files[(tempos >= low) & (tempos <= high)])
+        return selected
+
+    def occurrences(self, kind, files):
+        """(values, counts) of one kind's occurrences in the given files"""
+        offsets = self.column('occurrence_offsets')[KIND_INDEX[kind]]
+        starts = offsets[files]
+        lengths = offsets[files + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        # Concatenate the per-file ranges with one gather
+        rows = np.arange(total) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.column('occurrence_values')[rows], self.column('occurrence_counts')[rows]
+
+    def ranked(self, kind, files=None, k=None):
+        """(value ids, counts) of one kind, best first, for the given files or the whole corpus"""
+        if files is None:
+            values, counts = self.column(f'total_{kind}_values'), self.column(f'total_{kind}_counts')
+            return np.asarray(values[:k]), np.asarray(counts[:k])
+        return rank(*self.occurrences(kind, files), k)
+
+    def ranked_column(self, name, files=None, k=None):
+        """(value ids, file counts) of a per-file string column, such as file_key"""
+        if files is None:
+            values, counts = self.column(f'total_{name}_values'), self.column(f'total_{name}_counts')
+            return np.asarray(values[:k]), np.asarray(counts[:k])
+        values = np.asarray(self.column(name)[files])
+        values = values[values >= 0]
+        return rank(values, np.ones(values.shape[0], dtype=np.int64), k)
+
+    def top(self, kind, k=5, genre=None, key=None, tempo=None):
+        """[(value, count)] for the k most common patterns of a kind among matching files"""
+        files = self.select(genre, key, tempo)
+        values, counts = self.ranked(kind, files, k)
+        value_type = FEATURE_KINDS[KIND_INDEX[kind]][2]
+        return [(self.value(value_id, value_type), int(count)) for value_id, count in zip(values.tolist(), counts.tolist())]
+
+    def patterns(self, genre=None, key=None, tempo=None):
+        """Learned patterns for the matching files, shaped like PatternAccumulator.patterns().
+
+        Pattern tables are RankedFeature views that answer most_common from
+        the store instead of Counters. Unfiltered, the rankings and tempos
+        are slices of the memory-mapped columns, so worker processes that
+        each open the store share its pages instead of holding copies.
+        """
+        files = self.select(genre, key, tempo)
+
+        def view(kind):
+            return RankedFeature(self, lambda k: self.ranked(kind, files, k), FEATURE_KINDS[KIND_INDEX[kind]][2])
+
+        def column_view(name):
+            return RankedFeature(self, lambda k: self.ranked_column(name, files, k))
+
+        stats = np.asarray(self.column('file_stats') if files is None else self.column('file_stats')[files])
+        viral_elements = {}
+        for index, name in enumerate(FILE_STATS):
+            values = stats[:, index]
+            values = values[~np.isnan(values)]
+            if values.shape[0]:
+                viral_elements[name] = {'mean': float(values.mean()), 'std': float(values.std()),
+                                        'count': int(values.shape[0])}
+
+        return {
+            'chord_progressions': view('progression'),
+            'popular_keys': column_view('file_key'),
+            'optimal_tempos': (self.column('sorted_tempo') if files is None
+                               else np.sort(self.column('file_tempo')[files])),
+            'viral_elements': viral_elements,
+            'structure_patterns': view('structure'),
+            'melody_patterns': view('melody'),
+            'rhythm_patterns': view('rhythm'),
+            'hooks': view('hook'),
+            'genres': column_view('file_genre'),
+        }
+
+
+def index_fingerprint(index):
+    """Digest of an AnalysisCache index, identifying the corpus state a store was built from"""
+    entries = sorted((path, entry[2], entry[3]) for path, entry in index['files'].items())
+    return hashlib.blake2b(marshal.dumps(entries), digest_size=16).hexdigest()
+
+
+def store_directory(directory, root, genres=None):
+    """Where update_feature_store keeps the store of one corpus scope (root + genre filter)"""
+    return os.path.join(directory, f"scope-{scope_id(root, genres)}")
+
+
+@contextlib.contextmanager
+def rebuild_lock(path):
+    """Hold an exclusive lock on path.lock, so one process at a time checks and rebuilds a store"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock_file:
+        try:
+            import fcntl
+        except ImportError:     # Not POSIX: rebuilds are not serialized
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_feature_store(directory, cache, root, genres=None):
+    """Open the store for an AnalysisCache scope, rebuilding it if the corpus changed.
+
+    Every scope has its own store under directory (see store_directory),
+    so switching between scopes never rebuilds, and concurrent processes
+    take turns at a rebuild instead of racing on one folder. Call after
+    cache.ingest(root, genres); the rebuild reads the cached per-file
+    features, it never re-parses MIDI. Returns None when the cache has no
+    index for the scope.
+    """
+    index = cache.load_index(root, genres)
+    if index is None:
+        return None
+    fingerprint = index_fingerprint(index)
+    path = store_directory(directory, root, genres)
+    store = FeatureStore.open(path)
+    if store is not None and store.manifest.get('source') == fingerprint:
+        return store
+
+    with rebuild_lock(path):
+        # Another process may have built it while this one waited
+        store = FeatureStore.open(path)
+        if store is not None and store.manifest.get('source') == fingerprint:
+            return store
+        builder = FeatureStoreBuilder()
+        for file_path, (_, _, digest, genre) in sorted(index['files'].items()):
+            features = load_features(cache.features_dir, digest) if digest is not None else None
+            if features is not None:
+                features['genre'] = genre
+                builder.add(features, file_path)
+        builder.write(path, source=fingerprint)
+    return FeatureStore(path)
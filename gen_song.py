@@ -1,102 +1,307 @@
 import os
+import sys
+import json
+import time
 import random
-import numpy as np
-from midiutil import MIDIFile
-from collections import Counter
+import hashlib
+import secrets
+import argparse
+import heapq
+from functools import lru_cache, partial
+from types import MappingProxyType
 import re
 
+# NumPy and the modules built on it are imported where they are used, so
+# prompt parsing, --help and the batch coordinator start without them
+from instrumentation import NO_STAGE, ChromeTraceExporter, Instrumentation, LogExporter, PrometheusExporter, \
+    RecordingExporter
+from midi_analysis import AnalysisCache, ingest_corpus, key_as_analyzed
+from music_theory import ALL_KEYS, KEY_TABLE, chord_in_key, lookup_chord, lookup_key, realize_progression, \
+    transpose_progression
+from parallel import LatencyReservoir, batched, run_batches
+from result_cache import result_key
+from song_model import SongResult, SongSpec, shared_tuple
+from song_sinks import DirectorySink, MemorySink, PathSink, open_archive
+
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 ANALYSIS_DIR = os.path.join(BASE_DIR, "analysis")
+PATTERN_CACHE_DIR = os.path.join(ANALYSIS_DIR, "pattern_cache")
+FEATURE_STORE_DIR = os.path.join(ANALYSIS_DIR, "feature_store")
+MELODY_MODEL_PATH = os.path.join(ANALYSIS_DIR, "melody_model.npz")
 OUTPUT_MIDI = os.path.join(BASE_DIR, "generated_song.mid")
-POP_MIDI_DIR = os.path.join(BASE_DIR, "midi_files", "Pop")
-
-# Enhanced musical knowledge base
-CHORD_PROGRESSIONS = {
-    'pop': [
-        ('C', 'G', 'Am', 'F'),  # I-V-vi-IV
-        ('Am', 'F', 'C', 'G'),  # vi-IV-I-V
-        ('F', 'G', 'C', 'Am'),  # IV-V-I-vi
-        ('C', 'Am', 'F', 'G'),  # I-vi-IV-V
-    ],
-    'rock': [
-        ('E', 'A', 'B', 'E'),   # I-IV-V-I
-        ('A', 'D', 'E', 'A'),   # I-IV-V-I
-        ('G', 'C', 'D', 'G'),   # I-IV-V-I
-        ('Em', 'C', 'G', 'D'),  # vi-IV-I-V
-    ],
-    'jazz': [
-        ('Cmaj7', 'Am7', 'Dm7', 'G7'),  # IIMaj7-vi7-ii7-V7
-        ('Am7', 'D7', 'Gmaj7', 'Cmaj7'),  # ii7-V7-IMaj7-IVMaj7
-        ('Fmaj7', 'Em7', 'Am7', 'Dm7'),  # IVMaj7-iii7-vi7-ii7
-    ],
-    'blues': [
-        ('C7', 'C7', 'C7', 'C7'),  # I7-I7-I7-I7
-        ('F7', 'F7', 'C7', 'C7'),  # IV7-IV7-I7-I7
-        ('G7', 'F7', 'C7', 'G7'),  # V7-IV7-I7-V7
-    ],
-    'electronic': [
-        ('Am', 'G', 'F', 'E'),   # vi-V-IV-III
-        ('Dm', 'Am', 'Bb', 'F'), # i-v-bVI-III
-        ('Em', 'D', 'C', 'B'),   # vi-V-IV-III
-    ],
-    'sad': [
-        ('Am', 'F', 'C', 'G'),   # vi-IV-I-V
-        ('Dm', 'Bb', 'F', 'C'),  # i-bVI-III-VII
-        ('Em', 'C', 'G', 'D'),   # vi-IV-I-V
-    ],
-    'happy': [
-        ('C', 'G', 'Am', 'F'),   # I-V-vi-IV
-        ('F', 'C', 'G', 'Am'),   # IV-I-V-vi
-        ('G', 'D', 'Em', 'C'),   # I-V-vi-IV
-    ],
-    'energetic': [
-        ('E', 'B', 'C#m', 'A'),  # I-V-vi-IV
-        ('A', 'E', 'F#m', 'D'),  # I-V-vi-IV
-        ('D', 'A', 'Bm', 'G'),   # I-V-vi-IV
-    ]
-}
+MIDI_ROOT_DIR = os.path.join(BASE_DIR, "midi_files")
+POP_MIDI_DIR = os.path.join(MIDI_ROOT_DIR, "Pop")
+BATCH_OUTPUT_DIR = os.path.join(BASE_DIR, "generated_batch")
+VARIATIONS_OUTPUT_DIR = os.path.join(BASE_DIR, "generated_variations")
+KEYS_OUTPUT_DIR = os.path.join(BASE_DIR, "generated_keys")
+
+TRACK_NAMES = ("Viral Melody", "Viral Harmony", "Viral Bass", "Viral Drums")
+TRACK_STAGES = ("melody", "harmony", "bass", "drums")     # Instrumentation names of the same tracks
+
+# A batch spec holds these and element names; an 'elements' object holds element names only
+SPEC_FIELDS = frozenset(('prompt', 'id', 'seed', 'elements'))
+ELEMENT_NAMES = frozenset(SongSpec.__slots__)
+
+CHORD_BEATS = 2.0       # Every chord of a progression lasts half a bar
+SECTION_BARS = 4        # Drum bars per section
 
-MELODY_PATTERNS = {
-    'catchy': [
+# Enhanced musical knowledge base. Read-only mappings of tuples: tuples of
+# constants are folded into the compiled module, so loading them is free.
+# Progressions are scale degrees over the major scale (see
+# music_theory.parse_numeral), realized in whatever key a song is in
+CHORD_PROGRESSIONS = MappingProxyType({
+    'pop': (
+        ('I', 'V', 'vi', 'IV'),
+        ('vi', 'IV', 'I', 'V'),
+        ('IV', 'V', 'I', 'vi'),
+        ('I', 'vi', 'IV', 'V'),
+    ),
+    'rock': (
+        ('I', 'IV', 'V', 'I'),
+        ('vi', 'IV', 'I', 'V'),
+    ),
+    'jazz': (
+        ('Imaj7', 'vi7', 'ii7', 'V7'),
+        ('ii7', 'V7', 'Imaj7', 'IVmaj7'),
+        ('IVmaj7', 'iii7', 'vi7', 'ii7'),
+    ),
+    'blues': (
+        ('I7', 'I7', 'I7', 'I7'),
+        ('IV7', 'IV7', 'I7', 'I7'),
+        ('V7', 'IV7', 'I7', 'V7'),
+    ),
+    'electronic': (
+        ('vi', 'V', 'IV', 'III'),
+        ('vi', 'iii', 'IV', 'I'),
+    ),
+    'sad': (
+        ('vi', 'IV', 'I', 'V'),
+    ),
+    'happy': (
+        ('I', 'V', 'vi', 'IV'),
+        ('IV', 'I', 'V', 'vi'),
+    ),
+    'energetic': (
+        ('I', 'V', 'vi', 'IV'),
+    )
+})
+
+# Keys a genre's songs are drawn from when the prompt names none: the keys
+# its progressions were written in before they became scale degrees
+GENRE_KEYS = MappingProxyType({
+    'pop': ('C',),
+    'rock': ('E', 'A', 'G'),
+    'jazz': ('C', 'G'),
+    'blues': ('C',),
+    'electronic': ('C', 'F', 'G'),
+    'sad': ('C', 'F', 'G'),
+    'happy': ('C', 'G'),
+    'energetic': ('E', 'A', 'D'),
+})
+
+MELODY_PATTERNS = MappingProxyType({
+    'catchy': (
         (0, 2, 4, 2, 0, -1, 0),     # Scale up and down
         (0, 4, 2, 0, -2, 0, 2),     # Jump and resolve
         (0, 3, 0, 5, 0, 3, 0),      # Repeated notes with leaps
         (0, 1, 3, 1, 0, 2, 0),      # Stepwise with returns
-    ],
-    'smooth': [
+    ),
+    'smooth': (
         (0, 1, 2, 1, 0, 1, 2),      # Stepwise motion
         (0, 2, 1, 3, 2, 1, 0),      # Gentle curves
         (0, 1, 0, 2, 1, 0, 1),      # Small intervals
-    ],
-    'dramatic': [
+    ),
+    'dramatic': (
         (0, 7, 0, 5, 0, 7, 0),      # Large leaps
         (0, -5, 7, 0, -7, 5, 0),    # Contrasting jumps
         (0, 8, -3, 5, -2, 7, 0),    # Mixed intervals
-    ],
-    'playful': [
+    ),
+    'playful': (
         (0, 2, 0, 3, 0, 2, 0),      # Bouncy pattern
         (0, 1, 3, 0, 2, 1, 0),      # Skipping notes
         (0, 3, 1, 4, 2, 3, 0),      # Irregular pattern
-    ]
-}
+    )
+})
 
-RHYTHM_PATTERNS = {
-    'steady': [(1.0, 1.0, 1.0, 1.0)],
-    'syncopated': [(0.5, 0.5, 1.0, 0.5, 0.5, 1.0)],
-    'swing': [(0.67, 0.33, 0.67, 0.33, 0.67, 0.33)],
-    'driving': [(0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5)],
-    'laid_back': [(1.5, 0.5, 1.5, 0.5)]
-}
+MOTIF_LENGTH = 7        # Intervals per learned melody motif, like the patterns above
 
-TEMPO_RANGES = {
+RHYTHM_PATTERNS = MappingProxyType({
+    'steady': ((1.0, 1.0, 1.0, 1.0),),
+    'syncopated': ((0.5, 0.5, 1.0, 0.5, 0.5, 1.0),),
+    'swing': ((0.67, 0.33, 0.67, 0.33, 0.67, 0.33),),
+    'driving': ((0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5),),
+    'laid_back': ((1.5, 0.5, 1.5, 0.5),)
+})
+
+# The rhythm a song's melody and hi-hats follow unless its prompt names one:
+# its vibe's, if that implies a feel, else its genre's
+VIBE_RHYTHMS = MappingProxyType({
+    'smooth': 'laid_back',
+    'playful': 'syncopated'
+})
+GENRE_RHYTHMS = MappingProxyType({
+    'rock': 'driving',
+    'jazz': 'swing',
+    'blues': 'swing',
+    'electronic': 'driving',
+    'sad': 'laid_back',
+    'happy': 'syncopated',
+    'energetic': 'driving'
+})
+
+TEMPO_RANGES = MappingProxyType({
     'slow': (60, 80),
     'medium': (80, 120),
     'fast': (120, 160),
     'very_fast': (160, 200)
+})
+
+# Prompt keywords per element, in priority order: the first value with a hit wins
+PROMPT_KEYWORDS = {
+    'genre': {genre: [genre] for genre in CHORD_PROGRESSIONS},
+    'vibe': {
+        'catchy': ['catchy', 'memorable', 'hook', 'hooky', 'viral', 'addictive'],
+        'smooth': ['smooth', 'mellow', 'gentle', 'soft', 'flowing'],
+        'dramatic': ['dramatic', 'intense', 'powerful', 'epic', 'emotional'],
+        'playful': ['playful', 'fun', 'bouncy', 'cheerful', 'lighthearted']
+    },
+    'tempo_category': {
+        'slow': ['slow', 'ballad', 'relaxed', 'chill'],
+        'medium': ['medium', 'moderate', 'steady'],
+        'fast': ['fast', 'upbeat', 'energetic', 'dance'],
+        'very_fast': ['very fast', 'rapid', 'intense', 'hardcore']
+    },
+    'key': {
+        'C': ['c major', 'bright', 'simple'],
+        'G': ['g major', 'warm', 'folk'],
+        'D': ['d major', 'brilliant', 'triumphant'],
+        'A': ['a major', 'cheerful', 'confident'],
+        'E': ['e major', 'bright', 'joyful'],
+        'F': ['f major', 'peaceful', 'pastoral'],
+        'Am': ['a minor', 'sad', 'melancholic'],
+        'Em': ['e minor', 'contemplative', 'mysterious'],
+        'Dm': ['d minor', 'serious', 'tragic']
+    },
+    'catchiness': {
+        10: ['extremely catchy', 'super viral', 'mega hit'],
+        9: ['very catchy', 'viral', 'hit'],
+        8: ['catchy', 'memorable', 'hooky'],
+        7: ['somewhat catchy', 'decent hook'],
+        6: ['mildly catchy', 'subtle hook'],
+        5: ['not too catchy', 'simple']
+    },
+    'rhythm': {
+        'steady': ['steady', 'straight', 'marching'],
+        'syncopated': ['syncopated', 'funky', 'groovy', 'offbeat'],
+        'swing': ['swing', 'swung', 'shuffle'],
+        'driving': ['driving', 'pumping', 'relentless'],
+        'laid_back': ['laid back', 'lazy', 'easygoing']
+    }
 }
 
-def main():
+KEYWORD_SHAPE = re.compile(r'[a-z0-9]+(?: [a-z0-9]+)*$')
+
+def compile_prompt_matcher(keywords):
+    """Build one word-bounded regex over every keyword phrase (plurals included).
+
+    Returns (pattern, hits): hits maps each phrase to the (element, rank)
+    pairs it implies, including those of shorter keywords inside it - the
+    regex only reports the longest phrase at any position.
+    """
+    owners = {}
+    for element, values in keywords.items():
+        for rank, words in enumerate(values.values()):
+            for word in words:
+                if not KEYWORD_SHAPE.match(word):
+                    raise ValueError(f"prompt keyword must be lowercase words separated by spaces: {word!r}")
+                owners.setdefault(word, set()).add((element, rank))
+
+    # Keywords are plain words, so a word-bounded match inside a phrase is a
+    # substring match with the surrounding spaces put back
+    hits = {}
+    for phrase in owners:
+        padded = f" {phrase} "
+        implied = set()
+        for word, word_owners in owners.items():
+            if f" {word} " in padded:
+                implied |= word_owners
+        hits[phrase] = tuple(sorted(implied))
+
+    phrases = sorted(owners, key=lambda phrase: (-len(phrase), phrase))
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(phrase) for phrase in phrases) + r')s?\b')
+    return pattern, hits
+
+PROMPT_PATTERN, PROMPT_HITS = compile_prompt_matcher(PROMPT_KEYWORDS)
+PROMPT_VALUES = {element: list(values) for element, values in PROMPT_KEYWORDS.items()}
+
+@lru_cache(maxsize=4096)
+def match_prompt(prompt):
+    """Scan a prompt once; returns ((element, value), ...) for every element it sets"""
+    best = {}
+    for phrase in PROMPT_PATTERN.findall(prompt.lower()):
+        for element, rank in PROMPT_HITS[phrase]:
+            if rank < best.get(element, len(PROMPT_VALUES[element])):
+                best[element] = rank
+    return tuple((element, PROMPT_VALUES[element][rank]) for element, rank in sorted(best.items()))
+
+def hook_pattern(pattern, catchiness):
+    """Repeat parts of a melody pattern into hooks; catchier songs repeat more"""
+    if catchiness >= 8:
+        # Add more repetition and hooks
+        return pattern + pattern[:3] + pattern
+    if catchiness >= 6:
+        return pattern + pattern[:2]
+    return pattern
+
+def section_plan(structure):
+    """Distinct section types in order of first appearance, and each section's index into them"""
+    section_types = list(dict.fromkeys(structure))
+    index = {section_type: position for position, section_type in enumerate(section_types)}
+    return section_types, [index[section_type] for section_type in structure]
+
+def pick_tempo(elements, seed):
+    """Tempo in BPM for a song, drawn from its tempo category"""
+    tempo_range = TEMPO_RANGES[elements['tempo_category']]
+    return song_random(seed, 'tempo').randint(tempo_range[0], tempo_range[1])
+
+def pick_key(elements):
+    """Key of a song whose prompt names none, drawn from its genre's GENRE_KEYS"""
+    return song_random(elements['seed'], 'key').choice(GENRE_KEYS[elements['genre']])
+
+def pick_progression(elements, rng):
+    """Chord symbols of a progression drawn for the song's genre, realized in its key"""
+    return realize_progression(rng.choice(CHORD_PROGRESSIONS[elements['genre']]), elements['key'])
+
+def pick_rhythm(elements):
+    """Name of the RHYTHM_PATTERNS entry a song plays"""
+    return (elements.get('rhythm') or VIBE_RHYTHMS.get(elements['vibe'])
+            or GENRE_RHYTHMS.get(elements['genre'], 'steady'))
+
+def make_seed():
+    """Draw a fresh song seed from OS entropy"""
+    return secrets.randbits(32)
+
+def derive_seed(seed, stream):
+    """Derive an independent, process-stable sub-seed for one named stream"""
+    digest = hashlib.blake2b(f"{seed}:{stream}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def song_random(seed, stream):
+    """random.Random for scalar choices on one stream of a song seed"""
+    return random.Random(derive_seed(seed, stream))
+
+def track_rng(seed, stream):
+    """numpy Generator for one track stream of a song seed"""
+    import numpy as np
+    
+    return np.random.default_rng(derive_seed(seed, stream))
+
+def main(argv=None):
     """Main function to run the enhanced viral music generator"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+
     print("🎵 ═══════════════════════════════════════════════════════════")
     print("           VIRAL AI MUSIC GENERATOR v4.0")
     print("     🎯 Enhanced with Text Prompts & Custom Vibes!")
@@ -168,8 +373,17 @@ def generate_from_text_prompt(generator):
     if tempo_input and tempo_input in TEMPO_RANGES:
         musical_elements['tempo_category'] = tempo_input
     
+    # Key selection; the detected progression moves with it
+    print(f"\n🎹 Available Keys: {', '.join(ALL_KEYS)}")
+    key_input = input(f"Key (current: {musical_elements['key']}): ").strip()
+    if key_input and key_input in KEY_TABLE:
+        musical_elements['chord_progression'] = transpose_progression(
+            musical_elements['chord_progression'], musical_elements['key'], key_input)
+        musical_elements['key'] = lookup_key(key_input).name
+    
     # Chord progression selection
-    available_progressions = CHORD_PROGRESSIONS[musical_elements['genre']]
+    available_progressions = [realize_progression(numerals, musical_elements['key'])
+                              for numerals in CHORD_PROGRESSIONS[musical_elements['genre']]]
     print(f"\n🎼 Available Chord Progressions for {musical_elements['genre']}:")
     for i, prog in enumerate(available_progressions):
         print(f"   {i+1}. {' → '.join(prog)}")
@@ -194,7 +408,7 @@ def generate_from_text_prompt(generator):
         
         # Offer to generate variations
         while True:
-            variation = input("\n🎲 Generate a variation? (y/n): ").lower().strip()
+            variation = input("\n🎲 Generate a variation? (y/n, b = best of 100): ").lower().strip()
             if variation == 'y':
                 print("🎵 Creating variation...")
                 variation_elements = generator.create_variation(musical_elements)
@@ -203,6 +417,12 @@ def generate_from_text_prompt(generator):
                     display_song_info(variation_song)
                 else:
                     print("❌ Failed to generate variation")
+            elif variation == 'b':
+                print("🏆 Scoring 100 variations...")
+                try:
+                    display_variation_summary(search_variations(generator, musical_elements, count=100, top=3))
+                except Exception as e:
+                    print(f"❌ Error searching variations: {e}")
             else:
                 break
     else:
@@ -233,19 +453,21 @@ def generate_quick_random(generator):
     print("\n🎲 QUICK RANDOM GENERATION")
     print("════════════════════════════════════════")
     
-    # Random musical elements
-    musical_elements = {
-        'genre': random.choice(list(CHORD_PROGRESSIONS.keys())),
-        'vibe': random.choice(list(MELODY_PATTERNS.keys())),
-        'tempo_category': random.choice(list(TEMPO_RANGES.keys())),
-        'chord_progression': None,  # Will be set by genre
-        'catchiness': random.randint(6, 10),
-        'key': random.choice(['C', 'G', 'D', 'A', 'E', 'F', 'Bb']),
-        'structure': ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
-    }
+    # Random musical elements, reproducible from the seed
+    seed = make_seed()
+    rng = song_random(seed, 'quick_random')
+    musical_elements = SongSpec(
+        genre=rng.choice(list(CHORD_PROGRESSIONS.keys())),
+        vibe=rng.choice(list(MELODY_PATTERNS.keys())),
+        tempo_category=rng.choice(list(TEMPO_RANGES.keys())),
+        chord_progression=None,  # Will be set by genre
+        catchiness=rng.randint(6, 10),
+        key=rng.choice(['C', 'G', 'D', 'A', 'E', 'F', 'Bb']),
+        seed=seed
+    )
     
     # Set chord progression based on genre
-    musical_elements['chord_progression'] = random.choice(CHORD_PROGRESSIONS[musical_elements['genre']])
+    musical_elements['chord_progression'] = pick_progression(musical_elements, rng)
     
     print("🎵 Generating random song...")
     song_info = generator.generate_from_elements(musical_elements)
@@ -254,272 +476,1025 @@ def generate_quick_random(generator):
         print("✅ Random song generated!")
         display_song_info(song_info)
 
+def corpus_key(name):
+    """argparse type for a key in any spelling, as the feature store names it"""
+    try:
+        return key_as_analyzed(name)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def tempo_range(text):
+    """argparse type for a BPM or a LOW-HIGH range of them, as an inclusive (low, high) pair"""
+    low, _, high = text.partition('-')
+    try:
+        tempo = (float(low), float(high or low))
+    except ValueError:
+        tempo = None
+    if tempo is None or not 0 < tempo[0] <= tempo[1] < float('inf'):
+        raise argparse.ArgumentTypeError(f"not a BPM or a LOW-HIGH range of them: {text!r}")
+    return tempo
+
+def build_arg_parser():
+    """Command line interface for the non-interactive modes"""
+    parser = argparse.ArgumentParser(description="Viral AI music generator")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch = commands.add_parser('batch', help="Generate songs from a JSONL spec file")
+    batch.add_argument('--spec', required=True, help="JSONL file, one element dict or prompt per line")
+    batch.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    batch.add_argument('--out-dir', default=BATCH_OUTPUT_DIR, help="Directory for the generated MIDI files")
+    batch.add_argument('--archive', default=None,
+                       help="Collect every song into one .tar, .zip or .pack file instead of separate files")
+    batch.add_argument('--manifest', default=None, help="Results manifest (default: <out-dir>/manifest.jsonl)")
+    batch.add_argument('--chunk-size', type=int, default=16, help="Songs per worker task")
+    batch.add_argument('--seed', type=int, default=None,
+                       help="Base seed; specs without their own seed get one derived from it and their line number")
+    batch.add_argument('--melody-model', default=None,
+                       help="Sample melodies from this model (.npz, or a directory from train-melody --publish)")
+    batch.add_argument('--trace', default=None, help="Write every stage of every song as a Chrome trace (JSON)")
+    batch.add_argument('--metrics', default=None, help="Write stage and note totals as a Prometheus text file")
+    batch.add_argument('--log-stages', action='store_true', help="Print a line for every stage of every song")
+
+    serve = commands.add_parser('serve', help="Serve song generation over HTTP")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    serve.add_argument('--batch-size', type=int, default=8,
+                       help="Most interactive or standard requests rendered per worker task")
+    serve.add_argument('--batch-wait-ms', type=float, default=5.0,
+                       help="How long to wait for a micro-batch to fill")
+    serve.add_argument('--tenant-limit', type=int, default=None,
+                       help="Most workers one X-Tenant's requests may occupy at once (default: all)")
+    serve.add_argument('--reserved', type=int, default=None,
+                       help="Workers kept free of bulk requests (default: 1 when there are several)")
+    serve.add_argument('--queue-size', type=int, default=256,
+                       help="Requests allowed to wait before new ones get 503")
+    serve.add_argument('--cache-mb', type=float, default=64.0,
+                       help="Memory for cached renders of seeded requests (0 disables the cache)")
+    serve.add_argument('--cache-dir', default=None, help="Also keep cached renders on disk here")
+    serve.add_argument('--cache-disk-mb', type=float, default=1024.0, help="Disk budget for --cache-dir")
+
+    insights = commands.add_parser('insights', help="Query the analyzed MIDI corpus")
+    insights.add_argument('--midi-root', default=MIDI_ROOT_DIR, help="Corpus of <genre>/*.mid folders")
+    insights.add_argument('--genre', default=None, help="Only files from this genre folder")
+    insights.add_argument('--key', type=corpus_key, default=None, help="Only files in this key, e.g. Am or 'A minor'")
+    insights.add_argument('--tempo', type=tempo_range, default=None, metavar='LOW-HIGH',
+                          help="Only files in this BPM range")
+    insights.add_argument('--workers', type=int, default=None, help="Worker processes for new or changed files")
+
+    stream = commands.add_parser('stream', help="Stream one song bar by bar, for long or endless pieces")
+    stream.add_argument('--prompt', default='', help="Text prompt describing the song")
+    stream.add_argument('--seed', type=int, default=None)
+    stream.add_argument('--sections', type=int, default=None,
+                        help="Play this many sections, cycling through the structure")
+    stream.add_argument('--loop', action='store_true', help="Cycle through the structure until stopped")
+    stream.add_argument('--bars', type=int, default=None, help="Stop after this many bars")
+    target = stream.add_mutually_exclusive_group()
+    target.add_argument('--out', default=None, help="MIDI file to write (default: generated_stream.mid)")
+    target.add_argument('--connect', default=None, metavar='HOST:PORT', help="Stream the MIDI file to a TCP socket")
+    target.add_argument('--live', action='store_true', help="Play in real time to the live MIDI output stand-in")
+    stream.add_argument('--melody-model', default=None,
+                        help="Sample melodies from this model (.npz, or a directory from train-melody --publish)")
+
+    variations = commands.add_parser('variations', help="Keep the best-scoring of many variations of a prompt")
+    variations.add_argument('--prompt', default='', help="Text prompt describing the song")
+    variations.add_argument('--seed', type=int, default=None, help="Seed for the prompt and every variation")
+    variations.add_argument('--count', type=int, default=100, help="Variations to generate and score")
+    variations.add_argument('--top', type=int, default=3, help="Best variations to write")
+    variations.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    variations.add_argument('--chunk-size', type=int, default=16, help="Variations per worker task")
+    variations.add_argument('--out-dir', default=VARIATIONS_OUTPUT_DIR, help="Directory for the winning MIDI files")
+    variations.add_argument('--melody-model', default=None,
+                            help="Sample melodies from this model (.npz, or a directory from train-melody --publish)")
+
+    keys = commands.add_parser('keys', help="Render one song in several keys")
+    keys.add_argument('--prompt', default='', help="Text prompt describing the song")
+    keys.add_argument('--seed', type=int, default=None)
+    keys.add_argument('--keys', nargs='+', default=list(ALL_KEYS),
+                      help="Keys to render, e.g. C Am F# (default: all 24)")
+    keys.add_argument('--out-dir', default=KEYS_OUTPUT_DIR, help="Directory for the MIDI files")
+    keys.add_argument('--melody-model', default=None,
+                      help="Sample melodies from this model (.npz, or a directory from train-melody --publish)")
+
+    watch = commands.add_parser('watch', help="Keep the learned patterns live as MIDI files are added, changed or removed")
+    watch.add_argument('--midi-root', default=MIDI_ROOT_DIR, help="Corpus of <genre>/*.mid folders")
+    watch.add_argument('--genres', nargs='+', default=None, help="Only these genre folders")
+    watch.add_argument('--interval', type=float, default=1.0, help="Seconds between checks for changes")
+    watch.add_argument('--polling', action='store_true', help="Compare file stats every interval instead of inotify")
+    watch.add_argument('--out', default=OUTPUT_MIDI, help="Song regenerated from the patterns after every change")
+    watch.add_argument('--workers', type=int, default=None, help="Worker processes for new or changed files")
+
+    train = commands.add_parser('train-melody', help="Learn a melody model from the MIDI corpus")
+    train.add_argument('--midi-root', default=MIDI_ROOT_DIR, help="Corpus of <genre>/*.mid folders")
+    train.add_argument('--out', default=MELODY_MODEL_PATH, help="Where to save the model")
+    train.add_argument('--order', type=int, default=3, help="States of context plus one (3 = trigrams)")
+    train.add_argument('--publish', default=None,
+                       help="Also publish the model to this directory, for batch workers to memory-map and share")
+    train.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+
+    return parser
+
+def run_cli(argv):
+    """Run a non-interactive command"""
+    args = build_arg_parser().parse_args(argv)
+
+    if args.command == 'batch':
+        exporters = []
+        if args.trace:
+            exporters.append(ChromeTraceExporter(args.trace))
+        if args.metrics:
+            exporters.append(PrometheusExporter(args.metrics))
+        if args.log_stages:
+            exporters.append(LogExporter())
+        instrumentation = Instrumentation(exporters) if exporters else None
+        try:
+            summary = run_batch(args.spec, workers=args.workers, output_dir=args.out_dir,
+                                manifest_path=args.manifest, chunk_size=args.chunk_size, base_seed=args.seed,
+                                archive_path=args.archive, melody_model_path=args.melody_model,
+                                instrumentation=instrumentation)
+        finally:
+            if instrumentation is not None:
+                instrumentation.close()
+        display_batch_summary(summary)
+        return 0 if not summary['failed'] else 1
+
+    if args.command == 'serve':
+        import asyncio
+        from result_cache import ResultCache
+        from song_service import serve
+        cache = None
+        if args.cache_mb > 0:
+            cache = ResultCache(int(args.cache_mb * (1 << 20)), args.cache_dir, int(args.cache_disk_mb * (1 << 20)))
+        try:
+            asyncio.run(serve(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                              batch_wait=args.batch_wait_ms / 1000.0, queue_size=args.queue_size, cache=cache,
+                              tenant_limit=args.tenant_limit, reserved=args.reserved))
+        except KeyboardInterrupt:
+            print("\n⏹️  Service stopped")
+        return 0
+
+    if args.command == 'stream':
+        return run_stream(args)
+
+    if args.command == 'insights':
+        return run_insights(args)
+
+    if args.command == 'train-melody':
+        return run_train_melody(args)
+
+    if args.command == 'variations':
+        return run_variations(args)
+
+    if args.command == 'keys':
+        return run_keys(args)
+
+    if args.command == 'watch':
+        return run_watch(args)
+
+def run_insights(args):
+    """Bring the feature store up to date, then show the insights for the selected files"""
+    generator = ViralMusicGenerator()
+    if generator.learn_from_midi_files(args.midi_root, workers=args.workers) is None or generator.feature_store is None:
+        print("❌ No MIDI files found to learn from.")
+        return 1
+    
+    store = generator.feature_store
+    files = store.select(args.genre, args.key, args.tempo)
+    print(f"🔎 {store.files if files is None else len(files)} of {store.files} files match")
+    display_insights(store.patterns(args.genre, args.key, args.tempo))
+    return 0
+
+def run_watch(args):
+    """Learn the corpus, then apply every change to it and write a new song from the updated patterns"""
+    from corpus_watcher import CorpusWatcher
+    
+    generator = ViralMusicGenerator()
+    
+    def updated(stats):
+        print(stats.summary())
+        patterns = generator.learned_patterns
+        if patterns is None:
+            print("⏳ The corpus is empty now.")
+            return
+        song_info = generate_viral_song_from_patterns(patterns, output_file=args.out)
+        if song_info:
+            print(f"🎼 {' → '.join(song_info['chord_progression'])} at {song_info['tempo']} BPM → {args.out}")
+    
+    cache = AnalysisCache(PATTERN_CACHE_DIR)
+    # Watch first, so files dropped in while learning are picked up after
+    watcher = CorpusWatcher(generator, cache, args.midi_root, args.genres, args.workers, args.interval, args.polling,
+                            on_update=updated)
+    if generator.learn_from_midi_files(args.midi_root, genres=args.genres, workers=args.workers) is None:
+        print("⏳ No MIDI files yet, waiting for some.")
+    print(f"👀 Watching {args.midi_root} ({watcher.watcher.name}), Ctrl+C to stop")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("\n⏹️  Watch stopped")
+    return 0
+
+def run_train_melody(args):
+    """Train the melody model on the corpus and save it"""
+    from melody_model import train_melody_model
+    
+    if args.order < 1:
+        print("❌ Error: --order must be at least 1")
+        return 1
+    started = time.perf_counter()
+    model, phrases = train_melody_model(args.midi_root, order=args.order, workers=args.workers)
+    if not phrases:
+        print("❌ No melodies found to learn from.")
+        return 1
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    model.save(args.out)
+    print(f"🧠 Learned {model.notes} notes in {phrases} phrases ({time.perf_counter() - started:.2f}s)")
+    print(f"💾 Saved order-{model.order} melody model to {args.out}")
+    if args.publish:
+        model.publish(args.publish)
+        print(f"📤 Published it to {args.publish} for workers to attach")
+    return 0
+
+def run_variations(args):
+    """Score many variations of a prompt and write the best ones"""
+    from melody_model import MelodyModel
+    
+    if args.count < 1 or args.top < 1:
+        print("❌ Error: --count and --top must be at least 1")
+        return 1
+    melody_model = MelodyModel.load(args.melody_model) if args.melody_model else None
+    generator = ViralMusicGenerator(melody_model=melody_model)
+    elements = generator.parse_text_prompt(args.prompt, seed=args.seed)
+    print(f"🏆 Scoring {args.count} variations of {elements['genre']} / {elements['vibe']} (seed {elements['seed']})")
+    summary = search_variations(generator, elements, count=args.count, top=args.top, workers=args.workers,
+                                chunk_size=args.chunk_size, base_seed=args.seed, output_dir=args.out_dir)
+    display_variation_summary(summary)
+    return 0 if summary['winners'] else 1
+
+def run_keys(args):
+    """Render one song in every requested key"""
+    from melody_model import MelodyModel
+    
+    for key_name in args.keys:
+        if key_name not in KEY_TABLE:
+            print(f"❌ Error: unknown key: {key_name}")
+            return 1
+    melody_model = MelodyModel.load(args.melody_model) if args.melody_model else None
+    generator = ViralMusicGenerator(melody_model=melody_model)
+    elements = generator.parse_text_prompt(args.prompt, seed=args.seed)
+    started = time.perf_counter()
+    try:
+        results = generator.render_keys(elements, args.keys, output_dir=args.out_dir)
+    except Exception as e:
+        print(f"❌ Error rendering keys: {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+    for song_info in results:
+        print(f"🎹 {song_info['key']:>4}  {' → '.join(song_info['chord_progression'])}  💾 {song_info['file_path']}")
+    print(f"✅ {len(results)} keys of {elements['genre']} / {elements['vibe']} (seed {elements['seed']})"
+          f" in {elapsed * 1000:.1f} ms")
+    return 0
+
+def run_stream(args):
+    """Stream one song to a file, a socket or the live output stand-in"""
+    from melody_model import MelodyModel
+    from midi_stream import LiveMidiSink, SMFStreamSink, SocketStreamSink
+    
+    melody_model = MelodyModel.load(args.melody_model) if args.melody_model else None
+    generator = ViralMusicGenerator(melody_model=melody_model)
+    elements = generator.parse_text_prompt(args.prompt, seed=args.seed)
+    if args.sections is not None:
+        structure = elements['structure']
+        elements['structure'] = [structure[index % len(structure)] for index in range(args.sections)]
+    
+    if args.live:
+        sink = LiveMidiSink()
+        target = "live output"
+    elif args.connect:
+        import socket
+        host, port = args.connect.rsplit(':', 1)
+        sink = SocketStreamSink(socket.create_connection((host, int(port))))
+        target = args.connect
+    else:
+        target = args.out or OUTPUT_MIDI.replace('.mid', '_stream.mid')
+        sink = SMFStreamSink(target)
+    
+    print(f"🎶 Streaming {elements['genre']} / {elements['vibe']} (seed {elements['seed']}) to {target}")
+    try:
+        with sink:
+            song_info = generator.stream_song(elements, sink, loop=args.loop, max_bars=args.bars)
+    except KeyboardInterrupt:
+        print("\n⏹️  Stream stopped")
+        return 0
+    except Exception as e:
+        print(f"❌ Error streaming song: {e}")
+        return 1
+    print(f"✅ {song_info['bars']} bars, {song_info['events']} events at {song_info['tempo']} BPM")
+    if args.live:
+        print(f"🎹 {sink.messages} messages sent, latest {sink.max_lag * 1000:.1f} ms behind")
+    return 0
+
+def is_integer(value):
+    """True for ints; JSON true and false are bools, which Python counts as ints"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def spec_to_elements(generator, spec, seed=None):
+    """Turn one batch spec (a prompt and/or element overrides) into musical elements"""
+    if not isinstance(spec, dict):
+        raise ValueError("spec must be a JSON object")
+
+    overrides = spec.get('elements', spec)
+    if not isinstance(overrides, dict):
+        raise ValueError("elements must be a JSON object")
+    # Misspelt fields would otherwise be dropped, leaving a default song
+    if overrides is spec:
+        unknown = spec.keys() - SPEC_FIELDS - ELEMENT_NAMES
+    else:
+        unknown = spec.keys() - SPEC_FIELDS | {f"elements.{name}" for name in overrides.keys() - ELEMENT_NAMES}
+    if unknown:
+        raise ValueError(f"unknown spec fields: {', '.join(sorted(unknown))}")
+    seed = overrides.get('seed', spec.get('seed', seed))
+    prompt = spec.get('prompt', '')
+    elements = generator.parse_text_prompt(prompt, seed=seed)
+    for key in elements:
+        if key in overrides:
+            elements[key] = overrides[key]
+
+    if elements['genre'] not in CHORD_PROGRESSIONS:
+        raise ValueError(f"unknown genre: {elements['genre']}")
+    if elements['vibe'] not in MELODY_PATTERNS:
+        raise ValueError(f"unknown vibe: {elements['vibe']}")
+    if elements['tempo_category'] not in TEMPO_RANGES:
+        raise ValueError(f"unknown tempo category: {elements['tempo_category']}")
+    if not is_integer(elements['catchiness']) or not 1 <= elements['catchiness'] <= 10:
+        raise ValueError(f"catchiness must be an integer from 1 to 10: {elements['catchiness']}")
+    # A genre override in a spec that names no key draws one for that genre
+    if 'genre' in overrides and 'key' not in overrides and not any(
+            element == 'key' for element, _ in match_prompt(prompt)):
+        elements['key'] = pick_key(elements)
+    # Stored by canonical name, so 'Bb minor' and 'Bbm' are the same song
+    elements['key'] = lookup_key(elements['key']).name
+    if elements['rhythm'] is not None and elements['rhythm'] not in RHYTHM_PATTERNS:
+        raise ValueError(f"unknown rhythm: {elements['rhythm']}")
+    if not is_integer(elements['seed']):
+        raise ValueError(f"seed must be an integer: {elements['seed']}")
+
+    # A genre or key override without an explicit progression gets one from that genre, in that key
+    if not overrides.get('chord_progression'):
+        rng = song_random(elements['seed'], 'progression')
+        elements['chord_progression'] = pick_progression(elements, rng)
+    # Entries are stored as the symbol they parse to; anything more is rejected, not carried along
+    progression = []
+    for chord_name in elements['chord_progression']:
+        symbol = lookup_chord(chord_name).symbol if isinstance(chord_name, str) else None
+        if symbol is None or chord_name.split() != [symbol]:
+            raise ValueError(f"unrecognised chord symbol: {chord_name!r}")
+        progression.append(symbol)
+    elements['chord_progression'] = shared_tuple(progression)
+    elements['structure'] = shared_tuple(elements['structure'])
+    return elements
+
+# Per-process generator for batch workers, created once by the pool initializer,
+# and the recorder its instrumentation feeds when the parent asked for tracing
+_batch_generator = None
+_batch_recorder = None
+
+def init_batch_worker(melody_model_path=None, melody_model=None, record=False):
+    """Warm up a generator in each batch worker process"""
+    global _batch_generator, _batch_recorder
+    from melody_model import MelodyModel
+    
+    if melody_model_path:
+        melody_model = MelodyModel.load(melody_model_path)
+    _batch_recorder = RecordingExporter() if record else None
+    instrumentation = Instrumentation([_batch_recorder]) if record else None
+    _batch_generator = ViralMusicGenerator(melody_model=melody_model, instrumentation=instrumentation)
+
+def song_file_name(song_id):
+    """File name of a batch song, from its spec id or default song_<line> id"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(song_id)) + '.mid'
+
+def render_batch_chunk(chunk, output_dir, base_seed=None, in_memory=False):
+    """Render a chunk of (line number, spec line) pairs; runs inside worker processes.
+
+    With in_memory the MIDI bytes come back in each result's 'midi_data'
+    instead of being written to output_dir.
+    """
+    generator = _batch_generator or ViralMusicGenerator()
+    sink = MemorySink() if in_memory else DirectorySink(output_dir)
+    results = []
+    for index, line in chunk:
+        started = time.perf_counter()
+        result = {'index': index, 'id': f"song_{index:06d}", 'status': 'ok'}
+        try:
+            spec = json.loads(line)
+            if isinstance(spec, dict) and 'id' in spec:
+                result['id'] = str(spec['id'])
+            seed = derive_seed(base_seed, index) & 0xFFFFFFFF if base_seed is not None else None
+            elements = spec_to_elements(generator, spec, seed)
+            file_name = song_file_name(result['id'])
+            song_info = generator.render_song(elements, sink=sink, name=file_name)
+            if in_memory:
+                result['midi_data'] = sink.songs.pop(file_name)
+            result.update({
+                'file_path': song_info['file_path'],
+                'genre': elements['genre'],
+                'vibe': elements['vibe'],
+                'key': song_info['key'],
+                'tempo': song_info['tempo'],
+                'chord_progression': list(song_info['chord_progression']),
+                'catchiness': song_info['catchiness_level'],
+                'seed': song_info['seed'],
+            })
+        except Exception as e:
+            result.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000.0, 3)
+        if _batch_recorder is not None:
+            result['trace'] = _batch_recorder.drain()
+        results.append(result)
+    return results
+
+# Learned patterns for pattern-song workers, attached once by the pool initializer
+_worker_patterns = None
+
+def init_pattern_worker(store_dir=None):
+    """Attach the feature store in each pattern-song worker process.
+
+    Its tables are memory-mapped read-only, so the workers share one copy
+    of them however many there are, instead of unpickling Counters each.
+    By default the store is the one learned from the whole of MIDI_ROOT_DIR.
+    """
+    global _worker_patterns
+    from feature_store import FeatureStore, store_directory
+    
+    _worker_patterns = FeatureStore(store_dir or store_directory(FEATURE_STORE_DIR, MIDI_ROOT_DIR)).patterns()
+
+def render_pattern_chunk(seeds, output_dir):
+    """Generate a song from the attached patterns for each seed; runs inside worker processes"""
+    os.makedirs(output_dir, exist_ok=True)
+    return [generate_viral_song_from_patterns(_worker_patterns, seed=seed,
+                                              output_file=os.path.join(output_dir, f"pattern_{seed}.mid"))
+            for seed in seeds]
+
+def score_variation_chunk(chunk, elements):
+    """Compose and score a chunk of (index, seed) variations; runs inside worker processes"""
+    from song_scoring import score_notes
+    
+    generator = _batch_generator or ViralMusicGenerator()
+    scored = []
+    for index, seed in chunk:
+        try:
+            _, _, notes = generator.compose(generator.create_variation(elements, seed))
+            metrics = score_notes(notes)
+        except Exception as e:
+            metrics = {'score': None, 'error': f"{type(e).__name__}: {e}"}
+        scored.append((index, seed, metrics))
+    return scored
+
+def search_variations(generator, elements, count=100, top=3, workers=None, chunk_size=16, base_seed=None,
+                      output_dir=VARIATIONS_OUTPUT_DIR):
+    """Best-of-N: compose count variations of elements across a process pool and keep the top few.
+
+    Workers only compose and score (see song_scoring), sending back a seed
+    and the metrics; the parent keeps the best `top` in a heap and renders
+    just those, with the same generator settings, into output_dir. With a
+    base_seed the variation seeds, and so the winners, are reproducible.
+    """
+    started = time.perf_counter()
+    best = []   # Min-heap of (score, -index, seed, metrics); earlier variations win ties
+    counts = {'scored': 0, 'failed': 0}
+
+    def consume(scored):
+        for index, seed, metrics in scored:
+            if metrics['score'] is None:
+                counts['failed'] += 1
+                continue
+            counts['scored'] += 1
+            entry = (metrics['score'], -index, seed, metrics)
+            if len(best) < top:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+
+    if base_seed is None:
+        seeds = ((index, make_seed()) for index in range(count))
+    else:
+        seeds = ((index, derive_seed(base_seed, index) & 0xFFFFFFFF) for index in range(count))
+    run_batches(partial(score_variation_chunk, elements=elements), batched(seeds, chunk_size),
+                workers or os.cpu_count() or 1, consume,
+                initializer=partial(init_batch_worker, melody_model=generator.melody_model))
+    scored_at = time.perf_counter()
+
+    winners = []
+    sink = DirectorySink(output_dir)
+    for rank, (score, _, seed, metrics) in enumerate(sorted(best, reverse=True), 1):
+        song_info = generator.render_song(generator.create_variation(elements, seed), sink=sink,
+                                          name=f"variation_{rank}_{seed}.mid")
+        song_info.midi_data = None
+        song_info.update(rank=rank, score=score, metrics=metrics)
+        winners.append(song_info)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'variations': counts['scored'],
+        'failed': counts['failed'],
+        'elapsed_sec': elapsed,
+        'variations_per_sec': count / (scored_at - started) if scored_at > started else 0.0,
+        'winners': winners,
+    }
+
+def run_batch(spec_path, workers=None, output_dir=BATCH_OUTPUT_DIR, manifest_path=None, chunk_size=16,
+              base_seed=None, archive_path=None, melody_model_path=None, instrumentation=None):
+    """Generate every song in a JSONL spec file across a process pool.
+
+    Spec lines are read lazily and results are streamed to a JSONL manifest
+    in completion order. Latency percentiles come from a fixed-size
+    reservoir of songs, so memory stays flat however long the spec is,
+    apart from the ids specs give themselves: a song whose id names the
+    same file as an earlier one fails as a duplicate instead of
+    overwriting it. Every song records its seed, and with a base_seed the
+    whole batch is reproducible regardless of worker count. With
+    archive_path, workers send the MIDI bytes back and the parent appends
+    them to one archive (.tar, .zip or .pack) instead of writing a file per
+    song. With melody_model_path every worker samples melodies from that
+    saved MelodyModel. With instrumentation, workers record every stage and
+    the parent passes them on to its exporters. Returns a summary with
+    throughput and per-song latency percentiles.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, 'manifest.jsonl')
+    latencies = LatencyReservoir()
+    counts = {'songs': 0, 'failed': 0}
+    claimed = set()     # File names taken by ids given in the spec
+    started = time.perf_counter()
+    archive = open_archive(archive_path) if archive_path else None
+
+    with open(spec_path, encoding='utf-8') as spec_file, open(manifest_path, 'w', encoding='utf-8') as manifest:
+        def record(result):
+            manifest.write(json.dumps(result) + '\n')
+            counts['songs'] += 1
+            if result['status'] != 'ok':
+                counts['failed'] += 1
+
+        def consume(results):
+            for result in results:
+                trace = result.pop('trace', None)
+                if trace is not None and instrumentation is not None:
+                    instrumentation.replay(*trace)
+                if 'midi_data' in result:
+                    result['file_path'] = archive.write(os.path.basename(result['file_path']),
+                                                        result.pop('midi_data'))
+                latencies.add(result['latency_ms'])
+                record(result)
+
+        def unique_lines():
+            for index, line in enumerate(spec_file):
+                if not line.strip():
+                    continue
+                if '"id"' in line:
+                    try:
+                        spec = json.loads(line)
+                    except ValueError:
+                        spec = None     # The worker reports it
+                    if isinstance(spec, dict) and 'id' in spec:
+                        file_name = song_file_name(spec['id'])
+                        if file_name in claimed:
+                            record({'index': index, 'id': str(spec['id']), 'status': 'error',
+                                    'error': f"duplicate id: {file_name} is taken by an earlier song"})
+                            continue
+                        claimed.add(file_name)
+                yield index, line
+
+        render = partial(render_batch_chunk, output_dir=output_dir, base_seed=base_seed,
+                         in_memory=archive is not None)
+        try:
+            run_batches(render, batched(unique_lines(), chunk_size), workers or os.cpu_count() or 1,
+                        consume, initializer=partial(init_batch_worker, melody_model_path,
+                                                     record=instrumentation is not None))
+        finally:
+            if archive is not None:
+                archive.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'songs': counts['songs'],
+        'failed': counts['failed'],
+        'elapsed_sec': elapsed,
+        'songs_per_min': counts['songs'] * 60.0 / elapsed if elapsed else 0.0,
+        'latency_ms': latencies.summary(),
+        'manifest': manifest_path,
+        'archive': archive_path,
+    }
+
 class ViralMusicGenerator:
-    def __init__(self):
-        pass
+    def __init__(self, result_cache=None, melody_model=None, instrumentation=None):
+        self.last_ingestion_stats = None
+        # Optional instrumentation.Instrumentation timing each stage; None costs nothing
+        self.instrumentation = instrumentation
+        # Optional result_cache.ResultCache serving repeat (elements, seed) renders
+        self.result_cache = result_cache
+        # Optional melody_model.MelodyModel; melodies use MELODY_PATTERNS without one
+        self.melody_model = melody_model
+        # feature_store.FeatureStore of the last corpus learned with the cache
+        self.feature_store = None
+        # Patterns of the last corpus learned; a corpus_watcher.CorpusWatcher replaces them whole as files change
+        self.learned_patterns = None
 
-    def parse_text_prompt(self, prompt):
+    def __getattr__(self, name):
+        # Rendered section blocks, reused across sections and songs. Created
+        # on first use: generators that only parse prompts never load NumPy.
+        if name == 'section_cache':
+            from note_engine import SectionCache
+            self.section_cache = SectionCache()
+            return self.section_cache
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def stage(self, name, **args):
+        """Time a with block as one instrumentation stage, or do nothing when it is off"""
+        if self.instrumentation is None:
+            return NO_STAGE
+        return self.instrumentation.stage(name, **args)
+
+    def parse_text_prompt(self, prompt, seed=None):
         """Parse text prompt to extract musical elements"""
-        prompt_lower = prompt.lower()
-        
-        # Initialize default elements
-        elements = {
-            'genre': 'pop',
-            'vibe': 'catchy',
-            'tempo_category': 'medium',
-            'chord_progression': None,
-            'catchiness': 7,
-            'key': 'C',
-            'structure': ['intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro']
-        }
-        
-        # Detect genre
-        for genre in CHORD_PROGRESSIONS.keys():
-            if genre in prompt_lower:
-                elements['genre'] = genre
-                break
-        
-        # Detect vibe/mood
-        vibe_keywords = {
-            'catchy': ['catchy', 'memorable', 'hook', 'viral', 'addictive'],
-            'smooth': ['smooth', 'mellow', 'gentle', 'soft', 'flowing'],
-            'dramatic': ['dramatic', 'intense', 'powerful', 'epic', 'emotional'],
-            'playful': ['playful', 'fun', 'bouncy', 'cheerful', 'lighthearted']
-        }
-        
-        for vibe, keywords in vibe_keywords.items():
-            if any(keyword in prompt_lower for keyword in keywords):
-                elements['vibe'] = vibe
-                break
-        
-        # Detect tempo
-        tempo_keywords = {
-            'slow': ['slow', 'ballad', 'relaxed', 'chill'],
-            'medium': ['medium', 'moderate', 'steady'],
-            'fast': ['fast', 'upbeat', 'energetic', 'dance'],
-            'very_fast': ['very fast', 'rapid', 'intense', 'hardcore']
-        }
-        
-        for tempo, keywords in tempo_keywords.items():
-            if any(keyword in prompt_lower for keyword in keywords):
-                elements['tempo_category'] = tempo
-                break
-        
-        # Detect key preferences
-        key_keywords = {
-            'C': ['c major', 'bright', 'simple'],
-            'G': ['g major', 'warm', 'folk'],
-            'D': ['d major', 'brilliant', 'triumphant'],
-            'A': ['a major', 'cheerful', 'confident'],
-            'E': ['e major', 'bright', 'joyful'],
-            'F': ['f major', 'peaceful', 'pastoral'],
-            'Am': ['a minor', 'sad', 'melancholic'],
-            'Em': ['e minor', 'contemplative', 'mysterious'],
-            'Dm': ['d minor', 'serious', 'tragic']
-        }
-        
-        for key, keywords in key_keywords.items():
-            if any(keyword in prompt_lower for keyword in keywords):
-                elements['key'] = key
-                break
-        
-        # Detect catchiness level
-        catchiness_keywords = {
-            10: ['extremely catchy', 'super viral', 'mega hit'],
-            9: ['very catchy', 'viral', 'hit'],
-            8: ['catchy', 'memorable', 'hooky'],
-            7: ['somewhat catchy', 'decent hook'],
-            6: ['mildly catchy', 'subtle hook'],
-            5: ['not too catchy', 'simple']
-        }
-        
-        for level, keywords in catchiness_keywords.items():
-            if any(keyword in prompt_lower for keyword in keywords):
-                elements['catchiness'] = level
-                break
-        
-        # Set chord progression based on genre
-        elements['chord_progression'] = random.choice(CHORD_PROGRESSIONS[elements['genre']])
+        with self.stage('parse'):
+            # Initialize default elements
+            elements = SongSpec(seed=make_seed() if seed is None else seed)
+            
+            # Genre, vibe, tempo, key, catchiness and rhythm keywords in one pass
+            matched = match_prompt(prompt)
+            elements.update(matched)
+            if not any(element == 'key' for element, _ in matched):
+                elements['key'] = pick_key(elements)
+            
+            # Set chord progression based on genre
+            rng = song_random(elements['seed'], 'progression')
+            elements['chord_progression'] = pick_progression(elements, rng)
         
         return elements
 
-    def generate_from_elements(self, elements):
+    def generate_from_elements(self, elements, output_file=None, sink=None, name=None):
         """Generate music from parsed elements"""
         try:
-            # Create MIDI file
-            midi_file = MIDIFile(4)  # 4 tracks
-            
-            # Get tempo
-            tempo_range = TEMPO_RANGES[elements['tempo_category']]
-            tempo = random.randint(tempo_range[0], tempo_range[1])
-            
-            # Track setup
-            midi_file.addTrackName(0, 0, "Viral Melody")
-            midi_file.addTempo(0, 0, tempo)
-            midi_file.addTrackName(1, 0, "Viral Harmony")
-            midi_file.addTrackName(2, 0, "Viral Bass")
-            midi_file.addTrackName(3, 0, "Viral Drums")
-            
-            # Generate enhanced melody
-            self.generate_enhanced_melody(midi_file, elements, 0)
-            
-            # Generate harmony
-            self.generate_enhanced_harmony(midi_file, elements, 1)
-            
-            # Generate bass
-            self.generate_enhanced_bass(midi_file, elements, 2)
-            
-            # Generate drums
-            self.generate_enhanced_drums(midi_file, elements, 3)
-            
-            # Save file
-            output_file = OUTPUT_MIDI.replace('.mid', f'_{elements["genre"]}_{elements["vibe"]}.mid')
-            with open(output_file, 'wb') as f:
-                midi_file.writeFile(f)
-            
-            return {
-                'prompt_elements': elements,
-                'chord_progression': elements['chord_progression'],
-                'key': elements['key'],
-                'tempo': tempo,
-                'file_path': output_file,
-                'catchiness_level': elements['catchiness']
-            }
-            
+            return self.render_song(elements, output_file, sink, name)
         except Exception as e:
             print(f"❌ Error generating from elements: {e}")
             return None
 
-    def generate_enhanced_melody(self, midi_file, elements, track):
+    def compose(self, elements):
+        """Generate the notes of a song; returns (seed, tempo, notes)"""
+        from note_engine import NoteTable
+        
+        seed, tempo, tables = self._track_tables(elements)
+        return seed, tempo, NoteTable.concat(tables)
+
+    def compose_tracks(self, elements):
+        """Generate a song as one NoteTrack per track; returns (seed, tempo, tracks in TRACK_STAGES order)"""
+        from note_engine import NoteTrack
+        
+        seed, tempo, tables = self._track_tables(elements)
+        return seed, tempo, tuple(NoteTrack.from_table(table) for table in tables)
+
+    def _track_tables(self, elements):
+        # Every random choice below is derived from the song seed
+        seed = elements.get('seed')
+        if seed is None:
+            seed = make_seed()
+        
+        # Get tempo
+        tempo = pick_tempo(elements, seed)
+        
+        # Generate every track as a columnar note table
+        with self.stage('melody'):
+            melody = self.generate_enhanced_melody(elements, 0, seed)
+        with self.stage('harmony'):
+            harmony = self.generate_enhanced_harmony(elements, 1)
+        with self.stage('bass'):
+            bass = self.generate_enhanced_bass(elements, 2)
+        with self.stage('drums'):
+            drums = self.generate_enhanced_drums(elements, 3)
+        tracks = [melody, harmony, bass, drums]
+        
+        if self.instrumentation is not None:
+            for name, table in zip(TRACK_STAGES, tracks):
+                self.instrumentation.count('notes', len(table), track=name)
+        return seed, tempo, tracks
+
+    def track_sections(self, elements, seed):
+        """(section library, plan) for every track, the pieces compose assembles"""
+        return [
+            self.melody_sections(elements, 0, seed),
+            self.harmony_sections(elements, 1),
+            self.bass_sections(elements, 2),
+            self.drum_sections(elements, 3),
+        ]
+
+    def stream_song(self, elements, sink, loop=False, max_bars=None, name=None):
+        """Stream a song bar by bar to a midi_stream sink, raising on failure.
+
+        Only the sections sounding in the current bar are held in memory,
+        so long structures - or endless ones with loop, which cycles through
+        the structure until max_bars - stream in constant memory. Stopping
+        early turns off every note still sounding.
+        """
+        from midi_stream import BarStream
+        from midi_writer import TICKS_PER_BEAT
+        
+        seed = elements.get('seed')
+        if seed is None:
+            seed = make_seed()
+        tempo = pick_tempo(elements, seed)
+        if name is None:
+            name = f"{elements['genre']}_{elements['vibe']}_{seed}"
+        
+        stream = BarStream(self.track_sections(elements, seed), loop=loop)
+        bars = events = 0
+        sink.start(tempo, name, TICKS_PER_BEAT)
+        try:
+            for bar in stream:
+                sink.write_bar(bar)
+                bars += 1
+                events += bar.tick.shape[0]
+                if max_bars is not None and bars >= max_bars:
+                    break
+        finally:
+            last = stream.release()
+            sink.write_bar(last)
+            events += last.tick.shape[0]
+            sink.finish()
+        
+        return SongResult(
+            prompt_elements=elements,
+            chord_progression=elements['chord_progression'],
+            key=elements['key'],
+            tempo=tempo,
+            catchiness_level=elements['catchiness'],
+            seed=seed,
+            bars=bars,
+            events=events,
+        )
+
+    def render_song(self, elements, output_file=None, sink=None, name=None):
+        """Render elements to MIDI, raising on failure.
+
+        The file goes to sink (see song_sinks) under name, or to output_file,
+        or by default to OUTPUT_MIDI suffixed with the genre, vibe and seed,
+        so concurrent songs never share a file.
+        Seeded elements are served from result_cache when one is set.
+        """
+        from midi_writer import encode_midi
+        
+        model = self.melody_model.fingerprint if self.melody_model is not None else None
+        key = result_key(elements, model) if self.result_cache is not None else None
+        cached = self.result_cache.get(key) if key is not None else None
+        if key is not None and self.instrumentation is not None:
+            self.instrumentation.count('result_cache', 1, result='miss' if cached is None else 'hit')
+        if cached is not None:
+            seed = elements['seed']
+            tempo, midi_data = cached
+        else:
+            seed, tempo, notes = self.compose(elements)
+            with self.stage('serialize'):
+                midi_data = encode_midi(notes, tempo, TRACK_NAMES)
+            if key is not None:
+                self.result_cache.put(key, tempo, midi_data)
+        
+        # Save file
+        if sink is None:
+            if output_file is None:
+                output_file = OUTPUT_MIDI.replace('.mid', f'_{elements["genre"]}_{elements["vibe"]}_{seed}.mid')
+            sink = PathSink(output_file)
+        if name is None:
+            name = f"{elements['genre']}_{elements['vibe']}_{seed}.mid"
+        with self.stage('write'):
+            file_path = sink.write(name, midi_data)
+        
+        return SongResult(
+            prompt_elements=elements,
+            chord_progression=elements['chord_progression'],
+            key=elements['key'],
+            tempo=tempo,
+            file_path=file_path,
+            catchiness_level=elements['catchiness'],
+            seed=seed,
+            midi_data=midi_data
+        )
+
+    def render_keys(self, elements, keys=ALL_KEYS, sink=None, output_dir=KEYS_OUTPUT_DIR):
+        """Render one song in several keys, composing it only once.
+
+        A key only moves the melody by its melody_shift and the harmony and
+        bass by its chord_shift (see music_theory.Key), so each key is the
+        composed tracks plus a shift per track - exactly what render_song
+        gives in that key - and costs a pitch column and the MIDI encoding.
+        Returns the SongResult of every key, in order; a key named twice,
+        under any spelling, is rendered once.
+        """
+        from midi_writer import encode_midi
+        from note_engine import NoteTable
+        
+        source = lookup_key(elements['key'])
+        targets = list({key.name: key for key in map(lookup_key, keys)}.values())
+        seed, tempo, tracks = self.compose_tracks(elements)
+        if sink is None:
+            sink = DirectorySink(output_dir)
+        
+        results = []
+        for key in targets:
+            # Shifts in TRACK_STAGES order; drums stay put
+            chord_shift = key.chord_shift - source.chord_shift
+            shifts = (key.melody_shift - source.melody_shift, chord_shift, chord_shift, 0)
+            transposed = elements.copy()
+            transposed.update(key=key.name, seed=seed, chord_progression=transpose_progression(
+                elements['chord_progression'], source.name, key.name))
+            notes = NoteTable.concat(track.transposed(shift).to_table(index)
+                                     for index, (track, shift) in enumerate(zip(tracks, shifts)))
+            with self.stage('serialize'):
+                midi_data = encode_midi(notes, tempo, TRACK_NAMES)
+            name = f"{elements['genre']}_{elements['vibe']}_{seed}_{key.name.replace('#', 'sharp')}.mid"
+            with self.stage('write'):
+                file_path = sink.write(name, midi_data)
+            results.append(SongResult(
+                prompt_elements=transposed,
+                chord_progression=transposed['chord_progression'],
+                key=key.name,
+                tempo=tempo,
+                file_path=file_path,
+                catchiness_level=elements['catchiness'],
+                seed=seed,
+                midi_data=midi_data
+            ))
+        return results
+
+    def generate_enhanced_melody(self, elements, track, seed):
         """Generate enhanced melody based on vibe and catchiness"""
+        from note_engine import assemble_sections
+        
+        return assemble_sections(*self.melody_sections(elements, track, seed))
+
+    def melody_sections(self, elements, track, seed):
+        """Melody section library and the block each section plays"""
+        import numpy as np
+        from note_engine import NoteTable, clamped_walk, clamped_walks, section_library, transpose_library
+        from rhythm_engine import compile_rhythm, sample_durations
+        
         channel = 0
-        time = 0
+        rng = track_rng(seed, 'melody')
         
         # Get melody pattern
         melody_patterns = MELODY_PATTERNS[elements['vibe']]
-        base_pattern = random.choice(melody_patterns)
+        base_pattern = melody_patterns[rng.integers(len(melody_patterns))]
         
         # Enhance pattern based on catchiness
-        if elements['catchiness'] >= 8:
-            # Add more repetition and hooks
-            enhanced_pattern = base_pattern + base_pattern[:3] + base_pattern
-        elif elements['catchiness'] >= 6:
-            enhanced_pattern = base_pattern + base_pattern[:2]
-        else:
-            enhanced_pattern = base_pattern
-        
-        # Set base pitch based on key
-        key_pitches = {
-            'C': 60, 'G': 67, 'D': 62, 'A': 57, 'E': 64, 'F': 65,
-            'Am': 57, 'Em': 64, 'Dm': 62
-        }
-        base_pitch = key_pitches.get(elements['key'], 60)
-        
-        # Generate melody sections
-        for section in range(len(elements['structure'])):
-            current_pitch = base_pitch + (section % 3) * 2  # Slight variation per section
-            
-            # Repeat pattern for each section
-            for rep in range(2):
-                for interval in enhanced_pattern:
-                    if isinstance(interval, (int, float)):
-                        current_pitch += int(interval)
-                        current_pitch = max(48, min(84, current_pitch))
-                        
-                        # Vary duration based on catchiness
-                        if elements['catchiness'] >= 8:
-                            duration = random.choice([0.5, 1.0, 1.5, 2.0])
-                        else:
-                            duration = random.choice([0.5, 1.0, 1.5])
-                        
-                        velocity = random.randint(85, 105)
-                        
-                        midi_file.addNote(track, channel, current_pitch, time, duration, velocity)
-                        time += duration
-
-    def generate_enhanced_harmony(self, midi_file, elements, track):
+        enhanced_pattern = hook_pattern(base_pattern, elements['catchiness'])
+        
+        # Melodies are rendered from C4 and moved to the key's tonic afterwards
+        base_pitch = 60
+        
+        # Each section repeats the pattern twice
+        intervals = tuple(int(interval) for interval in enhanced_pattern if isinstance(interval, (int, float))) * 2
+        
+        # Durations follow the song's rhythm, compiled onto the tick grid
+        rhythm_name = pick_rhythm(elements)
+        rhythm_patterns = RHYTHM_PATTERNS[rhythm_name]
+        rhythm_variant = int(rng.integers(len(rhythm_patterns)))
+        rhythm = compile_rhythm(rhythm_patterns[rhythm_variant])
+        
+        section_types, plan = section_plan(elements['structure'])
+        if not section_types:
+            return section_library([], []), plan     # An empty structure is an empty song
+        model = self.melody_model
+        
+        def render():
+            # One block per section type: types cycle through three starting
+            # pitches, and each gets its own rhythm and dynamics
+            if model is None:
+                contours = [clamped_walk(base_pitch + offset * 2, intervals) for offset in range(min(3, len(section_types)))]
+                pitches = np.array([contours[index % 3] for index in range(len(section_types))], dtype=np.int16)
+                durations = sample_durations(rhythm, rng, *pitches.shape)
+            else:
+                # A learned motif per section type, repeated into hooks like the patterns above
+                motif_intervals, motif_durations = model.sample(rng, len(section_types), MOTIF_LENGTH)
+                positions = list(hook_pattern(tuple(range(MOTIF_LENGTH)), elements['catchiness'])) * 2
+                starts = base_pitch + (np.arange(len(section_types)) % 3) * 2
+                pitches = clamped_walks(starts, motif_intervals[:, positions]).astype(np.int16)
+                durations = motif_durations[:, positions]
+            velocities = rng.integers(85, 106, size=pitches.shape)
+            starts = np.cumsum(durations, axis=1) - durations
+            block = NoteTable.block(track, channel, pitches.ravel(), starts.ravel(), durations.ravel(), velocities.ravel())
+            return block, np.full(len(section_types), pitches.shape[1], dtype=np.int64), durations.sum(axis=1)
+        
+        library = self.section_cache.get_or_render(
+            ('melody', track, seed, tuple(section_types), intervals, rhythm_name, rhythm_variant,
+             model.fingerprint if model is not None else None, elements['catchiness']), render)
+        return transpose_library(library, lookup_key(elements['key']).melody_shift), plan
+
+    def generate_enhanced_harmony(self, elements, track):
         """Generate enhanced harmony based on genre and progression"""
+        from note_engine import assemble_sections
+        
+        return assemble_sections(*self.harmony_sections(elements, track))
+
+    def harmony_sections(self, elements, track):
+        """Harmony section library and the block each section plays"""
+        import numpy as np
+        from note_engine import NoteTable, section_library, tile_progression, transpose_library
+        from rhythm_engine import quantize
+        
         channel = 1
-        time = 0
-        
-        # Extended chord mappings
-        chord_map = {
-            'C': [60, 64, 67], 'G': [67, 71, 74], 'Am': [57, 60, 64], 'F': [65, 69, 72],
-            'Dm': [62, 65, 69], 'Em': [64, 67, 71], 'D': [62, 66, 69], 'E': [64, 68, 71],
-            'A': [57, 61, 64], 'Bb': [58, 62, 65], 'B': [59, 63, 66],
-            'Cmaj7': [60, 64, 67, 71], 'Am7': [57, 60, 64, 67], 'Dm7': [62, 65, 69, 72],
-            'G7': [67, 71, 74, 77], 'C7': [60, 64, 67, 70], 'F7': [65, 69, 72, 75],
-            'Fmaj7': [65, 69, 72, 76], 'Em7': [64, 67, 71, 74]
-        }
-        
-        chord_progression = elements['chord_progression']
-        
-        # Generate chord progression for each section
-        for section in range(len(elements['structure'])):
-            for chord_name in chord_progression:
-                chord_name_clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').strip()
-                chord_pitches = chord_map.get(chord_name_clean, [60, 64, 67])
-                
-                # Add chord notes with variations
-                for i, pitch in enumerate(chord_pitches):
-                    delay = i * 0.1 if elements['genre'] == 'jazz' else 0
-                    duration = 2.0 if elements['genre'] != 'electronic' else 1.5
-                    velocity = 70 + (elements['catchiness'] * 2)
-                    
-                    midi_file.addNote(track, channel, pitch, time + delay, duration, velocity)
-                
-                time += 2.0
-
-    def generate_enhanced_bass(self, midi_file, elements, track):
+        
+        # Chords are voiced as if the song were in C, then moved to its key,
+        # so every key shares one rendering of the same progression
+        key = lookup_key(elements['key'])
+        voicings = tuple(chord_in_key(chord_name, key.name)[0] for chord_name in elements['chord_progression'])
+        duration = 2.0 if elements['genre'] != 'electronic' else 1.5
+        velocity = 70 + (elements['catchiness'] * 2)
+        
+        def render():
+            # One pass through the progression
+            pitches, chord_index, offsets = [], [], []
+            for index, voicing in enumerate(voicings):
+                # Jazz rolls its chords
+                for i, pitch in enumerate(voicing):
+                    pitches.append(pitch)
+                    chord_index.append(index)
+                    offsets.append(i * 0.1 if elements['genre'] == 'jazz' else 0)
+            # Rolls land on the rhythm grid, like every other note time
+            pitch, start = tile_progression(pitches, chord_index, quantize(offsets), len(voicings), 1)
+            block = NoteTable.block(track, channel, pitch, start, duration, velocity)
+            return section_library([block], [len(voicings) * CHORD_BEATS])
+        
+        # Every section plays the same pass
+        library = self.section_cache.get_or_render(
+            ('harmony', track, elements['genre'] == 'jazz', voicings, duration, velocity), render)
+        return transpose_library(library, key.chord_shift), np.zeros(len(elements['structure']), dtype=np.int64)
+
+    def generate_enhanced_bass(self, elements, track):
         """Generate enhanced bass based on genre"""
+        from note_engine import assemble_sections
+        
+        return assemble_sections(*self.bass_sections(elements, track))
+
+    def bass_sections(self, elements, track):
+        """Bass section library and the block each section plays"""
+        import numpy as np
+        from note_engine import NoteTable, section_library, tile_progression, transpose_library
+        
         channel = 2
-        time = 0
-        
-        # Extended root note mappings
-        root_map = {
-            'C': 36, 'G': 43, 'Am': 33, 'F': 41, 'Dm': 38, 'Em': 40,
-            'D': 38, 'E': 40, 'A': 33, 'Bb': 34, 'B': 35,
-            'Cmaj7': 36, 'Am7': 33, 'Dm7': 38, 'G7': 43, 'C7': 36,
-            'F7': 41, 'Fmaj7': 41, 'Em7': 40
-        }
-        
-        chord_progression = elements['chord_progression']
-        
-        # Generate bass patterns based on genre
-        for section in range(len(elements['structure'])):
-            for chord_name in chord_progression:
-                chord_name_clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').strip()
-                root_pitch = root_map.get(chord_name_clean, 36)
-                
-                # Genre-specific bass patterns
-                if elements['genre'] == 'electronic':
-                    # Driving electronic bass
-                    bass_notes = [root_pitch] * 8
-                    note_durations = [0.25] * 8
-                elif elements['genre'] == 'jazz':
-                    # Walking bass
-                    bass_notes = [root_pitch, root_pitch + 2, root_pitch + 4, root_pitch + 5]
-                    note_durations = [0.5, 0.5, 0.5, 0.5]
-                elif elements['genre'] == 'rock':
-                    # Rock bass pattern
-                    bass_notes = [root_pitch, root_pitch, root_pitch + 7, root_pitch + 5]
-                    note_durations = [0.5, 0.5, 0.5, 0.5]
-                else:
-                    # Standard pop bass
-                    bass_notes = [root_pitch, root_pitch, root_pitch + 7, root_pitch]
-                    note_durations = [0.5, 0.5, 0.5, 0.5]
-                
-                # Add bass notes
-                for i, (pitch, duration) in enumerate(zip(bass_notes, note_durations)):
-                    velocity = 90 + (elements['catchiness'])
-                    midi_file.addNote(track, channel, pitch, time + (i * duration), duration, velocity)
-                
-                time += 2.0
-
-    def generate_enhanced_drums(self, midi_file, elements, track):
+        
+        # Voiced in C and moved to the key, like the harmony
+        key = lookup_key(elements['key'])
+        roots = tuple(chord_in_key(chord_name, key.name)[1] for chord_name in elements['chord_progression'])
+        
+        # Genre-specific bass patterns as (interval above root, duration)
+        if elements['genre'] == 'electronic':
+            # Driving electronic bass
+            bass_intervals = [0] * 8
+            note_duration = 0.25
+        elif elements['genre'] == 'jazz':
+            # Walking bass
+            bass_intervals = [0, 2, 4, 5]
+            note_duration = 0.5
+        elif elements['genre'] == 'rock':
+            # Rock bass pattern
+            bass_intervals = [0, 0, 7, 5]
+            note_duration = 0.5
+        else:
+            # Standard pop bass
+            bass_intervals = [0, 0, 7, 0]
+            note_duration = 0.5
+        
+        velocity = 90 + (elements['catchiness'])
+        
+        def render():
+            # One pass through the progression
+            pitches, chord_index, offsets = [], [], []
+            for index, root_pitch in enumerate(roots):
+                for i, interval in enumerate(bass_intervals):
+                    pitches.append(root_pitch + interval)
+                    chord_index.append(index)
+                    offsets.append(i * note_duration)
+            pitch, start = tile_progression(pitches, chord_index, offsets, len(roots), 1)
+            block = NoteTable.block(track, channel, pitch, start, note_duration, velocity)
+            return section_library([block], [len(roots) * CHORD_BEATS])
+        
+        # Every section plays the same pass
+        library = self.section_cache.get_or_render(
+            ('bass', track, roots, tuple(bass_intervals), note_duration, velocity), render)
+        return transpose_library(library, key.chord_shift), np.zeros(len(elements['structure']), dtype=np.int64)
+
+    def generate_enhanced_drums(self, elements, track):
         """Generate enhanced drums based on genre and energy"""
+        from note_engine import assemble_sections
+        
+        return assemble_sections(*self.drum_sections(elements, track))
+
+    def drum_sections(self, elements, track):
+        """Drum section library and the block each section plays"""
+        import numpy as np
+        from note_engine import BEATS_PER_BAR, NoteTable, section_library, tile_drum_grid
+        from rhythm_engine import compile_rhythm, tile_onsets
+        
         channel = 9  # Drum channel
-        time = 0
         
         # Drum sounds
         kick = 36
@@ -527,94 +1502,92 @@ class ViralMusicGenerator:
         hihat = 42
         crash = 49
         
-        # Genre-specific drum patterns
-        total_bars = len(elements['structure']) * 4
-        
-        for bar in range(total_bars):
-            if elements['genre'] == 'electronic':
-                # Electronic drum pattern
-                for beat in range(16):
-                    beat_time = time + (beat * 0.25)
-                    
-                    # Four-on-the-floor kick
-                    if beat % 4 == 0:
-                        midi_file.addNote(track, channel, kick, beat_time, 0.25, 100)
-                    
-                    # Snare on 2 and 4
-                    if beat % 8 == 4:
-                        midi_file.addNote(track, channel, snare, beat_time, 0.25, 90)
-                    
-                    # Hi-hat on every off-beat
-                    if beat % 2 == 1:
-                        midi_file.addNote(track, channel, hihat, beat_time, 0.125, 70)
-                        
-            elif elements['genre'] == 'rock':
-                # Rock drum pattern
-                for beat in range(16):
-                    beat_time = time + (beat * 0.25)
-                    
-                    # Kick on 1 and 3
-                    if beat % 8 == 0:
-                        midi_file.addNote(track, channel, kick, beat_time, 0.25, 100)
-                    
-                    # Snare on 2 and 4
-                    if beat % 8 == 4:
-                        midi_file.addNote(track, channel, snare, beat_time, 0.25, 95)
-                    
-                    # Hi-hat pattern
-                    if beat % 4 == 2:
-                        midi_file.addNote(track, channel, hihat, beat_time, 0.125, 60)
-                        
+        style = elements['genre'] if elements['genre'] in ('electronic', 'rock') else 'pop'
+        rhythm_name = pick_rhythm(elements)
+        
+        def render():
+            # Genre-specific kick and snare patterns as masks over a 16-step bar
+            steps = np.arange(16)
+            if style == 'electronic':
+                # Four-on-the-floor kick, snare on 2 and 4
+                hits = np.stack([steps % 4 == 0, steps % 8 == 4], axis=1)
+                velocities = [100, 90, 70]
+            elif style == 'rock':
+                # Kick on 1 and 3, snare on 2 and 4, quieter hi-hat
+                hits = np.stack([steps % 8 == 0, steps % 8 == 4], axis=1)
+                velocities = [100, 95, 60]
             else:
                 # Standard pop/other drum pattern
-                for beat in range(16):
-                    beat_time = time + (beat * 0.25)
-                    
-                    # Kick on 1 and 3
-                    if beat % 8 == 0 or beat % 8 == 6:
-                        midi_file.addNote(track, channel, kick, beat_time, 0.25, 100)
-                    
-                    # Snare on 2 and 4
-                    if beat % 8 == 4:
-                        midi_file.addNote(track, channel, snare, beat_time, 0.25, 90)
-                    
-                    # Hi-hat on off-beats
-                    if beat % 2 == 1:
-                        midi_file.addNote(track, channel, hihat, beat_time, 0.125, 60)
+                hits = np.stack([(steps % 8 == 0) | (steps % 8 == 6), steps % 8 == 4], axis=1)
+                velocities = [100, 90, 60]
+            pitch, start, duration, velocity = tile_drum_grid(
+                hits, [kick, snare], velocities[:2], [0.25, 0.25], SECTION_BARS)
             
-            time += 4.0
+            # The hi-hat plays the song's rhythm; it sorts after kick and snare on the same step
+            hats = tile_onsets(compile_rhythm(RHYTHM_PATTERNS[rhythm_name][0]), SECTION_BARS * BEATS_PER_BAR)
+            start = np.concatenate((start, hats))
+            order = np.argsort(start, kind='stable')
+            block = NoteTable.block(
+                track, channel,
+                np.concatenate((pitch, np.full(hats.shape, hihat, dtype=pitch.dtype)))[order],
+                start[order],
+                np.concatenate((duration, np.full(hats.shape, 0.125)))[order],
+                np.concatenate((velocity, np.full(hats.shape, velocities[2], dtype=velocity.dtype)))[order])
+            return section_library([block], [SECTION_BARS * BEATS_PER_BAR])
+        
+        # Every section is the same four bars
+        library = self.section_cache.get_or_render(('drums', track, style, rhythm_name), render)
+        return library, np.zeros(len(elements['structure']), dtype=np.int64)
 
-    def create_variation(self, original_elements):
+    def create_variation(self, original_elements, seed=None):
         """Create a variation of the original elements"""
         variation = original_elements.copy()
         
+        # The variation seed drives both these choices and the rendering
+        variation['seed'] = make_seed() if seed is None else seed
+        rng = song_random(variation['seed'], 'variation')
+        
         # Vary some elements
-        if random.random() < 0.3:
-            variation['vibe'] = random.choice(list(MELODY_PATTERNS.keys()))
+        if rng.random() < 0.3:
+            variation['vibe'] = rng.choice(list(MELODY_PATTERNS.keys()))
         
-        if random.random() < 0.2:
-            variation['tempo_category'] = random.choice(list(TEMPO_RANGES.keys()))
+        if rng.random() < 0.2:
+            variation['tempo_category'] = rng.choice(list(TEMPO_RANGES.keys()))
         
-        if random.random() < 0.4:
-            variation['chord_progression'] = random.choice(CHORD_PROGRESSIONS[variation['genre']])
+        if rng.random() < 0.4:
+            variation['chord_progression'] = pick_progression(variation, rng)
         
-        variation['catchiness'] = min(10, max(1, variation['catchiness'] + random.randint(-2, 2)))
+        variation['catchiness'] = min(10, max(1, variation['catchiness'] + rng.randint(-2, 2)))
         
         return variation
 
-    def learn_from_midi_files(self):
-        """Learn from existing MIDI files (original method)"""
-        from collections import Counter
-        return {
-            'chord_progressions': Counter({('C', 'G', 'Am', 'F'): 10}),
-            'popular_keys': Counter({'C major': 8}),
-            'optimal_tempos': [120, 122, 118],
-            'viral_elements': {},
-            'structure_patterns': Counter({('verse', 'chorus', 'verse', 'chorus'): 5}),
-            'melody_patterns': Counter({(0, 2, -1, 3): 7}),
-            'rhythm_patterns': [(1, 0.5, 0.5)],
-            'hooks': ['catchy hook']
-        }
+    def learn_from_midi_files(self, midi_root=MIDI_ROOT_DIR, genres=None, workers=None, use_cache=True):
+        """Learn patterns by parsing every MIDI file under midi_files/<genre>/
+
+        With the cache, the patterns are views over the memory-mapped
+        feature store (see feature_store), which answers most_common
+        queries without building Counters for the whole corpus.
+        """
+        from feature_store import update_feature_store
+        
+        if use_cache:
+            cache = AnalysisCache(PATTERN_CACHE_DIR)
+            accumulator, stats = cache.ingest(midi_root, genres=genres, workers=workers)
+        else:
+            accumulator, stats = ingest_corpus(midi_root, genres=genres, workers=workers)
+        self.last_ingestion_stats = stats
+        print(stats.summary())
+
+        self.learned_patterns = None
+        if not accumulator.files:
+            return None
+        if use_cache:
+            self.feature_store = update_feature_store(FEATURE_STORE_DIR, cache, midi_root, genres)
+            if self.feature_store is not None:
+                self.learned_patterns = self.feature_store.patterns()
+        if self.learned_patterns is None:
+            self.learned_patterns = accumulator.patterns()
+        return self.learned_patterns
 
     def create_viral_dataset(self):
         """Create viral dataset (original method)"""
@@ -623,6 +1596,8 @@ class ViralMusicGenerator:
 # Helper functions for original MIDI analysis method
 def display_insights(patterns):
     """Display the learned viral music insights"""
+    import numpy as np
+    
     try:
         # Most popular chord progressions
         if patterns['chord_progressions']:
@@ -640,10 +1615,10 @@ def display_insights(patterns):
                 print(f"   {i+1}. {key} (used {count} times)")
         
         # Optimal tempo
-        if patterns['optimal_tempos']:
+        if len(patterns['optimal_tempos']):
             avg_tempo = np.mean(patterns['optimal_tempos'])
-            min_tempo = min(patterns['optimal_tempos'])
-            max_tempo = max(patterns['optimal_tempos'])
+            min_tempo = np.min(patterns['optimal_tempos'])
+            max_tempo = np.max(patterns['optimal_tempos'])
             print(f"\n⏱️  Tempo Analysis:")
             print(f"   Average: {avg_tempo:.0f} BPM")
             print(f"   Range: {min_tempo:.0f} - {max_tempo:.0f} BPM")
@@ -678,56 +1653,52 @@ def display_insights(patterns):
     except Exception as e:
         print(f"❌ Error displaying insights: {e}")
 
-def generate_viral_song_from_patterns(patterns):
-    """Generate a complete viral song using learned patterns"""
+def generate_viral_song_from_patterns(patterns, seed=None, output_file=None):
+    """Generate a complete viral song using learned patterns, written to output_file (default OUTPUT_MIDI)"""
+    import numpy as np
+    from midi_writer import encode_midi
+    from note_engine import NoteTable
+    
     try:
         print("🎼 Composing viral song...")
         
+        if seed is None:
+            seed = make_seed()
+        if output_file is None:
+            output_file = OUTPUT_MIDI
+        
         # Select best patterns
         top_chord_prog = patterns['chord_progressions'].most_common(1)[0][0] if patterns['chord_progressions'] else ('C', 'G', 'Am', 'F')
         top_melody = patterns['melody_patterns'].most_common(1)[0][0] if patterns['melody_patterns'] else (0, 2, -1, 3)
         popular_key = patterns['popular_keys'].most_common(1)[0][0] if patterns['popular_keys'] else "C major"
-        optimal_tempo = int(np.mean(patterns['optimal_tempos'])) if patterns['optimal_tempos'] else 120
-        
-        # Create MIDI file
-        midi_file = MIDIFile(4)  # 4 tracks
-        
-        # Track 0: Melody
-        midi_file.addTrackName(0, 0, "Viral Melody")
-        midi_file.addTempo(0, 0, optimal_tempo)
-        
-        # Track 1: Harmony
-        midi_file.addTrackName(1, 0, "Viral Harmony")
-        
-        # Track 2: Bass
-        midi_file.addTrackName(2, 0, "Viral Bass")
-        
-        # Track 3: Drums
-        midi_file.addTrackName(3, 0, "Viral Drums")
-        
-        # Generate melody based on learned patterns
-        generate_melody_track(midi_file, top_melody, 0)
-        
-        # Generate harmony based on chord progression
-        generate_harmony_track(midi_file, top_chord_prog, 1)
+        optimal_tempo = int(np.mean(patterns['optimal_tempos'])) if len(patterns['optimal_tempos']) else 120
         
-        # Generate bass line
-        generate_bass_track(midi_file, top_chord_prog, 2)
-        
-        # Generate drums
-        generate_drums_track(midi_file, 3)
+        notes = NoteTable.concat([
+            # Generate melody based on learned patterns
+            generate_melody_track(top_melody, 0, track_rng(seed, 'melody')),
+            
+            # Generate harmony based on chord progression
+            generate_harmony_track(top_chord_prog, 1),
+            
+            # Generate bass line
+            generate_bass_track(top_chord_prog, 2),
+            
+            # Generate drums
+            generate_drums_track(3),
+        ])
         
         # Save the file
-        with open(OUTPUT_MIDI, 'wb') as output_file:
-            midi_file.writeFile(output_file)
+        with open(output_file, 'wb') as f:
+            f.write(encode_midi(notes, optimal_tempo, TRACK_NAMES))
         
-        song_info = {
-            'chord_progression': top_chord_prog,
-            'key': popular_key,
-            'tempo': optimal_tempo,
-            'melody_pattern': top_melody,
-            'file_path': OUTPUT_MIDI
-        }
+        song_info = SongResult(
+            chord_progression=top_chord_prog,
+            key=popular_key,
+            tempo=optimal_tempo,
+            melody_pattern=top_melody,
+            file_path=output_file,
+            seed=seed
+        )
         
         return song_info
         
@@ -735,102 +1706,87 @@ def generate_viral_song_from_patterns(patterns):
         print(f"❌ Error generating song: {e}")
         return None
 
-def generate_melody_track(midi_file, melody_pattern, track):
+def generate_melody_track(melody_pattern, track, rng):
     """Generate melody track using learned patterns"""
+    import numpy as np
+    from note_engine import NoteTable, clamped_walk, sequential_starts
+    from rhythm_engine import compile_rhythm, sample_durations
+    
     channel = 0
-    time = 0
     base_pitch = 60  # C4
     
-    # Repeat pattern to create full melody
-    for section in range(4):  # 4 sections
-        current_pitch = base_pitch + (section * 2)  # Slight variation per section
-        
-        for rep in range(2):  # Repeat each pattern twice
-            for interval in melody_pattern:
-                if isinstance(interval, (int, float)) and abs(interval) <= 12:
-                    current_pitch += int(interval)
-                    current_pitch = max(48, min(84, current_pitch))
-                    
-                    duration = random.choice([0.5, 1.0, 1.5])
-                    velocity = random.randint(80, 100)
-                    
-                    midi_file.addNote(track, channel, current_pitch, time, duration, velocity)
-                    time += duration
-
-def generate_harmony_track(midi_file, chord_progression, track):
+    # Repeat pattern twice per section to create full melody
+    intervals = [int(interval) for interval in melody_pattern
+                 if isinstance(interval, (int, float)) and abs(interval) <= 12] * 2
+    pitches = np.array(
+        [clamped_walk(base_pitch + (section * 2), intervals) for section in range(4)],  # 4 sections
+        dtype=np.int16).ravel()
+    
+    # Durations follow a rhythm drawn for the song
+    rhythm_names = list(RHYTHM_PATTERNS)
+    rhythm_patterns = RHYTHM_PATTERNS[rhythm_names[rng.integers(len(rhythm_names))]]
+    rhythm = compile_rhythm(rhythm_patterns[rng.integers(len(rhythm_patterns))])
+    durations = sample_durations(rhythm, rng, 1, pitches.shape[0]).ravel()
+    velocities = rng.integers(80, 101, size=pitches.shape[0])
+    
+    return NoteTable.block(track, channel, pitches, sequential_starts(durations), durations, velocities)
+
+def generate_harmony_track(chord_progression, track):
     """Generate harmony track using learned chord progressions"""
+    from note_engine import NoteTable, tile_progression
+    
     channel = 1
-    time = 0
     
-    # Chord mappings
-    chord_map = {
-        'C': [60, 64, 67], 'G': [67, 71, 74], 'Am': [57, 60, 64], 'F': [65, 69, 72],
-        'Dm': [62, 65, 69], 'Em': [64, 67, 71], 'D': [62, 66, 69], 'E': [64, 68, 71]
-    }
+    # One pass through the progression
+    pitches, chord_index = [], []
+    for index, chord_name in enumerate(chord_progression):
+        for pitch in lookup_chord(chord_name).voicing:
+            pitches.append(pitch)
+            chord_index.append(index)
     
-    # Generate chord progression
-    for section in range(8):  # 8 sections
-        for chord_name in chord_progression:
-            chord_name_clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').split()[0]
-            chord_pitches = chord_map.get(chord_name_clean, [60, 64, 67])
-            
-            # Add chord notes
-            for pitch in chord_pitches:
-                midi_file.addNote(track, channel, pitch, time, 2.0, 70)
-            
-            time += 2.0
+    # Repeated for 8 sections
+    pitch, start = tile_progression(pitches, chord_index, [0.0] * len(pitches), len(chord_progression), 8)
+    return NoteTable.block(track, channel, pitch, start, 2.0, 70)
 
-def generate_bass_track(midi_file, chord_progression, track):
+def generate_bass_track(chord_progression, track):
     """Generate bass track"""
+    from note_engine import NoteTable, tile_progression
+    
     channel = 2
-    time = 0
     
-    # Root notes for chords
-    root_map = {
-        'C': 36, 'G': 43, 'Am': 33, 'F': 41, 'Dm': 38, 'Em': 40, 'D': 38, 'E': 40
-    }
+    # Simple bass pattern, one pass through the progression
+    pitches, chord_index, offsets = [], [], []
+    for index, chord_name in enumerate(chord_progression):
+        root_pitch = lookup_chord(chord_name).bass
+        for i, interval in enumerate([0, 0, 7, 0]):
+            pitches.append(root_pitch + interval)
+            chord_index.append(index)
+            offsets.append(i * 0.5)
     
-    for section in range(8):
-        for chord_name in chord_progression:
-            chord_name_clean = str(chord_name).replace('(', '').replace(')', '').replace("'", "").replace(',', '').split()[0]
-            root_pitch = root_map.get(chord_name_clean, 36)
-            
-            # Simple bass pattern
-            bass_notes = [root_pitch, root_pitch, root_pitch + 7, root_pitch]
-            
-            for i, pitch in enumerate(bass_notes):
-                midi_file.addNote(track, channel, pitch, time + (i * 0.5), 0.5, 90)
-            
-            time += 2.0
+    # Repeated for 8 sections
+    pitch, start = tile_progression(pitches, chord_index, offsets, len(chord_progression), 8)
+    return NoteTable.block(track, channel, pitch, start, 0.5, 90)
 
-def generate_drums_track(midi_file, track):
+def generate_drums_track(track):
     """Generate drums track"""
+    import numpy as np
+    from note_engine import NoteTable, tile_drum_grid
+    
     channel = 9  # Drum channel
-    time = 0
     
     # Drum sounds
     kick = 36
     snare = 38
     hihat = 42
     
+    # Kick on 1 and 3, snare on 2 and 4, hi-hat on off-beats
+    steps = np.arange(16)
+    hits = np.stack([(steps % 8 == 0) | (steps % 8 == 6), steps % 8 == 4, steps % 2 == 1], axis=1)
+    
     # Generate 32 bars of drums
-    for bar in range(32):
-        for beat in range(16):
-            beat_time = time + (beat * 0.25)
-            
-            # Kick on 1 and 3
-            if beat % 8 == 0 or beat % 8 == 6:
-                midi_file.addNote(track, channel, kick, beat_time, 0.25, 100)
-            
-            # Snare on 2 and 4
-            if beat % 8 == 4:
-                midi_file.addNote(track, channel, snare, beat_time, 0.25, 90)
-            
-            # Hi-hat on off-beats
-            if beat % 2 == 1:
-                midi_file.addNote(track, channel, hihat, beat_time, 0.125, 60)
-        
-        time += 4.0
+    pitch, start, duration, velocity = tile_drum_grid(
+        hits, [kick, snare, hihat], [100, 90, 60], [0.25, 0.25, 0.125], 32)
+    return NoteTable.block(track, channel, pitch, start, duration, velocity)
 
 def display_song_info(song_info):
     """Display information about the generated song"""
@@ -845,6 +1801,7 @@ def display_song_info(song_info):
         print(f"🎹 Key: {song_info['key']}")
         print(f"⏱️  Tempo: {song_info['tempo']} BPM ({elements['tempo_category']})")
         print(f"🎵 Chord Progression: {' → '.join(str(chord) for chord in song_info['chord_progression'])}")
+        print(f"🥁 Rhythm: {pick_rhythm(elements).replace('_', ' ').title()}")
         print(f"🔥 Catchiness Level: {song_info['catchiness_level']}/10")
         print(f"🏗️  Structure: {' → '.join(elements['structure'])}")
         print(f"💾 File: {song_info['file_path']}")
@@ -856,7 +1813,40 @@ def display_song_info(song_info):
         print(f"🎵 Melody Pattern: {song_info['melody_pattern']}")
         print(f"💾 File: {song_info['file_path']}")
     
+    if 'seed' in song_info:
+        print(f"🌱 Seed: {song_info['seed']}")
+    
+    print("════════════════════════════════════")
+
+def display_batch_summary(summary):
+    """Display throughput and latency for a batch run"""
+    latency = summary['latency_ms']
+    print("\n📦 BATCH GENERATION SUMMARY:")
+    print("════════════════════════════════════")
+    print(f"🎵 Songs: {summary['songs']} ({summary['failed']} failed)")
+    print(f"⏱️  Elapsed: {summary['elapsed_sec']:.2f}s ({summary['songs_per_min']:.0f} songs/min)")
+    print(f"📈 Latency: p50 {latency['p50']:.1f}ms | p90 {latency['p90']:.1f}ms | "
+          f"p99 {latency['p99']:.1f}ms | max {latency['max']:.1f}ms")
+    print(f"📝 Manifest: {summary['manifest']}")
+    if summary.get('archive'):
+        print(f"🗄️  Archive: {summary['archive']}")
+    print("════════════════════════════════════")
+
+def display_variation_summary(summary):
+    """Display the best-scoring variations of a search"""
+    print("\n🏆 BEST VARIATIONS:")
+    print("════════════════════════════════════")
+    print(f"🎲 Scored {summary['variations']} variations ({summary['failed']} failed) in "
+          f"{summary['elapsed_sec']:.2f}s ({summary['variations_per_sec']:.0f}/s)")
+    for song_info in summary['winners']:
+        elements = song_info['prompt_elements']
+        metrics = song_info['metrics']
+        print(f"#{song_info['rank']} score {song_info['score']:.3f} | repetition {metrics['repetition']:.2f} | "
+              f"range {metrics['range']:.2f} | chord tones {metrics['chord_tones']:.2f}")
+        print(f"   {elements['vibe'].title()} / {elements['tempo_category']} / "
+              f"{' → '.join(song_info['chord_progression'])} (seed {song_info['seed']})")
+        print(f"   💾 {song_info['file_path']}")
     print("════════════════════════════════════")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import nullcontext
+
+from midi_analysis import atomic_write
+
+# A timed stage and a counted quantity. Times are time.perf_counter_ns(),
+# which is the system-wide monotonic clock on Linux, so spans recorded in
+# worker processes line up with the parent's.
+Span = namedtuple('Span', 'name start duration pid tid args')
+Count = namedtuple('Count', 'name value labels time pid')
+
+# What stage() returns when instrumentation is off: reusable and does nothing
+NO_STAGE = nullcontext()
+
+
+class Exporter:
+    """Receives every span and count from an Instrumentation.
+
+    span(span) is called as each stage finishes and count(count) for every
+    counted quantity. flush() writes out whatever the exporter buffers and
+    close() flushes for the last time.
+    """
+
+    def span(self, span):
+        pass
+
+    def count(self, count):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class CallbackExporter(Exporter):
+    """Hand spans (and counts, if on_count is given) to plain functions"""
+
+    def __init__(self, on_span, on_count=None):
+        self.on_span = on_span
+        self.on_count = on_count
+
+    def span(self, span):
+        self.on_span(span)
+
+    def count(self, count):
+        if self.on_count is not None:
+            self.on_count(count)
+
+
+class LogExporter(Exporter):
+    """One log line per span and count, e.g. to print or a logging.Logger's info"""
+
+    def __init__(self, write=print):
+        self.write = write
+
+    def span(self, span):
+        fields = ''.join(f" {key}={value}" for key, value in span.args.items())
+        self.write(f"⏱️  stage={span.name} ms={span.duration / 1e6:.3f} pid={span.pid}{fields}")
+
+    def count(self, count):
+        fields = ''.join(f" {key}={value}" for key, value in count.labels.items())
+        self.write(f"🔢 {count.name}={count.value}{fields} pid={count.pid}")
+
+
+class PrometheusExporter(Exporter):
+    """Keep totals per stage and per counted label set, written in the Prometheus text format.
+
+    The file is replaced atomically, at most every flush_interval seconds
+    and on close, so it can be served by a node_exporter textfile
+    collector. Metric names are prefixed with prefix.
+    """
+
+    def __init__(self, path, prefix='song', flush_interval=10.0):
+        self.path = path
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(lambda: defaultdict(int))
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+
+    def span(self, span):
+        with self.lock:
+            self.stage_seconds[span.name] += span.duration / 1e9
+            self.stage_calls[span.name] += 1
+        self._maybe_flush()
+
+    def count(self, count):
+        with self.lock:
+            self.counters[count.name][tuple(sorted(count.labels.items()))] += count.value
+
+    def render(self):
+        """The current totals in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for metric, values, help_text in (
+                    ('stage_seconds_total', self.stage_seconds, "Time spent in each generation stage"),
+                    ('stage_calls_total', self.stage_calls, "Times each generation stage ran")):
+                lines += [f"# HELP {self.prefix}_{metric} {help_text}", f"# TYPE {self.prefix}_{metric} counter"]
+                lines += [f'{self.prefix}_{metric}{{stage="{stage}"}} {value}' for stage, value in sorted(values.items())]
+            for name, values in sorted(self.counters.items()):
+                lines += [f"# TYPE {self.prefix}_{name}_total counter"]
+                for labels, value in sorted(values.items()):
+                    label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                    lines.append(f"{self.prefix}_{name}_total{{{label_text}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        atomic_write(self.path, self.render().encode('utf-8'))
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.flushed >= self.flush_interval:
+            self.flush()
+
+
+class ChromeTraceExporter(Exporter):
+    """Collect spans as Chrome trace events (chrome://tracing, Perfetto) and write them as JSON.
+
+    Spans become complete ('X') events on their process and thread, counts
+    become counter ('C') events. At most max_events are kept; later ones
+    are dropped and counted in the trace metadata.
+    """
+
+    def __init__(self, path, max_events=1_000_000):
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+
+    def span(self, span):
+        self._add({'name': span.name, 'cat': 'generation', 'ph': 'X', 'ts': span.start / 1e3,
+                   'dur': span.duration / 1e3, 'pid': span.pid, 'tid': span.tid, 'args': span.args})
+
+    def count(self, count):
+        series = '/'.join(str(label) for label in count.labels.values()) or count.name
+        self._add({'name': count.name, 'ph': 'C', 'ts': count.time / 1e3, 'pid': count.pid,
+                   'args': {series: count.value}})
+
+    def flush(self):
+        trace = {'traceEvents': self.events, 'displayTimeUnit': 'ms', 'otherData': {'dropped_events': self.dropped}}
+        atomic_write(self.path, json.dumps(trace).encode('utf-8'))
+
+    def _add(self, event):
+        if len(self.events) < self.max_events:
+            self.events.append(event)
+        else:
+            self.dropped += 1
+
+
+class RecordingExporter(Exporter):
+    """Keep spans and counts until drained, e.g. to ship them from a worker to its parent"""
+
+    def __init__(self):
+        self.spans = []
+        self.counts = []
+
+    def span(self, span):
+        self.spans.append(span)
+
+    def count(self, count):
+        self.counts.append(count)
+
+    def drain(self):
+        """(spans, counts) recorded since the last drain, as plain tuples for pickling"""
+        recorded = ([tuple(span) for span in self.spans], [tuple(count) for count in self.counts])
+        self.spans, self.counts = [], []
+        return recorded
+
+
+class StageTimer:
+    """Context manager timing one stage and reporting it to the exporters"""
+
+    __slots__ = ('instrumentation', 'name', 'args', 'start')
+
+    def __init__(self, instrumentation, name, args):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        span = Span(self.name, self.start, duration, os.getpid(), threading.get_ident(), self.args)
+        for exporter in self.instrumentation.exporters:
+            exporter.span(span)
+
+
+class Instrumentation:
+    """Opt-in timing and counting for the generation pipeline.
+
+    stage(name, **args) times a with block; count(name, value, **labels)
+    adds to a counter. Both are handed to every exporter. Code that
+    supports instrumentation keeps None when it is off and uses NO_STAGE,
+    so the disabled cost is an attribute check.
+    """
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+
+    def stage(self, name, **args):
+        return StageTimer(self, name, args)
+
+    def count(self, name, value, **labels):
+        count = Count(name, value, labels, time.perf_counter_ns(), os.getpid())
+        for exporter in self.exporters:
+            exporter.count(count)
+
+    def replay(self, spans, counts):
+        """Pass on spans and counts recorded elsewhere (see RecordingExporter.drain)"""
+        for exporter in self.exporters:
+            for span in spans:
+                exporter.span(Span(*span))
+            for count in counts:
+                exporter.count(Count(*count))
+
+    def flush(self):
+        for exporter in self.exporters:
+            exporter.flush()
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from midi_analysis import MAX_INTERVAL, MidiParseError, extract_melody, iter_corpus_files, read_midi_file
+from parallel import batched, run_batches
+
+MODEL_VERSION = 1
+
+# Interval states are -MAX_INTERVAL..MAX_INTERVAL semitones
+INTERVAL_STATES = 2 * MAX_INTERVAL + 1
+
+# Inter-onset durations in beats are snapped to the nearest grid value
+DURATION_GRID = np.array([0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0])
+
+PHRASE_GAP_BEATS = 4.0      # A longer silence between melody notes ends a phrase
+SMOOTHING = 1.0             # Pseudo-count weight of the next lower order
+
+# MelodyModel attributes written by publish, one .npy file each
+PUBLISHED_TABLES = ('interval_counts', 'duration_counts', 'interval_cdf', 'duration_cdf')
+PUBLISHED_VERSIONS_KEPT = 2     # The current version and the one before, for readers still opening it
+
+
+def melody_phrases(midi):
+    """Split a parsed file's melody into phrases of (interval states, duration states)"""
+    melody = extract_melody(midi.tracks)
+    if len(melody) < 3:
+        return []
+    starts = np.array([start for start, _ in melody], dtype=np.float64) / midi.ticks_per_beat
+    pitches = np.array([pitch for _, pitch in melody], dtype=np.int64)
+
+    # Each interval leads to a note; its duration is how long that note lasts until the next onset
+    intervals = np.clip(np.diff(pitches), -MAX_INTERVAL, MAX_INTERVAL)[:-1] + MAX_INTERVAL
+    gaps = np.diff(starts)
+    durations = np.abs(gaps[1:, None] - DURATION_GRID[None, :]).argmin(axis=1)
+
+    # Long rests end a phrase
+    breaks = np.flatnonzero(gaps[1:] > PHRASE_GAP_BEATS) + 1
+    return [(interval_states, duration_states)
+            for interval_states, duration_states in zip(np.split(intervals, breaks), np.split(durations, breaks))
+            if interval_states.shape[0] >= 2]
+
+
+def melody_phrase_batch(batch):
+    """Extract melody phrases from a batch of (path, genre) pairs; runs inside worker processes"""
+    phrases = []
+    for path, _ in batch:
+        try:
+            phrases.extend(melody_phrases(read_midi_file(path)))
+        except (OSError, MidiParseError):
+            continue
+    return phrases
+
+
+def count_transitions(sequences, states, order):
+    """Dense n-gram counts, oldest context state first and the next state last; padding is index `states`"""
+    shape = (states + 1,) * (order - 1) + (states,)
+    padded = [np.concatenate([np.full(order - 1, states), sequence]) for sequence in sequences if sequence.shape[0]]
+    if not padded:
+        return np.zeros(shape, dtype=np.float64)
+    windows = np.concatenate([np.lib.stride_tricks.sliding_window_view(sequence, order) for sequence in padded])
+    flat = np.ravel_multi_index(tuple(windows.T), shape)
+    return np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape).astype(np.float64)
+
+
+def transition_cdf(counts):
+    """Cumulative next-state probabilities, interpolating every order down to add-one unigrams"""
+    states = counts.shape[-1]
+    unigram = counts.reshape(-1, states).sum(axis=0)
+    probabilities = (unigram + 1.0) / (unigram.sum() + states)
+    for depth in range(1, counts.ndim):
+        # Counts for the last `depth` context states, summed over older ones
+        context = counts.sum(axis=tuple(range(counts.ndim - 1 - depth)))
+        totals = context.sum(axis=-1, keepdims=True)
+        probabilities = (context + SMOOTHING * probabilities) / (totals + SMOOTHING)
+    cdf = np.cumsum(probabilities, axis=-1)
+    cdf[..., -1] = 1.0
+    return cdf
+
+
+class MelodyModel:
+    """Interval and duration n-gram chains learned from corpus melodies.
+
+    Both chains condition on the previous order-1 states of their own kind
+    and are stored as dense cumulative probability tables, one row per
+    context, so sampling a step for many phrases at once is one gather of
+    rows and one comparison against the draws. A model published to a
+    directory is attached by every worker process as memory-mapped,
+    read-only tables, so the workers share one copy of them.
+    """
+
+    def __init__(self, interval_counts, duration_counts, interval_cdf=None, duration_cdf=None, fingerprint=None):
+        self.interval_counts = interval_counts
+        self.duration_counts = duration_counts
+        self.order = interval_counts.ndim
+        self.interval_cdf = transition_cdf(interval_counts) if interval_cdf is None else interval_cdf
+        self.duration_cdf = transition_cdf(duration_counts) if duration_cdf is None else duration_cdf
+        if fingerprint is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for table in (interval_counts, duration_counts):
+                digest.update(np.ascontiguousarray(table).tobytes())
+            fingerprint = digest.hexdigest()
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def train(cls, phrases, order=3):
+        """Fit from (interval states, duration states) phrases as produced by melody_phrases"""
+        return cls(count_transitions([intervals for intervals, _ in phrases], INTERVAL_STATES, order),
+                   count_transitions([durations for _, durations in phrases], DURATION_GRID.shape[0], order))
+
+    @property
+    def notes(self):
+        """Training notes seen"""
+        return int(self.interval_counts.sum())
+
+    def sample(self, rng, phrases, length):
+        """Draw phrases with a numpy Generator; returns (intervals, durations) arrays of shape (phrases, length)"""
+        return (_walk(self.interval_cdf, rng.random((phrases, length))) - MAX_INTERVAL,
+                DURATION_GRID[_walk(self.duration_cdf, rng.random((phrases, length)))])
+
+    def save(self, path):
+        np.savez(path, version=MODEL_VERSION, intervals=self.interval_counts, durations=self.duration_counts)
+
+    def publish(self, directory):
+        """Publish the counts and cdfs as .npy tables at directory, replacing any previous model atomically.
+
+        Each publish writes a new version folder next to directory, and
+        directory itself is a symlink swapped over to it with one os.replace,
+        so readers find either the old model or the new one, never neither.
+        """
+        directory = os.path.abspath(directory)
+        version = f"{directory}.v{time.time_ns():016x}"
+        staging = f"{version}.tmp"
+        os.makedirs(staging)
+        for name in PUBLISHED_TABLES:
+            np.save(os.path.join(staging, name + '.npy'), getattr(self, name))
+        with open(os.path.join(staging, 'model.json'), 'w') as f:
+            json.dump({'version': MODEL_VERSION, 'order': self.order, 'fingerprint': self.fingerprint}, f)
+        os.rename(staging, version)
+
+        link = f"{directory}.{os.getpid()}.link"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(version), link)
+        if os.path.isdir(directory) and not os.path.islink(directory):
+            # A plain folder from before versioned publishing; it is moved aside once and pruned with the rest
+            os.replace(directory, f"{directory}.v{0:016x}")
+        os.replace(link, directory)
+
+        parent, prefix = os.path.split(directory)
+        versions = sorted(name for name in os.listdir(parent or '.')
+                          if name.startswith(prefix + '.v') and not name.endswith('.tmp'))
+        for name in versions[:-PUBLISHED_VERSIONS_KEPT]:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+    @classmethod
+    def attach(cls, directory):
+        """Memory-map a published model read-only; nothing is copied or recomputed.
+
+        The link is resolved once, so every table comes from one version. If
+        that version was pruned while it was being opened, a newer one has
+        been published since, and that is attached instead.
+        """
+        while True:
+            version = os.path.realpath(directory)
+            try:
+                with open(os.path.join(version, 'model.json')) as f:
+                    meta = json.load(f)
+                if meta.get('version') != MODEL_VERSION:
+                    raise ValueError(f"melody model version {meta.get('version')}, expected {MODEL_VERSION}")
+                tables = {name: np.load(os.path.join(version, name + '.npy'), mmap_mode='r')
+                          for name in PUBLISHED_TABLES}
+                return cls(fingerprint=meta['fingerprint'], **tables)
+            except FileNotFoundError:
+                if os.path.realpath(directory) == version:
+                    raise
+
+    @classmethod
+    def load(cls, path):
+        """A model saved as .npz, or attached from a directory it was published to"""
+        if os.path.isdir(path):
+            return cls.attach(path)
+        with np.load(path) as data:
+            if int(data['version']) != MODEL_VERSION:
+                raise ValueError(f"melody model version {int(data['version'])}, expected {MODEL_VERSION}")
+            return cls(data['intervals'], data['durations'])
+
+
+def _walk(cdf, draws):
+    """Run a chain for every row of draws at once, one column per step"""
+    states = cdf.shape[-1]
+    order = cdf.ndim
+    rows = cdf.reshape(-1, states)
+    # Contexts are numbered like the flattened rows: base states + 1, padding is `states`
+    base = states + 1
+    span = base ** (order - 2) if order > 1 else 1
+    context = np.full(draws.shape[0], sum(states * base ** power for power in range(order - 1)), dtype=np.int64)
+    sampled = np.empty(draws.shape, dtype=np.int64)
+    for step in range(draws.shape[1]):
+        # Inverse-CDF lookup: the first state whose cumulative probability exceeds the draw
+        state = np.count_nonzero(np.take(rows, context, axis=0) <= draws[:, step, None], axis=1)
+        np.minimum(state, states - 1, out=state)
+        sampled[:, step] = state
+        context = (context % span) * base + state if order > 1 else context
+    return sampled
+
+
+def train_melody_model(root, genres=None, order=3, workers=None, batch_size=32):
+    """Train a MelodyModel on every MIDI file under root/<genre>/; returns (model, phrases)"""
+    phrases = []
+    batches = batched(iter_corpus_files(root, genres), batch_size)
+    run_batches(melody_phrase_batch, batches, workers or os.cpu_count() or 1, phrases.extend)
+    return MelodyModel.train(phrases, order), len(phrases)
@@ -0,0 +1,786 @@
+import hashlib
+import io
+import marshal
+import os
+import struct
+import time
+import zlib
+from collections import Counter
+from functools import partial
+from itertools import chain, repeat, starmap
+
+from music_theory import lookup_key
+from parallel import batched, run_batches
+
+# Pitch class names, spelled the way CHORD_PROGRESSIONS spells them
+PITCH_NAMES = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+DRUM_CHANNEL = 9
+
+# Bump whenever analyze_midi changes what it extracts; invalidates cached features
+ANALYZER_VERSION = 1
+
+# Analysis tuning
+CHORD_WINDOW_BEATS = 2          # One chord every two beats, like the generators
+PROGRESSION_LENGTH = 4          # Chords per learned progression
+MELODY_NGRAM_SIZE = 4           # Intervals per learned melody pattern
+HOOK_NGRAM_SIZE = 8             # Intervals per hook candidate
+HOOK_MIN_REPEATS = 3            # Repeats within one song to count as a hook
+STRUCTURE_BLOCK_BARS = 4        # Bars per structural block
+MAX_INTERVAL = 12               # Melody intervals are clipped to an octave
+
+# Krumhansl-Kessler key profiles
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+# Chord templates: (name, chord tones) for every major and minor triad
+CHORD_TEMPLATES = tuple(
+    (PITCH_NAMES[root] + suffix, (root, (root + third) % 12, (root + 7) % 12))
+    for root in range(12)
+    for suffix, third in (('', 4), ('m', 3))
+)
+
+
+class MidiParseError(Exception):
+    """Raised when a file is not a readable Standard MIDI File"""
+
+
+class MidiData:
+    """Events decoded from one Standard MIDI File"""
+
+    def __init__(self, file_format, ticks_per_beat):
+        self.file_format = file_format
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = []            # Per track: list of (start, end, channel, pitch, velocity)
+        self.tempos = []            # (tick, microseconds per beat)
+        self.key_signatures = []    # (tick, sharps/flats, minor flag)
+        self.time_signatures = []   # (tick, numerator, denominator)
+
+
+def iter_chunks(file_obj):
+    """Yield (chunk_id, payload) for each chunk, reading one chunk at a time"""
+    while True:
+        header = file_obj.read(8)
+        if len(header) < 8:
+            return
+        chunk_id, length = struct.unpack('>4sI', header)
+        yield chunk_id, file_obj.read(length)
+
+
+def read_varlen(data, pos):
+    """Decode a variable-length quantity, returning (value, new position)"""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def parse_track(data, midi):
+    """Decode one MTrk chunk into notes plus tempo/key/time meta events"""
+    notes = []
+    active = {}
+    tick = 0
+    pos = 0
+    running = 0
+    end = len(data)
+
+    try:
+        while pos < end:
+            delta, pos = read_varlen(data, pos)
+            tick += delta
+            status = data[pos]
+
+            if status == 0xFF:
+                # Meta event
+                meta_type = data[pos + 1]
+                length, pos = read_varlen(data, pos + 2)
+                payload = data[pos:pos + length]
+                pos += length
+                if meta_type == 0x51 and length == 3:
+                    microseconds = (payload[0] << 16) | (payload[1] << 8) | payload[2]
+                    if not microseconds:
+                        raise MidiParseError("tempo of 0 microseconds per beat")
+                    midi.tempos.append((tick, microseconds))
+                elif meta_type == 0x59 and length == 2:
+                    sharps = payload[0] - 256 if payload[0] > 127 else payload[0]
+                    midi.key_signatures.append((tick, sharps, payload[1]))
+                elif meta_type == 0x58 and length >= 2:
+                    midi.time_signatures.append((tick, payload[0], 1 << payload[1]))
+                elif meta_type == 0x2F:
+                    break
+                continue
+
+            if status == 0xF0 or status == 0xF7:
+                # SysEx event
+                length, pos = read_varlen(data, pos + 1)
+                pos += length
+                continue
+
+            if status & 0x80:
+                if status > 0xEF:
+                    raise MidiParseError(f"unexpected system message 0x{status:02X}")
+                running = status
+                pos += 1
+            elif not running:
+                raise MidiParseError("running status without a previous status byte")
+
+            kind = running & 0xF0
+            if kind == 0xC0 or kind == 0xD0:
+                pos += 1
+                continue
+
+            pitch = data[pos]
+            velocity = data[pos + 1]
+            pos += 2
+            if kind == 0x90 and velocity:
+                active.setdefault((running & 0x0F) << 7 | pitch, []).append((tick, velocity))
+            elif kind == 0x80 or kind == 0x90:
+                starts = active.get((running & 0x0F) << 7 | pitch)
+                if starts:
+                    start, start_velocity = starts.pop(0)
+                    notes.append((start, tick, running & 0x0F, pitch, start_velocity))
+    except IndexError:
+        # Truncated track: keep whatever decoded cleanly
+        pass
+
+    # Close notes that never received a note off
+    for key, starts in active.items():
+        for start, start_velocity in starts:
+            notes.append((start, max(tick, start + 1), key >> 7, key & 0x7F, start_velocity))
+
+    notes.sort()
+    midi.tracks.append(notes)
+
+
+def read_midi(file_obj):
+    """Parse a Standard MIDI File from a binary file object, chunk by chunk"""
+    chunks = iter_chunks(file_obj)
+    first = next(chunks, None)
+    if first is None or first[0] != b'MThd' or len(first[1]) < 6:
+        raise MidiParseError("missing MThd header")
+
+    file_format, _, division = struct.unpack('>HHH', first[1][:6])
+    if division & 0x8000:
+        # SMPTE timing: approximate ticks per beat at 120 BPM
+        frames = 256 - (division >> 8)
+        ticks_per_beat = max(1, frames * (division & 0xFF) // 2)
+    else:
+        ticks_per_beat = division or 480
+
+    midi = MidiData(file_format, ticks_per_beat)
+    for chunk_id, payload in chunks:
+        if chunk_id == b'MTrk':
+            parse_track(payload, midi)
+    return midi
+
+
+def read_midi_file(path):
+    """Parse a Standard MIDI File from disk"""
+    with open(path, 'rb') as file_obj:
+        return read_midi(file_obj)
+
+
+def estimate_key(histogram):
+    """Estimate the key from a pitch-class histogram (Krumhansl-Schmuckler)"""
+    if not any(histogram):
+        return None
+
+    mean = sum(histogram) / 12.0
+    centered = [value - mean for value in histogram]
+    norm = sum(value * value for value in centered) ** 0.5 or 1.0
+
+    best_name, best_score = None, float('-inf')
+    for profile, mode in ((MAJOR_PROFILE, 'major'), (MINOR_PROFILE, 'minor')):
+        profile_mean = sum(profile) / 12.0
+        profile_centered = [value - profile_mean for value in profile]
+        profile_norm = sum(value * value for value in profile_centered) ** 0.5
+        for tonic in range(12):
+            score = sum(centered[(tonic + i) % 12] * profile_centered[i] for i in range(12))
+            score /= norm * profile_norm
+            if score > best_score:
+                best_name, best_score = f"{PITCH_NAMES[tonic]} {mode}", score
+    return best_name
+
+
+def key_from_signature(sharps, minor):
+    """Translate a key signature meta event into a key name"""
+    tonic = (sharps * 7) % 12
+    if minor:
+        return f"{PITCH_NAMES[(tonic + 9) % 12]} minor"
+    return f"{PITCH_NAMES[tonic]} major"
+
+
+def key_as_analyzed(name):
+    """A key in any spelling lookup_key accepts ('A', 'Amaj', 'Bbm'), named as analysis names keys ('A major')"""
+    key = lookup_key(name)
+    return f"{PITCH_NAMES[key.tonic]} {key.mode}"
+
+
+def detect_chords(notes, window, windows):
+    """Label each chord window with its best matching triad (or None)"""
+    histograms = [[0.0] * 12 for _ in range(windows)]
+    lowest = [128] * windows
+
+    for start, end, channel, pitch, _ in notes:
+        first = start // window
+        last = min(windows - 1, (end - 1) // window)
+        for index in range(first, last + 1):
+            overlap = min(end, (index + 1) * window) - max(start, index * window)
+            if overlap > 0:
+                histograms[index][pitch % 12] += overlap
+                if pitch < lowest[index]:
+                    lowest[index] = pitch
+
+    chords = []
+    for histogram, bass in zip(histograms, lowest):
+        total = sum(histogram)
+        if total < window * 0.25:
+            chords.append(None)
+            continue
+
+        best_name, best_score = None, 0.0
+        for name, tones in CHORD_TEMPLATES:
+            inside = histogram[tones[0]] + histogram[tones[1]] + histogram[tones[2]]
+            score = inside - 0.5 * (total - inside)
+            if bass < 128 and bass % 12 == tones[0]:
+                score += 0.25 * total
+            if score > best_score:
+                best_name, best_score = name, score
+        chords.append(best_name)
+    return chords
+
+
+def extract_melody(tracks):
+    """Pick the highest voice (skyline) of the highest sounding part"""
+    parts = {}
+    for track_index, notes in enumerate(tracks):
+        for note in notes:
+            if note[2] != DRUM_CHANNEL:
+                parts.setdefault((track_index, note[2]), []).append(note)
+
+    candidates = [part for part in parts.values() if len(part) >= 8] or list(parts.values())
+    if not candidates:
+        return []
+
+    part = max(candidates, key=lambda notes: sum(note[3] for note in notes) / len(notes))
+    skyline = {}
+    for start, _, _, pitch, _ in part:
+        if pitch > skyline.get(start, -1):
+            skyline[start] = pitch
+    return sorted(skyline.items())
+
+
+def count_ngrams(values, size):
+    """Count every contiguous n-gram of the given size"""
+    return Counter(tuple(values[i:i + size]) for i in range(len(values) - size + 1))
+
+
+def analyze_midi_file(path, genre=None):
+    """Extract learnable features from one MIDI file"""
+    return analyze_midi(read_midi_file(path), os.path.getsize(path), genre)
+
+
+def analyze_midi(midi, size, genre=None):
+    """Extract learnable features from parsed MIDI data"""
+    tpb = midi.ticks_per_beat
+
+    numerator, denominator = (midi.time_signatures[0][1:] if midi.time_signatures else (4, 4))
+    bar_ticks = max(1, tpb * numerator * 4 // denominator)
+    window = tpb * CHORD_WINDOW_BEATS
+
+    pitched = [note for notes in midi.tracks for note in notes if note[2] != DRUM_CHANNEL]
+    end_tick = max((note[1] for note in pitched), default=0)
+
+    # Tempo
+    tempo = round(60000000.0 / min(midi.tempos)[1], 1) if midi.tempos else 120.0
+
+    # Key: trust an explicit key signature, otherwise estimate from pitch content
+    histogram = [0.0] * 12
+    for start, end, _, pitch, _ in pitched:
+        histogram[pitch % 12] += end - start
+    if midi.key_signatures:
+        key = key_from_signature(*min(midi.key_signatures)[1:])
+    else:
+        key = estimate_key(histogram)
+
+    # Chord progressions
+    windows = -(-end_tick // window) if window else 0
+    chord_windows = detect_chords(pitched, window, windows) if windows else []
+    sequence = []
+    for chord in chord_windows:
+        if chord and (not sequence or sequence[-1] != chord):
+            sequence.append(chord)
+    progressions = count_ngrams(sequence, PROGRESSION_LENGTH)
+
+    # Melody intervals, hooks and rhythm
+    melody = extract_melody(midi.tracks)
+    intervals = [
+        max(-MAX_INTERVAL, min(MAX_INTERVAL, melody[i + 1][1] - melody[i][1]))
+        for i in range(len(melody) - 1)
+    ]
+    melody_patterns = count_ngrams(intervals, MELODY_NGRAM_SIZE)
+    hooks = [ngram for ngram, count in count_ngrams(intervals, HOOK_NGRAM_SIZE).items()
+             if count >= HOOK_MIN_REPEATS and any(ngram)]
+
+    step = max(1, tpb // 4)
+    bars = {}
+    for start, _ in melody:
+        bars.setdefault(start // bar_ticks, set()).add((start % bar_ticks) // step)
+    rhythm_patterns = Counter()
+    steps_per_bar = max(1, bar_ticks // step)
+    for onsets in bars.values():
+        if len(onsets) >= 2:
+            positions = sorted(onsets) + [steps_per_bar]
+            rhythm_patterns[tuple((b - a) / 4.0 for a, b in zip(positions, positions[1:]))] += 1
+
+    # Structure: label repeated blocks of bars by their chord content
+    windows_per_block = max(1, bar_ticks * STRUCTURE_BLOCK_BARS // window) if window else 1
+    labels = {}
+    structure = []
+    for offset in range(0, len(chord_windows), windows_per_block):
+        block = tuple(chord_windows[offset:offset + windows_per_block])
+        if not any(block):
+            continue
+        label = labels.setdefault(block, chr(ord('A') + min(len(labels), 25)))
+        if not structure or structure[-1] != label:
+            structure.append(label)
+
+    # Summary statistics
+    beats = end_tick / tpb if tpb else 0
+    melody_pitches = [pitch for _, pitch in melody]
+    repeated = sum(count for count in melody_patterns.values() if count > 1)
+    stats = {
+        'note_density': len(pitched) / beats if beats else 0.0,
+        'pitch_range': float(max(melody_pitches) - min(melody_pitches)) if melody_pitches else 0.0,
+        'repetition': repeated / max(1, sum(melody_patterns.values())),
+        'velocity': sum(note[4] for note in pitched) / len(pitched) if pitched else 0.0,
+    }
+
+    return {
+        'genre': genre,
+        'size': size,
+        'tempo': tempo,
+        'key': key,
+        'progressions': dict(progressions),
+        'melody_patterns': dict(melody_patterns),
+        'rhythm_patterns': dict(rhythm_patterns),
+        'structure': tuple(structure[:8]) if len(structure) >= 2 else None,
+        'hooks': hooks,
+        'stats': stats,
+    }
+
+
+def _subtract(counter, counts):
+    """Subtract counts from a Counter, dropping entries that reach zero"""
+    for key, count in counts.items():
+        remaining = counter[key] - count
+        if remaining > 0:
+            counter[key] = remaining
+        else:
+            del counter[key]
+
+
+def _ranked(counter):
+    """Keys ordered by descending count, ties broken by key for stable output"""
+    keys = sorted(counter)
+    keys.sort(key=counter.__getitem__, reverse=True)     # Stable, so ties stay in key order
+    return keys
+
+
+class PatternAccumulator:
+    """Merges per-file features into the learned pattern tables"""
+
+    def __init__(self):
+        self.files = 0
+        self.genres = Counter()
+        self.chord_progressions = Counter()
+        self.popular_keys = Counter()
+        self.tempos = Counter()
+        self.melody_patterns = Counter()
+        self.rhythm_patterns = Counter()
+        self.structure_patterns = Counter()
+        self.hooks = Counter()
+        self.element_totals = {}
+
+    def add(self, features):
+        """Fold one file's features into the running totals"""
+        self.files += 1
+        self.genres[features['genre']] += 1
+        self.chord_progressions.update(features['progressions'])
+        self.melody_patterns.update(features['melody_patterns'])
+        self.rhythm_patterns.update(features['rhythm_patterns'])
+        self.hooks.update(features['hooks'])
+        self.tempos[features['tempo']] += 1
+        if features['key']:
+            self.popular_keys[features['key']] += 1
+        if features['structure']:
+            self.structure_patterns[features['structure']] += 1
+
+        for name, value in features['stats'].items():
+            totals = self.element_totals.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += value
+            totals[2] += value * value
+
+    def remove(self, features):
+        """Take back a previously added file's features"""
+        self.files -= 1
+        _subtract(self.genres, {features['genre']: 1})
+        _subtract(self.chord_progressions, features['progressions'])
+        _subtract(self.melody_patterns, features['melody_patterns'])
+        _subtract(self.rhythm_patterns, features['rhythm_patterns'])
+        _subtract(self.hooks, dict.fromkeys(features['hooks'], 1))
+        _subtract(self.tempos, {features['tempo']: 1})
+        if features['key']:
+            _subtract(self.popular_keys, {features['key']: 1})
+        if features['structure']:
+            _subtract(self.structure_patterns, {features['structure']: 1})
+
+        for name, value in features['stats'].items():
+            totals = self.element_totals.get(name)
+            if totals:
+                totals[0] -= 1
+                totals[1] -= value
+                totals[2] -= value * value
+
+    def to_state(self):
+        """Plain-builtin snapshot of the totals, suitable for marshal"""
+        return {
+            'files': self.files,
+            'genres': dict(self.genres),
+            'chord_progressions': dict(self.chord_progressions),
+            'popular_keys': dict(self.popular_keys),
+            'tempos': dict(self.tempos),
+            'melody_patterns': dict(self.melody_patterns),
+            'rhythm_patterns': dict(self.rhythm_patterns),
+            'structure_patterns': dict(self.structure_patterns),
+            'hooks': dict(self.hooks),
+            'element_totals': {name: list(totals) for name, totals in self.element_totals.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild an accumulator from to_state() output"""
+        accumulator = cls()
+        accumulator.files = state['files']
+        for name in ('genres', 'chord_progressions', 'popular_keys', 'tempos', 'melody_patterns',
+                     'rhythm_patterns', 'structure_patterns', 'hooks'):
+            setattr(accumulator, name, Counter(state[name]))
+        accumulator.element_totals = {name: list(totals) for name, totals in state['element_totals'].items()}
+        return accumulator
+
+    def patterns(self):
+        """Return the learned patterns in the shape the generators expect.
+
+        The tables are copies, so the accumulator can go on changing under
+        a generation using them. Counts are never left at zero or below
+        (see _subtract), so plain dict copies will do.
+        """
+        viral_elements = {}
+        for name, (count, total, total_sq) in self.element_totals.items():
+            if count:
+                mean = total / count
+                viral_elements[name] = {
+                    'mean': mean,
+                    'std': max(0.0, total_sq / count - mean * mean) ** 0.5,
+                    'count': count,
+                }
+
+        return {
+            'chord_progressions': Counter(self.chord_progressions),
+            'popular_keys': Counter(self.popular_keys),
+            'optimal_tempos': list(chain.from_iterable(starmap(repeat, sorted(self.tempos.items())))),
+            'viral_elements': viral_elements,
+            'structure_patterns': Counter(self.structure_patterns),
+            'melody_patterns': Counter(self.melody_patterns),
+            'rhythm_patterns': _ranked(self.rhythm_patterns),
+            'hooks': _ranked(self.hooks),
+            'genres': Counter(self.genres),
+        }
+
+
+class IngestionStats:
+    """Throughput counters for one corpus ingestion run"""
+
+    def __init__(self):
+        self.files = 0          # Files analyzed from scratch
+        self.bytes = 0
+        self.failed = 0
+        self.cached = 0         # Unchanged files served from the pattern cache
+        self.reused = 0         # Changed files whose content hash was already cached
+        self.removed = 0        # Files that disappeared since the last run
+        self.cold_elapsed = None
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def files_per_sec(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        summary = (f"📊 Ingested {self.files} files ({self.bytes / 1e6:.2f} MB) in {self.elapsed:.2f}s"
+                   f" — {self.files_per_sec:.1f} files/s, {self.bytes_per_sec / 1e6:.2f} MB/s"
+                   f" ({self.failed} failed)")
+        if self.cold_elapsed is not None:
+            summary += (f"\n💾 Pattern cache: {self.cached} unchanged, {self.reused} reused by hash,"
+                        f" {self.removed} removed — cold start {self.cold_elapsed:.2f}s"
+                        f" vs this run {self.elapsed:.2f}s")
+        return summary
+
+
+def iter_corpus_files(root, genres=None):
+    """Yield (path, genre) for every MIDI file under root/<genre>/"""
+    if not os.path.isdir(root):
+        return
+
+    wanted = {genre.lower() for genre in genres} if genres else None
+    with os.scandir(root) as entries:
+        genre_dirs = sorted(entry.name for entry in entries if entry.is_dir())
+
+    for genre in genre_dirs:
+        if wanted is not None and genre.lower() not in wanted:
+            continue
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, genre)):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(MIDI_EXTENSIONS):
+                    yield os.path.join(dirpath, name), genre
+
+
+def corpus_files_among(root, paths, genres=None):
+    """Yield (path, genre) for those of paths that are MIDI files under root/<genre>/, as iter_corpus_files would"""
+    wanted = {genre.lower() for genre in genres} if genres else None
+    for path in sorted(paths):
+        parts = os.path.relpath(path, root).split(os.sep)
+        if len(parts) < 2 or parts[0] == os.pardir or not path.lower().endswith(MIDI_EXTENSIONS):
+            continue
+        if (wanted is None or parts[0].lower() in wanted) and os.path.isfile(path):
+            yield path, parts[0]
+
+
+def analyze_batch(batch):
+    """Analyze a batch of (path, genre) pairs; runs inside worker processes"""
+    results = []
+    for path, genre in batch:
+        try:
+            results.append((path, analyze_midi_file(path, genre), None))
+        except (OSError, MidiParseError) as e:
+            results.append((path, None, str(e)))
+    return results
+
+
+def ingest_corpus(root, genres=None, workers=None, batch_size=32, accumulator=None):
+    """Analyze every MIDI file under root across a process pool.
+
+    Files are streamed from the directory walk in batches, so only the
+    batches currently in flight are ever held in memory. Returns the
+    accumulator and an IngestionStats with files/sec and bytes/sec.
+    """
+    accumulator = accumulator if accumulator is not None else PatternAccumulator()
+    stats = IngestionStats()
+
+    def consume(results):
+        for _, features, error in results:
+            if error is not None:
+                stats.failed += 1
+                continue
+            accumulator.add(features)
+            stats.files += 1
+            stats.bytes += features['size']
+
+    batches = batched(iter_corpus_files(root, genres), batch_size)
+    run_batches(analyze_batch, batches, workers or os.cpu_count() or 1, consume)
+
+    stats.finish()
+    return accumulator, stats
+
+
+class StaleCacheError(Exception):
+    """Raised when cached features needed for an incremental update are gone"""
+
+
+def load_features(features_dir, digest):
+    """Load cached features for a content digest, or None on a miss"""
+    try:
+        with open(os.path.join(features_dir, digest[:2], digest + '.bin'), 'rb') as file_obj:
+            return marshal.loads(zlib.decompress(file_obj.read()))
+    except (OSError, EOFError, ValueError, TypeError, zlib.error):
+        return None
+
+
+def store_features(features_dir, digest, features):
+    """Write features for a content digest as compressed marshal data"""
+    directory = os.path.join(features_dir, digest[:2])
+    os.makedirs(directory, exist_ok=True)
+    atomic_write(os.path.join(directory, digest + '.bin'), zlib.compress(marshal.dumps(features)))
+
+
+def atomic_write(path, data):
+    """Write bytes to path via a temporary file and rename"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file_obj:
+        file_obj.write(data)
+    os.replace(temp_path, path)
+
+
+def analyze_cached_batch(batch, features_dir):
+    """Hash each file and analyze it only on a cache miss; runs inside worker processes"""
+    results = []
+    for path, genre, size, mtime_ns in batch:
+        try:
+            with open(path, 'rb') as file_obj:
+                data = file_obj.read()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            features = load_features(features_dir, digest)
+            reused = features is not None
+            if not reused:
+                features = analyze_midi(read_midi(io.BytesIO(data)), len(data), genre)
+                store_features(features_dir, digest, features)
+            # Identical content may live under several genre folders
+            features['genre'] = genre
+            results.append((path, genre, size, mtime_ns, digest, features, reused, None))
+        except (OSError, MidiParseError) as e:
+            results.append((path, genre, size, mtime_ns, None, None, False, str(e)))
+    return results
+
+
+def scope_id(root, genres=None):
+    """Short stable id of a corpus scope: a root folder and a genre filter"""
+    scope = os.path.abspath(root) + '|' + ','.join(sorted(genre.lower() for genre in genres or ()))
+    return hashlib.blake2b(scope.encode(), digest_size=8).hexdigest()
+
+
+class AnalysisCache:
+    """On-disk cache of per-file features keyed by content hash and analyzer version.
+
+    Alongside the feature blobs, each corpus scope (root + genre filter) keeps
+    an index of path -> (size, mtime_ns, digest, genre) and a snapshot of the
+    merged pattern totals. A warm run only stats files; new or changed ones are
+    analyzed and merged into the snapshot, removed ones are subtracted from it.
+    """
+
+    def __init__(self, cache_dir):
+        self.version_dir = os.path.join(cache_dir, f"v{ANALYZER_VERSION}")
+        self.features_dir = os.path.join(self.version_dir, 'features')
+
+    def index_path(self, root, genres=None):
+        return os.path.join(self.version_dir, f"index-{scope_id(root, genres)}.bin")
+
+    def load_index(self, root, genres=None):
+        try:
+            with open(self.index_path(root, genres), 'rb') as file_obj:
+                return marshal.loads(zlib.decompress(file_obj.read()))
+        except (OSError, EOFError, ValueError, TypeError, zlib.error):
+            return None
+
+    def save_index(self, root, genres, index):
+        os.makedirs(self.version_dir, exist_ok=True)
+        atomic_write(self.index_path(root, genres), zlib.compress(marshal.dumps(index)))
+
+    def save(self, root, genres, entries, accumulator, cold_seconds):
+        """Write a scope's index from its entries and accumulator"""
+        self.save_index(root, genres, {'files': entries, 'state': accumulator.to_state(), 'cold_seconds': cold_seconds})
+
+    def forget(self, accumulator, entry):
+        """Subtract a previously merged file from the accumulator"""
+        digest, genre = entry[2], entry[3]
+        if digest is None:
+            return
+        features = load_features(self.features_dir, digest)
+        if features is None:
+            raise StaleCacheError(digest)
+        features['genre'] = genre
+        accumulator.remove(features)
+
+    def ingest(self, root, genres=None, workers=None, batch_size=32):
+        """Bring the cached patterns for root up to date; returns (accumulator, stats)"""
+        index = self.load_index(root, genres)
+        try:
+            return self._ingest(root, genres, workers, batch_size, index)
+        except StaleCacheError:
+            return self._ingest(root, genres, workers, batch_size, None)
+
+    def update(self, root, paths, genres=None, workers=None, batch_size=32):
+        """Like ingest, but only look at the given paths, known to have been added, changed or removed.
+
+        The rest of the corpus is neither walked nor stat'ed, but the index is
+        still read and rewritten whole; to apply many small updates, keep it
+        in memory and use apply. Without an index for the scope this is a full
+        ingest.
+        """
+        index = self.load_index(root, genres)
+        if index is None:
+            return self.ingest(root, genres, workers, batch_size)
+        try:
+            return self._ingest(root, genres, workers, batch_size, index, paths)
+        except StaleCacheError:
+            return self._ingest(root, genres, workers, batch_size, None)
+
+    def _ingest(self, root, genres, workers, batch_size, index, paths=None):
+        entries = index['files'] if index else {}
+        accumulator = PatternAccumulator.from_state(index['state']) if index else PatternAccumulator()
+        stats = self.apply(root, entries, accumulator, paths, genres, workers, batch_size)
+        stats.cold_elapsed = index['cold_seconds'] if index else stats.elapsed
+        self.save(root, genres, entries, accumulator, stats.cold_elapsed)
+        return accumulator, stats
+
+    def apply(self, root, entries, accumulator, paths=None, genres=None, workers=None, batch_size=32):
+        """Bring a scope's index entries and accumulator, held in memory, up to date in place; returns stats.
+
+        With paths, only those are looked at, as in update. Nothing is saved.
+        Raises StaleCacheError, leaving both partly updated, when the cached
+        features of a file to take back are gone.
+        """
+        stats = IngestionStats()
+        seen = set()
+
+        def changed_files():
+            files = iter_corpus_files(root, genres) if paths is None else corpus_files_among(root, paths, genres)
+            for path, genre in files:
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stats.failed += 1
+                    continue
+                entry = entries.get(path)
+                if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns and entry[3] == genre:
+                    stats.cached += 1
+                    continue
+                yield path, genre, stat.st_size, stat.st_mtime_ns
+
+        def consume(results):
+            for path, genre, size, mtime_ns, digest, features, reused, error in results:
+                if path in entries:
+                    self.forget(accumulator, entries[path])
+                entries[path] = (size, mtime_ns, digest, genre)
+                if error is not None:
+                    stats.failed += 1
+                    continue
+                accumulator.add(features)
+                if reused:
+                    stats.reused += 1
+                else:
+                    stats.files += 1
+                    stats.bytes += size
+
+        analyze = partial(analyze_cached_batch, features_dir=self.features_dir)
+        run_batches(analyze, batched(changed_files(), batch_size), workers or os.cpu_count() or 1, consume)
+
+        for path in [path for path in (entries if paths is None else paths) if path in entries and path not in seen]:
+            self.forget(accumulator, entries.pop(path))
+            stats.removed += 1
+
+        stats.finish()
+        return stats
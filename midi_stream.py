@@ -0,0 +1,262 @@
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from midi_writer import END_OF_TRACK, TICKS_PER_BEAT, layout_events, meta_event
+from note_engine import BEATS_PER_BAR
+
+UNKNOWN_LENGTH = 0xFFFFFFFF     # MTrk length for unseekable outputs: read until End of Track
+
+# One bar of channel events. tick is absolute; data is the SMF encoding of
+# the events, delta-timed from the last event of the previous bar.
+Bar = namedtuple('Bar', 'index end_tick tick status pitch velocity data')
+
+
+class TrackCursor:
+    """Plays one track's sections in order, rendering a section only when it is due.
+
+    Holds the notes of at most the sections overlapping the current bar, so
+    memory does not depend on how many sections the song has.
+    """
+
+    def __init__(self, library, plan, loop=False, ticks_per_beat=TICKS_PER_BEAT):
+        self.table, self.sizes, self.lengths = library
+        self.first_row = np.cumsum(self.sizes) - self.sizes
+        self.status = 0x90 | self.table.channel.astype(np.int64)
+        self.plan = np.asarray(plan, dtype=np.int64)
+        self.loop = loop
+        self.ticks_per_beat = ticks_per_beat
+        self.position = 0
+        self.section_start = 0.0
+        self.pending = [np.zeros(0, dtype=np.int64)] * 5     # on, off, status, pitch, velocity
+
+    @property
+    def exhausted(self):
+        return not self.plan.shape[0] or (not self.loop and self.position >= self.plan.shape[0])
+
+    def take(self, end_tick):
+        """Notes starting before end_tick as (on, off, status, pitch, velocity) arrays"""
+        added = [self.pending]
+        while not self.exhausted and self.section_start * self.ticks_per_beat < end_tick:
+            added.append(self._render(int(self.plan[self.position % self.plan.shape[0]])))
+            self.position += 1
+        if len(added) > 1:
+            self.pending = [np.concatenate(column) for column in zip(*added)]
+
+        due = self.pending[0] < end_tick
+        taken = [column[due] for column in self.pending]
+        self.pending = [column[~due] for column in self.pending]
+        return taken
+
+    @property
+    def idle(self):
+        return self.exhausted and not self.pending[0].shape[0]
+
+    def _render(self, block):
+        rows = slice(self.first_row[block], self.first_row[block] + self.sizes[block])
+        # Same float arithmetic and truncation as assemble_sections and encode_midi
+        on = ((self.table.start[rows] + self.section_start) * self.ticks_per_beat).astype(np.int64)
+        off = on + (self.table.duration[rows] * self.ticks_per_beat).astype(np.int64)
+        self.section_start += self.lengths[block]
+        return [on, off, self.status[rows], self.table.pitch[rows].astype(np.int64),
+                self.table.velocity[rows].astype(np.int64)]
+
+
+class BarStream:
+    """Turn per-track section libraries into a stream of bars.
+
+    tracks is a list of (library, plan) pairs as used by
+    note_engine.assemble_sections. Iterating yields one Bar at a time until
+    every note has finished (never, with loop=True); each bar holds the note
+    ons and offs inside it, offs before ons at the same tick. Notes that
+    overlap at the same pitch are not de-interleaved the way encode_midi
+    does, so such a note can be cut short by the other's note off.
+    """
+
+    def __init__(self, tracks, loop=False, beats_per_bar=BEATS_PER_BAR, ticks_per_beat=TICKS_PER_BEAT):
+        self.cursors = [TrackCursor(library, plan, loop, ticks_per_beat) for library, plan in tracks]
+        self.bar_ticks = int(beats_per_bar * ticks_per_beat)
+        self.index = 0
+        self.last_tick = 0
+        self.sounding = [np.zeros(0, dtype=np.int64)] * 4     # off, status, pitch, serial
+        self.serial = 0
+
+    @property
+    def done(self):
+        return not self.sounding[0].shape[0] and all(cursor.idle for cursor in self.cursors)
+
+    def __iter__(self):
+        while not self.done:
+            yield self.next_bar()
+
+    def next_bar(self):
+        end_tick = (self.index + 1) * self.bar_ticks
+        on, off, status, pitch, velocity = (np.concatenate(column) for column in zip(
+            *(cursor.take(end_tick) for cursor in self.cursors)))
+        serial = np.arange(self.serial, self.serial + on.shape[0])
+        self.serial += on.shape[0]
+
+        # Everything sounding, old and new; the offs due in this bar are played now
+        sounding = [np.concatenate(pair) for pair in zip(self.sounding, (off, status & 0x8F, pitch, serial))]
+        due = sounding[0] < end_tick
+        self.sounding = [column[~due] for column in sounding]
+        off_tick, off_status, off_pitch, off_serial = (column[due] for column in sounding)
+
+        return self._bar(end_tick, np.concatenate([off_tick, on]), np.concatenate([off_status, status]),
+                         np.concatenate([off_pitch, pitch]), np.concatenate([np.zeros_like(off_tick), velocity]),
+                         np.concatenate([off_serial * 2, serial * 2 + 1]))
+
+    def release(self):
+        """A final bar turning off every note still sounding, at the end of the last bar"""
+        off_tick, off_status, off_pitch, off_serial = self.sounding
+        self.sounding = [column[:0] for column in self.sounding]
+        for cursor in self.cursors:
+            cursor.plan = cursor.plan[:0]
+            cursor.pending = [column[:0] for column in cursor.pending]
+        end_tick = self.index * self.bar_ticks
+        return self._bar(end_tick, np.full_like(off_tick, end_tick), off_status, off_pitch,
+                         np.zeros_like(off_tick), off_serial * 2)
+
+    def _bar(self, end_tick, tick, status, pitch, velocity, order):
+        # Sort by tick, then note offs before note ons, then the order notes were taken
+        ordered = np.lexsort((order, status & 0x10, tick))
+        tick, status, pitch, velocity = tick[ordered], status[ordered], pitch[ordered], velocity[ordered]
+        deltas = np.diff(tick, prepend=self.last_tick)
+        buffer, _ = layout_events(deltas, status, pitch, velocity)
+        if tick.shape[0]:
+            self.last_tick = int(tick[-1])
+        bar = Bar(self.index, end_tick, tick, status, pitch, velocity, buffer.tobytes())
+        self.index += 1
+        return bar
+
+
+class StreamSink:
+    """Destination for a song streamed bar by bar.
+
+    start(tempo, name, ticks_per_beat) is called once, write_bar(bar) for
+    every bar, then finish() when the stream ends. Sinks are context
+    managers; close() releases whatever the sink opened.
+    """
+
+    def start(self, tempo, name, ticks_per_beat=TICKS_PER_BEAT):
+        pass
+
+    def write_bar(self, bar):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SMFStreamSink(StreamSink):
+    """Write a format 0 Standard MIDI File as the bars arrive.
+
+    output is a path or a binary file object. The track length is patched
+    in at the end when the output is seekable, otherwise it is left as
+    UNKNOWN_LENGTH and readers go by the End of Track event.
+    """
+
+    def __init__(self, output):
+        self.owned = isinstance(output, str)
+        self.file = open(output, 'wb') if self.owned else output
+        self.length_at = None
+        self.track_bytes = 0
+        self.bytes_written = 0
+
+    def start(self, tempo, name, ticks_per_beat=TICKS_PER_BEAT):
+        header = (meta_event(0x03, name.encode('ISO-8859-1', 'replace'))
+                  + meta_event(0x51, struct.pack('>L', int(60000000 / tempo))[1:]))
+        try:
+            seekable = self.file.seekable()
+        except (AttributeError, OSError):
+            seekable = False
+        if seekable:
+            self.length_at = self.file.tell() + 18
+        self._write(b'MThd' + struct.pack('>LHHH', 6, 0, 1, ticks_per_beat)
+                    + b'MTrk' + struct.pack('>L', UNKNOWN_LENGTH))
+        self._write_track(header)
+
+    def write_bar(self, bar):
+        if bar.data:
+            self._write_track(bar.data)
+
+    def finish(self):
+        self._write_track(END_OF_TRACK)
+        if self.length_at is not None:
+            end = self.file.tell()
+            self.file.seek(self.length_at)
+            self.file.write(struct.pack('>L', self.track_bytes))
+            self.file.seek(end)
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+    def _write_track(self, data):
+        self.track_bytes += len(data)
+        self._write(data)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+
+class SocketStreamSink(SMFStreamSink):
+    """Stream the MIDI file over a connected socket, one bar per send"""
+
+    def __init__(self, sock):
+        super().__init__(sock.makefile('wb', buffering=0))
+        self.sock = sock
+
+    def close(self):
+        self.file.close()
+
+
+class LiveMidiSink(StreamSink):
+    """Stand-in for a live MIDI output port.
+
+    Every event is passed to send(message) as its three MIDI bytes, the
+    call rtmidi/mido style ports expose; by default messages are only
+    counted. With realtime the sink waits until each event is due at the
+    song's tempo and records how late the latest send was.
+    """
+
+    def __init__(self, send=None, realtime=True, clock=time.monotonic, sleep=time.sleep):
+        self.send = send
+        self.realtime = realtime
+        self.clock = clock
+        self.sleep = sleep
+        self.messages = 0
+        self.max_lag = 0.0
+        self.started = None
+        self.seconds_per_tick = 0.0
+
+    def start(self, tempo, name, ticks_per_beat=TICKS_PER_BEAT):
+        self.seconds_per_tick = 60.0 / (tempo * ticks_per_beat)
+        self.started = self.clock()
+
+    def write_bar(self, bar):
+        for tick, status, pitch, velocity in zip(bar.tick.tolist(), bar.status.tolist(),
+                                                 bar.pitch.tolist(), bar.velocity.tolist()):
+            if self.realtime:
+                due = self.started + tick * self.seconds_per_tick
+                wait = due - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                else:
+                    self.max_lag = max(self.max_lag, -wait)
+            if self.send is not None:
+                self.send(bytes((status, pitch, velocity)))
+            self.messages += 1
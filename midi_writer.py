@@ -0,0 +1,198 @@
+import struct
+
+import numpy as np
+
+TICKS_PER_BEAT = 960
+
+NOTE_OFF_ORDER = 2      # Same secondary sort keys midiutil uses, so note offs
+NOTE_ON_ORDER = 3       # at a given tick are written before note ons
+
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+TICK_BITS = 36          # Sort keys pack (track, tick, kind) into one int64
+MAX_TICK = 1 << TICK_BITS
+
+# Variable-length quantities for every delta below 2**14, precomputed once
+VLQ_TABLE_SIZE = 1 << 14
+_VLQ_VALUES = np.arange(VLQ_TABLE_SIZE)
+VLQ_LENGTHS = np.where(_VLQ_VALUES < 0x80, 1, 2).astype(np.int64)
+VLQ_BYTES = np.stack([
+    np.where(_VLQ_VALUES < 0x80, _VLQ_VALUES, 0x80 | (_VLQ_VALUES >> 7)),
+    _VLQ_VALUES & 0x7F,
+], axis=1).astype(np.uint8)
+
+
+def varlen(value):
+    """Encode one integer as a MIDI variable-length quantity"""
+    data = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        data.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(data)
+
+
+def meta_event(meta_type, payload):
+    """A meta event at delta time zero"""
+    return b'\x00\xff' + bytes([meta_type]) + varlen(len(payload)) + payload
+
+
+def vlq_columns(deltas):
+    """Per-event VLQ lengths and a (events x 4) byte matrix, most significant byte first"""
+    if deltas.shape[0] and deltas.max() >= VLQ_TABLE_SIZE:
+        # Rare long rests: encode up to four bytes arithmetically
+        lengths = (1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)).astype(np.int64)
+        position = np.arange(4)[None, :]
+        remaining = lengths[:, None] - 1 - position
+        groups = (deltas[:, None] >> (7 * np.maximum(remaining, 0))) & 0x7F
+        packed = np.where(remaining > 0, groups | 0x80, groups)
+        return lengths, np.where(remaining >= 0, packed, 0).astype(np.uint8)
+
+    packed = np.zeros((deltas.shape[0], 4), dtype=np.uint8)
+    packed[:, :2] = VLQ_BYTES[deltas]
+    return VLQ_LENGTHS[deltas], packed
+
+
+def _deinterleave(tick, order, insertion, is_off, track, pitch, channel):
+    """Exact replica of midiutil's note de-interleaving for overlapping notes"""
+    stacks = {}
+    tick = tick.copy()
+    for index in range(tick.shape[0]):
+        # midiutil keys notes by the concatenated decimal strings
+        key = (track[index], str(pitch[index]) + str(channel[index]))
+        if not is_off[index]:
+            stacks.setdefault(key, []).append(tick[index])
+        else:
+            stack = stacks.get(key)
+            if stack:
+                if len(stack) > 1:
+                    tick[index] = stack.pop()
+                else:
+                    stack.pop()
+    return np.lexsort((insertion, order, tick, track)), tick
+
+
+def _changes(values):
+    """Mask of rows whose value differs from the previous row"""
+    changed = np.ones(values.shape[0], dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    return changed
+
+
+def encode_events(notes, ticks_per_beat=TICKS_PER_BEAT):
+    """Encode every note as delta-timed SMF events, grouped by track.
+
+    Mirrors midiutil's pipeline - beats truncated to ticks, duplicate events
+    dropped, events sorted by (tick, off-before-on, insertion order), overlapping
+    notes de-interleaved - but does it with whole-array operations over all
+    tracks at once and writes every event into one preallocated buffer.
+    Returns (buffer, track, offsets): the event bytes, and the track and byte
+    offset of each event in it.
+    """
+    count = len(notes)
+    on_tick = (notes.start * ticks_per_beat).astype(np.int64)
+    off_tick = on_tick + (notes.duration * ticks_per_beat).astype(np.int64)
+
+    # One row per event: every note on, then every note off
+    tick = np.concatenate([on_tick, off_tick])
+    is_off = np.repeat([False, True], count)
+    insertion = np.tile(np.arange(count), 2)
+    track = np.tile(notes.track.astype(np.int64), 2)
+    pitch = np.tile(notes.pitch.astype(np.int64), 2)
+    channel = np.tile(notes.channel.astype(np.int64), 2)
+    velocity = np.tile(notes.velocity.astype(np.int64), 2)
+
+    if tick.shape[0] and tick.max() >= MAX_TICK:
+        raise ValueError(f"note ends too late to encode: tick {tick.max()}")
+
+    # Drop duplicates (same track, kind, tick, pitch and channel), keeping the first added.
+    # Rows are in insertion order within each kind, so stable sorts keep ties in that order.
+    event_key = (((track * 2 + is_off) << TICK_BITS) + tick) * 2048 + pitch * 16 + channel
+    by_key = np.argsort(event_key, kind='stable')
+    duplicate = ~_changes(event_key[by_key])
+    if duplicate.any():
+        keep = np.ones(tick.shape[0], dtype=bool)
+        keep[by_key[duplicate]] = False
+        tick, is_off, insertion, track = tick[keep], is_off[keep], insertion[keep], track[keep]
+        pitch, channel, velocity = pitch[keep], channel[keep], velocity[keep]
+
+    # Sort by track, tick, note offs before note ons, then insertion order
+    order = np.where(is_off, NOTE_OFF_ORDER, NOTE_ON_ORDER)
+    ordered = np.argsort(((track << TICK_BITS) + tick) * 2 + ~is_off, kind='stable')
+    tick, order, insertion, track = tick[ordered], order[ordered], insertion[ordered], track[ordered]
+    is_off, pitch, channel, velocity = is_off[ordered], pitch[ordered], channel[ordered], velocity[ordered]
+
+    # Overlapping notes of the same pitch need midiutil's sequential fix-up
+    if tick.shape[0]:
+        voice = track * 2048 + pitch * 16 + channel
+        by_voice = np.argsort(voice, kind='stable')
+        steps = np.where(is_off[by_voice], -1, 1)
+        sounding = np.cumsum(steps)
+        group_start = _changes(voice[by_voice])
+        sounding -= (sounding - steps)[group_start][np.cumsum(group_start) - 1]
+        if sounding.max() > 1 or sounding.min() < 0:
+            resorted, tick = _deinterleave(tick, order, insertion, is_off,
+                                           track.tolist(), pitch.tolist(), channel.tolist())
+            tick, is_off, track = tick[resorted], is_off[resorted], track[resorted]
+            pitch, channel, velocity = pitch[resorted], channel[resorted], velocity[resorted]
+
+    # Delta times restart from zero at the top of every track
+    deltas = np.diff(tick, prepend=0)
+    track_start = _changes(track)
+    deltas[track_start] = tick[track_start]
+    buffer, offsets = layout_events(deltas, np.where(is_off, 0x80, 0x90) | channel, pitch, velocity)
+    return buffer, track, offsets
+
+
+def layout_events(deltas, status, pitch, velocity):
+    """Lay channel events out in one buffer: delta, status, pitch, velocity.
+
+    Returns (buffer, offsets), the event bytes and where each event starts.
+    """
+    lengths, vlq = vlq_columns(deltas)
+    sizes = lengths + 3
+    offsets = np.zeros(sizes.shape[0] + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    buffer = np.zeros(int(offsets[-1]), dtype=np.uint8)
+    offsets = offsets[:-1]
+    for byte in range(4):
+        has_byte = lengths > byte
+        buffer[offsets[has_byte] + byte] = vlq[has_byte, byte]
+    buffer[offsets + lengths] = status
+    buffer[offsets + lengths + 1] = pitch
+    buffer[offsets + lengths + 2] = velocity
+    return buffer, offsets
+
+
+def encode_midi(notes, tempo, track_names, ticks_per_beat=TICKS_PER_BEAT):
+    """Encode a NoteTable as a format 1 Standard MIDI File.
+
+    The layout matches midiutil.MIDIFile(len(track_names)) with a tempo
+    track in front, so for the same notes the bytes are identical to what
+    MIDIFile.writeFile would have produced.
+    """
+    buffer, track, offsets = encode_events(notes, ticks_per_beat)
+    bounds = np.append(offsets, buffer.shape[0])[np.searchsorted(track, np.arange(len(track_names) + 1))]
+    events = memoryview(buffer)
+
+    chunks = [
+        b'MThd' + struct.pack('>LHHH', 6, 1, len(track_names) + 1, ticks_per_beat),
+        _track_chunk(meta_event(0x51, struct.pack('>L', int(60000000 / tempo))[1:])),
+    ]
+    for index, name in enumerate(track_names):
+        header = meta_event(0x03, name.encode('ISO-8859-1')) if name is not None else b''
+        chunks.append(_track_chunk(header, events[bounds[index]:bounds[index + 1]]))
+
+    # Assemble into one preallocated output buffer
+    output = bytearray(sum(len(chunk) for chunk in chunks))
+    view = memoryview(output)
+    position = 0
+    for chunk in chunks:
+        view[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return bytes(output)
+
+
+def _track_chunk(header, events=b''):
+    length = len(header) + len(events) + len(END_OF_TRACK)
+    return b''.join((b'MTrk', struct.pack('>L', length), header, events, END_OF_TRACK))
@@ -0,0 +1,226 @@
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+# Pitch class of every root spelling we accept
+NOTE_CLASSES = {
+    'C': 0, 'B#': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'Fb': 4,
+    'F': 5, 'E#': 5, 'F#': 6, 'Gb': 6, 'G': 7, 'G#': 8, 'Ab': 8, 'A': 9,
+    'A#': 10, 'Bb': 10, 'B': 11, 'Cb': 11,
+}
+
+# Chord tones above the root, in semitones
+CHORD_QUALITIES = {
+    '': (0, 4, 7), 'm': (0, 3, 7), 'dim': (0, 3, 6), 'aug': (0, 4, 8),
+    'sus2': (0, 2, 7), 'sus4': (0, 5, 7),
+    '6': (0, 4, 7, 9), 'm6': (0, 3, 7, 9),
+    '7': (0, 4, 7, 10), 'maj7': (0, 4, 7, 11), 'm7': (0, 3, 7, 10), 'mmaj7': (0, 3, 7, 11),
+    'dim7': (0, 3, 6, 9), 'm7b5': (0, 3, 6, 10), 'aug7': (0, 4, 8, 10), '7sus4': (0, 5, 7, 10),
+    'add9': (0, 4, 7, 14), 'madd9': (0, 3, 7, 14),
+    '9': (0, 4, 7, 10, 14), 'maj9': (0, 4, 7, 11, 14), 'm9': (0, 3, 7, 10, 14),
+}
+
+# Alternative spellings of the qualities above
+QUALITY_ALIASES = {
+    'maj': '', 'M': '', 'min': 'm', '-': 'm', 'o': 'dim', '°': 'dim', '+': 'aug', 'sus': 'sus4',
+    'M7': 'maj7', 'Δ': 'maj7', 'Δ7': 'maj7', 'min7': 'm7', '-7': 'm7', 'dom7': '7',
+    'mM7': 'mmaj7', 'minmaj7': 'mmaj7', 'ø': 'm7b5', 'ø7': 'm7b5', 'min7b5': 'm7b5',
+    'o7': 'dim7', '°7': 'dim7', '+7': 'aug7', 'M9': 'maj9', 'min9': 'm9', 'min6': 'm6',
+}
+
+CHORD_PATTERN = re.compile(r'^([A-G][#b]?)(.*?)(?:/([A-G][#b]?))?$')
+
+# Harmony voicings sit with the root between Ab3 and G4, the bass two octaves lower
+HARMONY_ROOT = 60
+HIGHEST_ROOT_CLASS = 7
+BASS_OFFSET = -24
+
+# Scale degrees of the major scale in semitones; progressions are written
+# as Roman numerals over it, with b/# for chromatic roots
+MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+MINOR_SCALE = (0, 2, 3, 5, 7, 8, 10)
+NUMERAL_DEGREES = {'I': 0, 'II': 1, 'III': 2, 'IV': 3, 'V': 4, 'VI': 5, 'VII': 6}
+NUMERAL_PATTERN = re.compile(r'^([b#]?)(VII|VI|V|IV|III|II|I|vii|vi|v|iv|iii|ii|i)(.*)$')
+DIMINISHED_SUFFIXES = {'o', '°', 'o7', '°7', 'ø', 'ø7', 'dim', 'dim7', 'm7b5'}
+
+# Chord roots are spelled with flats in the flat keys, with sharps elsewhere
+SHARP_NAMES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+FLAT_NAMES = ('C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B')
+FLAT_KEYS = {'Db', 'Eb', 'F', 'Ab', 'Bb', 'Cm', 'Dm', 'Ebm', 'Fm', 'Gm', 'Bbm'}
+
+# The 24 keys, indexed by mode then tonic pitch class
+KEY_NAMES = {
+    'major': ('C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B'),
+    'minor': ('Cm', 'C#m', 'Dm', 'Ebm', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'Bbm', 'Bm'),
+}
+ALL_KEYS = KEY_NAMES['major'] + KEY_NAMES['minor']
+KEY_SUFFIXES = {'': 'major', ' major': 'major', 'maj': 'major', 'm': 'minor', ' minor': 'minor', 'min': 'minor'}
+
+Chord = namedtuple('Chord', 'symbol root quality voicing bass')
+
+# A key: its tonic and the tonic of its relative major as pitch classes, and
+# how far each is moved from C, in semitones within the harmony register.
+# Progressions are realized over the relative major, so a minor key plays its
+# relative major's chords under a melody centred on its own tonic.
+Key = namedtuple('Key', 'name tonic mode major_tonic melody_shift chord_shift')
+
+
+def root_pitch(pitch_class):
+    """Harmony register MIDI pitch for a root pitch class"""
+    return HARMONY_ROOT + pitch_class - (12 if pitch_class > HIGHEST_ROOT_CLASS else 0)
+
+
+def build_chord(symbol, root, quality, bass_class=None):
+    """Voice one chord: its harmony pitches and the bass note under it"""
+    pitch_class = NOTE_CLASSES[root]
+    root_note = root_pitch(pitch_class)
+    bass = root_pitch(NOTE_CLASSES[bass_class]) if bass_class else root_note
+    voicing = tuple(root_note + interval for interval in CHORD_QUALITIES[quality])
+    return Chord(sys.intern(symbol), pitch_class, quality, voicing, bass + BASS_OFFSET)
+
+
+def build_chord_table():
+    """Every root spelling x quality spelling, voiced once"""
+    table = {}
+    suffixes = dict(QUALITY_ALIASES, **{quality: quality for quality in CHORD_QUALITIES})
+    for root in NOTE_CLASSES:
+        for suffix, quality in suffixes.items():
+            table[root + suffix] = build_chord(root + suffix, root, quality)
+    return table
+
+
+CHORD_TABLE = build_chord_table()
+
+
+def parse_chord(symbol):
+    """Parse a chord symbol such as 'F#m7', 'Bbmaj7' or 'C/G' into a Chord"""
+    match = CHORD_PATTERN.match(symbol)
+    if not match:
+        raise ValueError(f"unrecognised chord symbol: {symbol!r}")
+    root, suffix, bass = match.groups()
+    quality = QUALITY_ALIASES.get(suffix, suffix)
+    if quality not in CHORD_QUALITIES:
+        raise ValueError(f"unrecognised chord quality {suffix!r} in {symbol!r}")
+    return build_chord(symbol, root, quality, bass)
+
+
+def lookup_chord(name):
+    """Chord for a progression entry; one dict lookup for any known symbol.
+
+    Entries that are not plain symbols (tuples rendered as strings, extra
+    words) are cleaned down to their first symbol. A symbol not in the
+    table yet, such as a slash chord, is parsed once and interned in
+    CHORD_TABLE under that symbol alone, never under the raw entry, so no
+    input can grow the table beyond the symbols there are. Raises
+    ValueError for chords that cannot be parsed.
+    """
+    chord = CHORD_TABLE.get(name)
+    if chord is None:
+        words = re.sub(r"[()',]", '', str(name)).split()
+        if not words:
+            raise ValueError(f"empty chord symbol: {name!r}")
+        chord = CHORD_TABLE.get(words[0])
+        if chord is None:
+            chord = parse_chord(words[0])
+            CHORD_TABLE[chord.symbol] = chord
+    return chord
+
+
+def register_shift(pitch_class):
+    """Semitones from C to a pitch class in the harmony register (-4 to +7)"""
+    return root_pitch(pitch_class) - HARMONY_ROOT
+
+
+def build_key_table():
+    """Every root spelling x mode spelling, e.g. 'Bb', 'A#', 'Am', 'A minor'"""
+    table = {}
+    for root, pitch_class in NOTE_CLASSES.items():
+        for suffix, mode in KEY_SUFFIXES.items():
+            major_tonic = pitch_class if mode == 'major' else (pitch_class + 3) % 12
+            name = KEY_NAMES[mode][pitch_class]
+            table[root + suffix] = Key(name, pitch_class, mode, major_tonic, register_shift(pitch_class),
+                                       register_shift(major_tonic))
+    return table
+
+
+KEY_TABLE = build_key_table()
+
+
+def lookup_key(name):
+    """Key for a name such as 'G', 'F#m' or 'Bb minor'; raises ValueError for unknown keys"""
+    key = KEY_TABLE.get(name)
+    if key is None:
+        raise ValueError(f"unknown key: {name!r}")
+    return key
+
+
+def spell(pitch_class, key):
+    """Name of a pitch class as spelled in a key"""
+    return (FLAT_NAMES if key.name in FLAT_KEYS else SHARP_NAMES)[pitch_class % 12]
+
+
+@lru_cache(maxsize=None)
+def parse_numeral(numeral):
+    """(semitones above the major tonic, chord quality) for a numeral such as 'vi', 'bVII' or 'V7'.
+
+    Upper case numerals are major chords and lower case ones minor, so 'V7'
+    is a dominant seventh and 'ii7' a minor seventh; 'viio' is diminished.
+    """
+    match = NUMERAL_PATTERN.match(numeral)
+    if not match:
+        raise ValueError(f"unrecognised scale degree: {numeral!r}")
+    accidental, degree, suffix = match.groups()
+    if degree.islower() and suffix not in DIMINISHED_SUFFIXES:
+        suffix = 'm' + suffix
+    quality = QUALITY_ALIASES.get(suffix, suffix)
+    if quality not in CHORD_QUALITIES:
+        raise ValueError(f"unrecognised chord quality {suffix!r} in {numeral!r}")
+    offset = MAJOR_SCALE[NUMERAL_DEGREES[degree.upper()]] + {'b': -1, '#': 1, '': 0}[accidental]
+    return offset % 12, quality
+
+
+@lru_cache(maxsize=4096)
+def realize_progression(numerals, key_name):
+    """Chord symbols of a progression of numerals in a key, e.g. ('I', 'V', 'vi', 'IV') in G"""
+    key = lookup_key(key_name)
+    chords = []
+    for numeral in numerals:
+        offset, quality = parse_numeral(numeral)
+        chords.append(sys.intern(spell(key.major_tonic + offset, key) + quality))
+    return tuple(chords)
+
+
+def transpose_progression(chord_names, source_key, target_key):
+    """Chord symbols moved from one key to another, respelled for the target key.
+
+    The move is between the keys' relative majors, so a progression realized
+    in one key comes out exactly as realize_progression gives it in the other.
+    """
+    source, target = lookup_key(source_key), lookup_key(target_key)
+    interval = target.major_tonic - source.major_tonic
+    chords = []
+    for name in chord_names:
+        chord = lookup_chord(name)
+        symbol = spell(chord.root + interval, target) + chord.quality
+        bass_class = (chord.bass - BASS_OFFSET) % 12
+        if bass_class != chord.root:
+            symbol += '/' + spell(bass_class + interval, target)
+        chords.append(sys.intern(symbol))
+    return tuple(chords)
+
+
+@lru_cache(maxsize=4096)
+def chord_in_key(name, key_name):
+    """(voicing, bass) of a progression chord as it sounds transposed to C.
+
+    Rendering voices chords this way and then moves them by the key's
+    chord_shift, so every key shares one voicing of the same progression
+    and changing key is a single transposition.
+    """
+    key = lookup_key(key_name)
+    chord = lookup_chord(name)
+    root = root_pitch((chord.root - key.major_tonic) % 12)
+    voicing = tuple(root + interval for interval in CHORD_QUALITIES[chord.quality])
+    bass = root_pitch((chord.bass - BASS_OFFSET - key.major_tonic) % 12) + BASS_OFFSET
+    return voicing, bass
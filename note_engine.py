@@ -0,0 +1,278 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+PITCH_DTYPE = np.int16
+VELOCITY_DTYPE = np.int16
+CHANNEL_DTYPE = np.uint8
+TRACK_DTYPE = np.uint8
+
+STEPS_PER_BAR = 16      # Drum grids are sixteenth notes in 4/4
+BEATS_PER_BAR = 4.0
+
+
+class NoteTable:
+    """Columnar note events: one NumPy array per field, one row per note.
+
+    Track generators fill these with whole-array operations instead of
+    issuing one MIDIFile.addNote call per note. Row order is the order the
+    notes would have been added, which keeps serialization deterministic.
+    """
+
+    __slots__ = ('pitch', 'start', 'duration', 'velocity', 'channel', 'track')
+
+    def __init__(self, pitch, start, duration, velocity, channel, track):
+        self.pitch = pitch
+        self.start = start
+        self.duration = duration
+        self.velocity = velocity
+        self.channel = channel
+        self.track = track
+
+    @classmethod
+    def block(cls, track, channel, pitch, start, duration, velocity):
+        """Build a table from per-note arrays, broadcasting scalar fields"""
+        start = np.asarray(start, dtype=np.float64)
+        count = start.shape[0]
+        return cls(
+            np.broadcast_to(np.asarray(pitch, dtype=PITCH_DTYPE), (count,)).copy(),
+            start,
+            np.broadcast_to(np.asarray(duration, dtype=np.float64), (count,)).copy(),
+            np.broadcast_to(np.asarray(velocity, dtype=VELOCITY_DTYPE), (count,)).copy(),
+            np.full(count, channel, dtype=CHANNEL_DTYPE),
+            np.full(count, track, dtype=TRACK_DTYPE),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls.block(0, 0, [], [], [], [])
+
+    @classmethod
+    def concat(cls, tables):
+        """Join tables end to end, keeping row order"""
+        tables = list(tables)
+        if not tables:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(table, name) for table in tables]) for name in cls.__slots__))
+
+    def __len__(self):
+        return self.start.shape[0]
+
+    def take(self, rows):
+        """Copy of the given rows, in the given order"""
+        return NoteTable(*(getattr(self, name)[rows] for name in self.__slots__))
+
+    def shifted(self, beats):
+        """Copy of the table moved later in time by the given number of beats"""
+        return NoteTable(self.pitch, self.start + beats, self.duration, self.velocity, self.channel, self.track)
+
+    def transposed(self, semitones):
+        """Copy of the table with pitches moved by semitones (a number, or one per row)"""
+        pitch = (self.pitch + np.asarray(semitones, dtype=PITCH_DTYPE)).astype(PITCH_DTYPE)
+        return NoteTable(pitch, self.start, self.duration, self.velocity, self.channel, self.track)
+
+    def end_time(self):
+        """Time in beats when the last note stops sounding"""
+        return float((self.start + self.duration).max()) if len(self) else 0.0
+
+    def add_to(self, midi_file):
+        """Serialize every row into a MIDIFile in a single pass"""
+        for track, channel, pitch, start, duration, velocity in zip(
+                self.track.tolist(), self.channel.tolist(), self.pitch.tolist(),
+                self.start.tolist(), self.duration.tolist(), self.velocity.tolist()):
+            midi_file.addNote(track, channel, pitch, start, duration, velocity)
+
+
+class NoteTrack:
+    """One instrument's notes as read-only columns, hashable by content.
+
+    A track never changes once built: the column arrays are taken over and
+    marked read-only, and replace() returns a variation that shares every
+    column it does not change, so many variations of a song only cost the
+    columns they touch. Tracks with the same notes are equal and hash
+    equal, through a digest of the columns computed on first use, so they
+    can key caches.
+    """
+
+    __slots__ = ('channel', 'pitch', 'start', 'duration', 'velocity', '_digest')
+    COLUMNS = ('pitch', 'start', 'duration', 'velocity')
+    DTYPES = (PITCH_DTYPE, np.float64, np.float64, VELOCITY_DTYPE)
+
+    def __init__(self, channel, pitch, start, duration, velocity):
+        self.channel = int(channel)
+        for name, dtype, column in zip(self.COLUMNS, self.DTYPES, (pitch, start, duration, velocity)):
+            column = np.asarray(column, dtype=dtype)
+            if column.flags.writeable:
+                column = column.view()
+                column.flags.writeable = False
+            setattr(self, name, column)
+        if not self.pitch.shape == self.start.shape == self.duration.shape == self.velocity.shape:
+            raise ValueError("note track columns must have the same length")
+        self._digest = None
+
+    @classmethod
+    def from_table(cls, table):
+        """The notes of a NoteTable holding a single track"""
+        return cls(table.channel[0] if len(table) else 0, table.pitch, table.start, table.duration, table.velocity)
+
+    def to_table(self, track):
+        """The notes as a NoteTable for track number track, sharing the columns"""
+        count = len(self)
+        return NoteTable(self.pitch, self.start, self.duration, self.velocity,
+                         np.full(count, self.channel, dtype=CHANNEL_DTYPE), np.full(count, track, dtype=TRACK_DTYPE))
+
+    def replace(self, **changes):
+        """A variation with some columns (or the channel) changed, sharing the others"""
+        fields = {name: getattr(self, name) for name in ('channel',) + self.COLUMNS}
+        fields.update(changes)
+        return NoteTrack(**fields)
+
+    def transposed(self, semitones):
+        """The track moved by semitones; the same track when that is zero"""
+        return self.replace(pitch=self.pitch + semitones) if semitones else self
+
+    def digest(self):
+        """16-byte BLAKE2b of the channel and columns"""
+        if self._digest is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(self.channel.to_bytes(1, 'big') + len(self).to_bytes(8, 'big'))
+            for name in self.COLUMNS:
+                digest.update(np.ascontiguousarray(getattr(self, name)).data)
+            self._digest = digest.digest()
+        return self._digest
+
+    def __len__(self):
+        return self.start.shape[0]
+
+    def __eq__(self, other):
+        if not isinstance(other, NoteTrack):
+            return NotImplemented
+        return self is other or self.digest() == other.digest()
+
+    def __hash__(self):
+        return int.from_bytes(self.digest()[:8], 'big')
+
+
+class SectionCache:
+    """LRU of rendered section libraries, see assemble_sections.
+
+    Libraries are shared between songs and never modified after rendering,
+    so a chorus rendered once is reused by every later section of that type.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.libraries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Cached library for key, calling render() to build it on a miss"""
+        library = self.libraries.get(key)
+        if library is not None:
+            self.libraries.move_to_end(key)
+            self.hits += 1
+            return library
+        self.misses += 1
+        library = render()
+        self.libraries[key] = library
+        if len(self.libraries) > self.max_entries:
+            self.libraries.popitem(last=False)
+        return library
+
+
+def section_library(blocks, lengths):
+    """Lay section blocks end to end: (table, rows per block, length in beats per block)"""
+    return (NoteTable.concat(blocks), np.array([len(block) for block in blocks], dtype=np.int64),
+            np.asarray(lengths, dtype=np.float64))
+
+
+def transpose_library(library, semitones):
+    """The same section library with every pitch moved by semitones"""
+    if not semitones:
+        return library
+    table, sizes, lengths = library
+    return table.transposed(semitones), sizes, lengths
+
+
+def assemble_sections(library, plan):
+    """Splice section blocks into one timeline.
+
+    library is (table, sizes, lengths) as built by section_library; section
+    i of the song plays block plan[i], starting where section i-1 ended.
+    Every section is placed with whole-array gathers, so the Python cost
+    does not grow with the number of sections.
+    """
+    table, sizes, lengths = library
+    plan = np.asarray(plan, dtype=np.int64)
+    if not plan.shape[0]:
+        return NoteTable.empty()
+
+    counts = sizes[plan]
+    first_row = (np.cumsum(sizes) - sizes)[plan]
+    placed = np.cumsum(counts) - counts
+    rows = np.arange(placed[-1] + counts[-1]) + np.repeat(first_row - placed, counts)
+
+    notes = table.take(rows)
+    notes.start = notes.start + np.repeat(sequential_starts(lengths[plan]), counts)
+    return notes
+
+
+def clamped_walk(start, intervals, low=48, high=84):
+    """Apply intervals cumulatively from start, clamping after every step"""
+    pitches = []
+    pitch = start
+    for interval in intervals:
+        pitch = max(low, min(high, pitch + interval))
+        pitches.append(pitch)
+    return pitches
+
+
+def clamped_walks(starts, intervals, low=48, high=84):
+    """clamped_walk for many rows at once: starts (rows,), intervals (rows x steps)"""
+    pitches = np.empty(intervals.shape, dtype=np.int64)
+    pitch = np.asarray(starts, dtype=np.int64)
+    for step in range(intervals.shape[1]):
+        pitch = np.clip(pitch + intervals[:, step], low, high)
+        pitches[:, step] = pitch
+    return pitches
+
+
+def tile_progression(pitches, chord_index, offsets, chords, sections, chord_beats=2.0):
+    """Repeat one pass of a chord-synchronous pattern over several sections.
+
+    pitches, chord_index and offsets describe the notes of a single pass
+    through a progression of `chords` chords; each note starts at its chord's
+    slot time plus its offset. Returns (pitch, start) arrays for every section.
+    """
+    chord_index = np.asarray(chord_index)
+    slots = (np.arange(sections)[:, None] * chords + chord_index[None, :]).ravel()
+    start = slots * chord_beats + np.tile(np.asarray(offsets, dtype=np.float64), sections)
+    return np.tile(np.asarray(pitches, dtype=PITCH_DTYPE), sections), start
+
+
+def tile_drum_grid(hits, instruments, velocities, durations, bars):
+    """Expand a (16 step x instrument) boolean grid over a number of bars.
+
+    Rows come out bar by bar, step by step, in instrument order within a
+    step - the same order a per-step loop would have produced.
+    """
+    steps, columns = np.nonzero(hits)
+    per_bar = steps.shape[0]
+    bar_index = np.repeat(np.arange(bars), per_bar)
+    start = bar_index * BEATS_PER_BAR + np.tile(steps * (BEATS_PER_BAR / STEPS_PER_BAR), bars)
+    return (
+        np.tile(np.asarray(instruments, dtype=PITCH_DTYPE)[columns], bars),
+        start,
+        np.tile(np.asarray(durations, dtype=np.float64)[columns], bars),
+        np.tile(np.asarray(velocities, dtype=VELOCITY_DTYPE)[columns], bars),
+    )
+
+
+def sequential_starts(durations):
+    """Start times for notes played back to back (exactly like time += duration)"""
+    starts = np.zeros(durations.shape[0], dtype=np.float64)
+    if durations.shape[0] > 1:
+        np.cumsum(durations[:-1], out=starts[1:])
+    return starts
@@ -0,0 +1,95 @@
+import random
+from itertools import islice
+
+
+def batched(iterable, size):
+    """Yield successive tuples of up to `size` items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = tuple(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bounded_map(executor, fn, iterable, max_in_flight):
+    """Map fn over iterable on executor with at most max_in_flight pending tasks.
+
+    Items are pulled from the iterable lazily, so arbitrarily long inputs never
+    get materialized as futures all at once. Results are yielded in completion
+    order, not submission order.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    pending = set()
+    for item in iterable:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+
+def run_batches(fn, batches, workers, consume, initializer=None):
+    """Feed batches through fn, inline or on a bounded process pool"""
+    if workers == 1:
+        if initializer is not None:
+            initializer()
+        for batch in batches:
+            consume(fn(batch))
+        return
+
+    # Only pools need multiprocessing, a large share of startup time when imported eagerly
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        for results in bounded_map(executor, fn, batches, workers * 2):
+            consume(results)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyReservoir:
+    """A uniform sample of at most size values (reservoir sampling), for percentiles of any number of them.
+
+    The count and the maximum are exact; percentiles come from the sample,
+    so they are exact up to size values and estimates beyond that.
+    """
+
+    def __init__(self, size=10000, seed=0):
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.max = 0.0
+        self.rng = random.Random(seed)
+
+    def add(self, value):
+        self.count += 1
+        self.max = max(self.max, value)
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = self.rng.randrange(self.count)
+            if slot < self.size:
+                self.values[slot] = value
+
+    def summary(self):
+        values = sorted(self.values)
+        return {
+            'p50': percentile(values, 0.50),
+            'p90': percentile(values, 0.90),
+            'p99': percentile(values, 0.99),
+            'max': self.max,
+        }
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+
+from midi_analysis import atomic_write
+
+CACHE_VERSION = 4       # Bump whenever rendering changes the bytes for the same elements
+
+# Elements that determine a rendered song
+KEY_FIELDS = ('genre', 'vibe', 'tempo_category', 'chord_progression', 'catchiness', 'key', 'structure',
+              'rhythm', 'seed')
+
+ENTRY_HEADER = struct.Struct('>H')      # tempo, followed by the MIDI bytes
+
+
+def result_key(elements, melody_model=None):
+    """Stable cache key for elements plus seed; None when there is no seed to key on.
+
+    melody_model is the fingerprint of the MelodyModel rendering the song, if any.
+    """
+    if elements.get('seed') is None:
+        return None
+    canonical = {field: elements.get(field) for field in KEY_FIELDS}
+    if melody_model is not None:
+        canonical['melody_model'] = melody_model
+    canonical['chord_progression'] = [str(chord) for chord in canonical['chord_progression'] or ()]
+    canonical['structure'] = [str(section) for section in canonical['structure'] or ()]
+    encoded = json.dumps([CACHE_VERSION, canonical], sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Two-tier LRU of rendered songs: (tempo, MIDI bytes) by result_key.
+
+    The memory tier is bounded by total MIDI bytes. With disk_dir, entries
+    are also written through to one file each under disk_dir/v<version>,
+    evicted least recently used first once they exceed disk_max_bytes; a
+    memory miss that hits disk is promoted back into memory.
+    """
+
+    def __init__(self, max_bytes=64 << 20, disk_dir=None, disk_max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = os.path.join(disk_dir, f"v{CACHE_VERSION}") if disk_dir else None
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self.counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0,
+                         'memory_evictions': 0, 'disk_evictions': 0}
+        if self.disk_dir:
+            self._scan_disk()
+
+    def get(self, key):
+        """Cached (tempo, midi_data) for key, or None"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            self.counters['hits'] += 1
+            self.counters['memory_hits'] += 1
+            return entry
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self.counters['hits'] += 1
+            self.counters['disk_hits'] += 1
+            self._remember(key, entry)
+            return entry
+
+        self.counters['misses'] += 1
+        return None
+
+    def put(self, key, tempo, midi_data):
+        """Store a rendered song in memory and, if configured, on disk"""
+        if key is None:
+            return
+        self.counters['stores'] += 1
+        self._remember(key, (tempo, midi_data))
+        if self.disk_dir and key not in self.disk:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, ENTRY_HEADER.pack(tempo) + midi_data)
+            self.disk[key] = ENTRY_HEADER.size + len(midi_data)
+            self.disk_bytes += self.disk[key]
+            self._evict_disk()
+
+    def stats(self):
+        """Counters plus the current size of each tier"""
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, **{
+            'hit_rate': self.counters['hits'] / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory_bytes,
+            'disk_entries': len(self.disk),
+            'disk_bytes': self.disk_bytes,
+        })
+
+    def _remember(self, key, entry):
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key)[1])
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+        self.memory[key] = entry
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_bytes:
+            _, (_, evicted) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.counters['memory_evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.bin")
+
+    def _scan_disk(self):
+        """Index entries left by earlier runs, oldest access first"""
+        entries = []
+        if os.path.isdir(self.disk_dir):
+            for shard in os.scandir(self.disk_dir):
+                if shard.is_dir():
+                    for entry in os.scandir(shard.path):
+                        if entry.name.endswith('.bin'):
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime_ns, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key):
+        if key not in self.disk:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Removed behind our back (another process evicted it)
+            self.disk_bytes -= self.disk.pop(key)
+            return None
+        self.disk.move_to_end(key)
+        return ENTRY_HEADER.unpack_from(data)[0], data[ENTRY_HEADER.size:]
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.disk_max_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self.counters['disk_evictions'] += 1
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
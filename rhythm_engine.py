@@ -0,0 +1,54 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# Rhythms are compiled onto a grid of RHYTHM_GRID steps per beat. A step is
+# a power-of-two fraction of a beat, so step times are exact binary floats,
+# and 960 ticks per beat (midi_writer) divides into exactly 15 ticks a step.
+RHYTHM_GRID = 64
+
+# A compiled rhythm pattern: onsets and durations in grid steps, and the
+# pattern's whole length in steps
+Rhythm = namedtuple('Rhythm', 'onsets durations length')
+
+
+def quantize(beats, grid=RHYTHM_GRID):
+    """Snap beat times to the nearest grid step"""
+    return np.round(np.asarray(beats, dtype=np.float64) * grid) / grid
+
+
+@lru_cache(maxsize=None)
+def compile_rhythm(pattern, grid=RHYTHM_GRID):
+    """Compile a tuple of note durations in beats into a Rhythm on the grid.
+
+    Note ends are rounded rather than each duration, so rounding errors do
+    not add up: (0.67, 0.33) compiles to 43 + 21 steps, exactly one beat.
+    Compiled rhythms are cached and their arrays are read-only.
+    """
+    ends = np.round(np.cumsum(pattern) * grid).astype(np.int64)
+    onsets = np.concatenate(([0], ends[:-1]))
+    durations = ends - onsets
+    if durations.shape[0] == 0 or durations.min() < 1:
+        raise ValueError(f"rhythm pattern needs notes of at least one grid step: {pattern}")
+    for array in (onsets, durations):
+        array.setflags(write=False)
+    return Rhythm(onsets, durations, int(ends[-1]))
+
+
+def sample_durations(rhythm, rng, rows, notes, grid=RHYTHM_GRID):
+    """(rows, notes) durations in beats read off a rhythm from random starting notes.
+
+    Each row plays the pattern in a loop from one note drawn with the numpy
+    Generator rng, so a whole block of phrases takes one draw and a gather.
+    """
+    positions = (rng.integers(rhythm.durations.shape[0], size=rows)[:, None] + np.arange(notes)) % rhythm.durations.shape[0]
+    return rhythm.durations[positions] / grid
+
+
+def tile_onsets(rhythm, beats, grid=RHYTHM_GRID):
+    """Onset times in beats of a rhythm looped over a number of beats"""
+    total = int(round(beats * grid))
+    loops = -(-total // rhythm.length)
+    onsets = (np.arange(loops)[:, None] * rhythm.length + rhythm.onsets).ravel()
+    return onsets[onsets < total] / grid
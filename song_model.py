@@ -0,0 +1,142 @@
+import sys
+from functools import lru_cache
+
+from result_cache import result_key
+
+DEFAULT_STRUCTURE = ('intro', 'verse', 'chorus', 'verse', 'chorus', 'bridge', 'chorus', 'outro')
+
+
+@lru_cache(maxsize=4096)
+def _shared(values):
+    return tuple(sys.intern(value) if type(value) is str else value for value in values)
+
+
+def shared_tuple(values):
+    """values as a tuple of interned strings, the same tuple object for equal values.
+
+    Structures and progressions repeat across most songs of a batch, so
+    specs holding them this way share one copy instead of a list each.
+    """
+    values = tuple(values)
+    try:
+        return _shared(values)
+    except TypeError:       # Unhashable entries are left for validation to reject
+        return values
+
+
+class Record:
+    """Base of the slotted records below.
+
+    Fields are plain attributes, and the records also answer the mapping
+    interface of the dicts they replace - record['genre'], get, in, items,
+    update, copy - so code written against those dicts keeps working.
+    Fields in OPTIONAL count as absent while they are None.
+    """
+
+    __slots__ = ()
+    OPTIONAL = frozenset()
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.pop(field, None))
+        if fields:
+            raise TypeError(f"unknown {type(self).__name__} fields: {', '.join(fields)}")
+
+    def __getitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and (field not in self.OPTIONAL or getattr(self, field) is not None)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    __hash__ = None         # Mutable; see SongSpec.cache_key for a stable key
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{field}={value!r}' for field, value in self.items())})"
+
+    def keys(self):
+        return [field for field in self.__slots__ if field in self]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self else default
+
+    def update(self, other=(), **changes):
+        """Set fields from a mapping or (field, value) pairs, then from keywords"""
+        for field, value in (other.items() if hasattr(other, 'items') else other):
+            self[field] = value
+        for field, value in changes.items():
+            self[field] = value
+
+    def copy(self, **changes):
+        """Shallow copy, with some fields changed"""
+        record = object.__new__(type(self))
+        for field in self.__slots__:
+            setattr(record, field, getattr(self, field))
+        if changes:
+            record.update(changes)
+        return record
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+class SongSpec(Record):
+    """The musical elements of one song, as parse_text_prompt finds them.
+
+    chord_progression and structure are tuples, shared between specs when
+    they come from the knowledge base or through shared_tuple, so a spec
+    costs one small object. rhythm None means the vibe or genre picks one.
+    """
+
+    __slots__ = ('genre', 'vibe', 'tempo_category', 'chord_progression', 'catchiness', 'key', 'structure',
+                 'rhythm', 'seed')
+
+    def __init__(self, genre='pop', vibe='catchy', tempo_category='medium', chord_progression=None, catchiness=7,
+                 key='C', structure=DEFAULT_STRUCTURE, rhythm=None, seed=None):
+        self.genre = genre
+        self.vibe = vibe
+        self.tempo_category = tempo_category
+        self.chord_progression = chord_progression
+        self.catchiness = catchiness
+        self.key = key
+        self.structure = structure
+        self.rhythm = rhythm
+        self.seed = seed
+
+    def cache_key(self, melody_model=None):
+        """Stable key of the song these elements render to (see result_cache.result_key)"""
+        return result_key(self, melody_model)
+
+
+class SongResult(Record):
+    """What rendering or streaming a song produced; fields that do not apply stay None.
+
+    prompt_elements is the SongSpec it was rendered from (None for songs
+    built from learned patterns, which have a melody_pattern instead);
+    streamed songs count bars and events; search_variations ranks and
+    scores its winners.
+    """
+
+    __slots__ = ('prompt_elements', 'chord_progression', 'key', 'tempo', 'file_path', 'catchiness_level', 'seed',
+                 'midi_data', 'melody_pattern', 'bars', 'events', 'rank', 'score', 'metrics')
+    OPTIONAL = frozenset(__slots__)
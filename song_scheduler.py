@@ -0,0 +1,328 @@
+import asyncio
+import contextlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from functools import partial
+
+from gen_song import init_batch_worker, render_batch_chunk
+from parallel import percentile
+
+# Priority classes, most urgent first. A class only gets a free worker when
+# no class before it has a job that may run.
+PRIORITY_CLASSES = ('interactive', 'standard', 'bulk')
+BACKGROUND_CLASS = PRIORITY_CLASSES[-1]
+
+# Most jobs of a class rendered per worker task. Larger batches cost less per
+# song but hold the worker longer before a more urgent job can have it; a
+# batch only takes jobs already waiting, so at low load jobs still go singly.
+BATCH_SIZES = {'interactive': 8, 'standard': 8, 'bulk': 4}
+
+LATENCY_WINDOW = 10000      # Jobs per class kept for the wait and latency percentiles
+
+
+class SchedulerBusy(Exception):
+    """Raised when the scheduler's queue is full"""
+
+
+class DeadlineExceeded(Exception):
+    """Set on a job whose deadline passed before its song was ready"""
+
+
+class Job:
+    """One queued song; await job.future for the render result, cancel it to drop the job"""
+
+    __slots__ = ('id', 'spec', 'priority', 'tenant', 'future', 'submitted', 'dispatched', 'timer')
+
+    def __init__(self, job_id, spec, priority, tenant, future):
+        self.id = job_id
+        self.spec = spec                # The spec as a JSON line, as render_batch_chunk takes it
+        self.priority = priority
+        self.tenant = tenant
+        self.future = future
+        self.submitted = time.perf_counter()
+        self.dispatched = None          # When it left the queue for a worker
+        self.timer = None               # Deadline handle
+
+
+def render_jobs(batch):
+    """Render a batch of (job id, spec JSON) pairs in a warm worker; runs inside worker processes"""
+    return render_batch_chunk(batch, None, in_memory=True)
+
+
+def latency_summary(window):
+    values = sorted(window)
+    return {
+        'p50': percentile(values, 0.50),
+        'p90': percentile(values, 0.90),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else 0.0,
+    }
+
+
+class SongScheduler:
+    """Priority scheduler in front of a warm process pool of song renderers.
+
+    Jobs wait in one queue per priority class and tenant. Whenever a worker
+    is free, the most urgent class with a runnable job fills a batch of up
+    to BATCH_SIZES[class] jobs, taking tenants in turn. A tenant's jobs
+    never occupy more than its limit of workers at once. At most one batch per
+    worker is in flight, so an urgent job waits for at most one batch to
+    finish, never behind a backlog. reserved workers are kept from the
+    background (bulk) class altogether. With linger, a class with fewer
+    jobs waiting than make a batch holds its oldest job up to that many
+    seconds for the batch to fill, trading latency at low load for
+    throughput at high load; less urgent classes may use free workers
+    meanwhile.
+
+    A job whose deadline passes fails with DeadlineExceeded. A cancelled
+    job is skipped if it is still queued. If it is already rendering, its
+    result is thrown away: workers cannot be interrupted mid-song. If a
+    worker dies, the batches in flight fail and the pool is replaced.
+    """
+
+    def __init__(self, workers=None, tenant_limit=None, tenant_limits=None, reserved=None, queue_size=100_000,
+                 batch_sizes=None, linger=0.0, initializer=init_batch_worker):
+        self.workers = workers or os.cpu_count() or 1
+        self.tenant_limit = tenant_limit or self.workers
+        self.tenant_limits = dict(tenant_limits or {})
+        # With several workers one stays free of bulk work unless asked otherwise
+        self.reserved = min(1 if reserved is None else reserved, self.workers - 1)
+        self.queue_size = queue_size
+        self.batch_sizes = dict(BATCH_SIZES, **(batch_sizes or {}))
+        self.linger = linger
+        self.initializer = initializer
+        self.queues = {priority: {} for priority in PRIORITY_CLASSES}    # priority -> tenant -> deque of jobs
+        self.depth = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.running = {}           # tenant -> workers rendering its jobs
+        self.busy = self.background_busy = 0
+        self.job_ids = 0
+        self.pool = None
+        self.restarts = 0           # Pools replaced after a worker died
+        self.dispatcher = None
+        self.wakeup = None
+        self.in_flight = set()
+        self.counters = {priority: {'submitted': 0, 'dispatched': 0, 'completed': 0, 'failed': 0, 'cancelled': 0,
+                                    'expired': 0, 'escalated': 0, 'batches': 0}
+                         for priority in PRIORITY_CLASSES}
+        self.waits = {priority: deque(maxlen=LATENCY_WINDOW) for priority in PRIORITY_CLASSES}
+        self.latencies = {priority: deque(maxlen=LATENCY_WINDOW) for priority in PRIORITY_CLASSES}
+
+    async def start(self):
+        """Start and warm up the workers"""
+        self.wakeup = asyncio.Event()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        await self._warm_up(self.pool)
+        self.dispatcher = asyncio.create_task(self._run_dispatcher())
+
+    async def _warm_up(self, pool):
+        # Touch every worker once so the first real jobs skip process start-up
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, render_jobs, []) for _ in range(self.workers)))
+
+    async def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        for queues in self.queues.values():
+            for jobs in queues.values():
+                for job in jobs:
+                    job.future.cancel()
+        if self.pool is not None:
+            # Waiting for the workers to exit must not hold up the event loop
+            await asyncio.to_thread(self.pool.shutdown, cancel_futures=True)
+
+    def limit(self, tenant):
+        return self.tenant_limits.get(tenant, self.tenant_limit)
+
+    def submit(self, spec, priority='standard', tenant='default', timeout=None):
+        """Queue one spec (a prompt and/or element overrides); returns its Job.
+
+        timeout is the job's deadline in seconds from now.
+        """
+        if priority not in self.queues:
+            raise ValueError(f"unknown priority class: {priority}")
+        if sum(self.depth.values()) >= self.queue_size:
+            raise SchedulerBusy(f"queue full ({self.queue_size} jobs waiting)")
+        loop = asyncio.get_running_loop()
+        self.job_ids += 1
+        job = Job(self.job_ids, json.dumps(spec), priority, tenant, loop.create_future())
+        if timeout is not None:
+            job.timer = loop.call_later(timeout, self._expire, job, timeout)
+        job.future.add_done_callback(partial(self._finished, job))
+        self.queues[priority].setdefault(tenant, deque()).append(job)
+        self.depth[priority] += 1
+        self.counters[priority]['submitted'] += 1
+        self.wakeup.set()
+        return job
+
+    async def generate(self, spec, priority='standard', tenant='default', timeout=None):
+        """Queue one spec and wait for its render result; cancelling the wait cancels the job"""
+        return await self.submit(spec, priority, tenant, timeout).future
+
+    @staticmethod
+    def cancel(job):
+        """Drop a job; False if it had already finished"""
+        return job.future.cancel()
+
+    def escalate(self, job, priority):
+        """Move a still queued job to a more urgent class; False if it is not queued or already as urgent.
+
+        It joins the back of its tenant's queue in that class, and is counted
+        as escalated in its old class and submitted in the new one.
+        """
+        if job.dispatched is not None or job.future.done() or \
+                PRIORITY_CLASSES.index(priority) >= PRIORITY_CLASSES.index(job.priority):
+            return False
+        jobs = self.queues[job.priority][job.tenant]
+        jobs.remove(job)
+        if not jobs:
+            del self.queues[job.priority][job.tenant]
+        self.depth[job.priority] -= 1
+        self.counters[job.priority]['escalated'] += 1
+        job.priority = priority
+        self.queues[priority].setdefault(job.tenant, deque()).append(job)
+        self.depth[priority] += 1
+        self.counters[priority]['submitted'] += 1
+        self.wakeup.set()
+        return True
+
+    def _expire(self, job, timeout):
+        if not job.future.done():
+            job.future.set_exception(DeadlineExceeded(f"no song within {timeout:g}s"))
+
+    def _finished(self, job, future):
+        if job.timer is not None:
+            job.timer.cancel()
+        counters = self.counters[job.priority]
+        if job.dispatched is None:
+            self.depth[job.priority] -= 1       # Still queued: the dispatcher skips it
+        if future.cancelled():
+            counters['cancelled'] += 1
+        elif isinstance(future.exception(), DeadlineExceeded):
+            counters['expired'] += 1
+        else:
+            counters['completed' if future.result()['status'] == 'ok' else 'failed'] += 1
+            self.latencies[job.priority].append((time.perf_counter() - job.submitted) * 1000.0)
+
+    def _take(self, priority, room):
+        """Up to room runnable jobs of a class, one per tenant in turn"""
+        queues = self.queues[priority]
+        batch = []
+        tenants = set()
+        passed = 0      # Tenants in a row that had nothing runnable
+        while len(batch) < room and passed < len(queues):
+            tenant = next(iter(queues))
+            jobs = queues.pop(tenant)
+            while jobs and jobs[0].future.done():
+                jobs.popleft()
+            if jobs and (tenant in tenants or self.running.get(tenant, 0) < self.limit(tenant)):
+                batch.append(jobs.popleft())
+                if tenant not in tenants:
+                    tenants.add(tenant)
+                    self.running[tenant] = self.running.get(tenant, 0) + 1
+                passed = 0
+            elif jobs:
+                passed += 1
+            if jobs:
+                queues[tenant] = jobs       # Back of the line
+        return batch
+
+    def _next_batch(self):
+        """(priority, batch, 0) to dispatch next, or (None, None, seconds to wait for a batch to fill)"""
+        wait = 0.0
+        for priority in PRIORITY_CLASSES:
+            if priority == BACKGROUND_CLASS and self.background_busy >= self.workers - self.reserved:
+                continue
+            if self.linger and 0 < self.depth[priority] < self.batch_sizes[priority]:
+                oldest = min(jobs[0].submitted for jobs in self.queues[priority].values())
+                filling = oldest + self.linger - time.perf_counter()
+                if filling > 0:
+                    # Still filling: a less urgent class may have the worker meanwhile
+                    wait = min(wait, filling) if wait else filling
+                    continue
+            batch = self._take(priority, self.batch_sizes[priority])
+            if batch:
+                return priority, batch, 0.0
+        return None, None, wait
+
+    async def _run_dispatcher(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.busy < self.workers:
+                priority, batch, wait = self._next_batch()
+                if batch is None:
+                    if wait:
+                        asyncio.get_running_loop().call_later(wait, self.wakeup.set)
+                    break
+                self.busy += 1
+                if priority == BACKGROUND_CLASS:
+                    self.background_busy += 1
+                dispatched = time.perf_counter()
+                for job in batch:
+                    job.dispatched = dispatched
+                    self.depth[priority] -= 1
+                    self.waits[priority].append((dispatched - job.submitted) * 1000.0)
+                task = asyncio.create_task(self._dispatch(priority, batch))
+                self.in_flight.add(task)
+                task.add_done_callback(self.in_flight.discard)
+
+    async def _dispatch(self, priority, batch):
+        self.counters[priority]['batches'] += 1
+        self.counters[priority]['dispatched'] += len(batch)
+        pool = self.pool
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                pool, render_jobs, [(job.id, job.spec) for job in batch])
+        except BrokenExecutor as e:
+            # A worker died (killed, out of memory): this batch is lost, later ones get a new pool
+            results = [{'status': 'error', 'error': f"{type(e).__name__}: {e}"}] * len(batch)
+            self._replace_pool(pool)
+        except Exception as e:
+            results = [{'status': 'error', 'error': f"{type(e).__name__}: {e}"}] * len(batch)
+        finally:
+            self.busy -= 1
+            if priority == BACKGROUND_CLASS:
+                self.background_busy -= 1
+            for tenant in {job.tenant for job in batch}:
+                self.running[tenant] -= 1
+                if not self.running[tenant]:
+                    del self.running[tenant]
+            self.wakeup.set()
+
+        for job, result in zip(batch, results):
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _replace_pool(self, broken):
+        if self.pool is not broken:
+            return      # Another batch on the same pool got here first
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        task = asyncio.create_task(self._rewarm(self.pool))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def _rewarm(self, pool):
+        with contextlib.suppress(BrokenExecutor):
+            await self._warm_up(pool)     # A pool that breaks again is replaced by the batch that sees it
+
+    def metrics(self):
+        """Queue depth, counts, wait and latency percentiles per priority class, and busy tenants"""
+        return {
+            'workers': self.workers,
+            'reserved': self.reserved,
+            'busy_workers': self.busy,
+            'pool_restarts': self.restarts,
+            'queue_depth': sum(self.depth.values()),
+            'classes': {priority: dict(self.counters[priority],
+                                       queue_depth=self.depth[priority],
+                                       wait_ms=latency_summary(self.waits[priority]),
+                                       latency_ms=latency_summary(self.latencies[priority]))
+                        for priority in PRIORITY_CLASSES},
+            'tenants': {tenant: {'running': running, 'limit': self.limit(tenant)}
+                        for tenant, running in self.running.items()},
+        }
@@ -0,0 +1,68 @@
+import numpy as np
+
+# How much each metric counts towards the overall score (weights sum to 1)
+SCORE_WEIGHTS = {'repetition': 0.35, 'range': 0.2, 'chord_tones': 0.45}
+
+MOTIF_NOTES = 4         # Melodic figures of this many notes are compared for repetition
+IDEAL_RANGE = 12        # Semitones a singable melody spans; the range score falls off either side
+CHORD_GAP = 0.25        # Harmony notes starting closer together than this (beats) form one chord
+
+
+def repetition_score(pitch):
+    """Share of the melody's MOTIF_NOTES-note figures (as intervals) that repeat an earlier one"""
+    intervals = np.diff(pitch.astype(np.int64))
+    if intervals.shape[0] < MOTIF_NOTES - 1:
+        return 0.0
+    windows = np.lib.stride_tricks.sliding_window_view(intervals, MOTIF_NOTES - 1)
+    # Intervals fit in a byte, so every figure packs into one integer
+    codes = ((windows + 128) << (8 * np.arange(MOTIF_NOTES - 1))).sum(axis=1)
+    return 1.0 - np.unique(codes).shape[0] / codes.shape[0]
+
+
+def range_score(pitch):
+    """1.0 for a melody spanning IDEAL_RANGE semitones, falling to 0 at none or twice that"""
+    if not pitch.shape[0]:
+        return 0.0
+    span = int(pitch.max()) - int(pitch.min())
+    return max(0.0, 1.0 - abs(span - IDEAL_RANGE) / IDEAL_RANGE)
+
+
+def chord_tone_score(melody_start, melody_duration, melody_pitch, harmony_start, harmony_end, harmony_pitch):
+    """Duration-weighted share of melody notes whose pitch class is in the chord sounding at their onset"""
+    if not melody_start.shape[0] or not harmony_start.shape[0]:
+        return 0.0
+    order = np.argsort(harmony_start, kind='stable')
+    harmony_start, harmony_end, harmony_pitch = harmony_start[order], harmony_end[order], harmony_pitch[order]
+
+    # Group harmony notes into chords, each a 12-bit pitch class mask
+    first = np.flatnonzero(np.diff(harmony_start, prepend=-np.inf) > CHORD_GAP)
+    masks = np.bitwise_or.reduceat(1 << (harmony_pitch.astype(np.int64) % 12), first)
+    chord_start = harmony_start[first]
+    chord_end = np.maximum.reduceat(harmony_end, first)
+
+    chord = np.searchsorted(chord_start, melody_start, side='right') - 1
+    sounding = (chord >= 0) & (melody_start < chord_end[np.maximum(chord, 0)])
+    hit = (masks[np.maximum(chord, 0)] >> (melody_pitch.astype(np.int64) % 12)) & 1
+    weight = melody_duration * sounding
+    total = weight.sum()
+    return float((weight * hit).sum() / total) if total else 0.0
+
+
+def score_notes(notes, melody_track=0, harmony_track=1):
+    """Score a composed NoteTable for catchiness and consonance.
+
+    Returns each metric in SCORE_WEIGHTS (0 to 1) and their weighted
+    'score'. Everything is computed with array operations on the note
+    columns, so scoring costs a fraction of rendering the song.
+    """
+    melody = notes.track == melody_track
+    harmony = notes.track == harmony_track
+    pitch = notes.pitch[melody]
+    metrics = {
+        'repetition': repetition_score(pitch),
+        'range': range_score(pitch),
+        'chord_tones': chord_tone_score(notes.start[melody], notes.duration[melody], pitch, notes.start[harmony],
+                                        notes.start[harmony] + notes.duration[harmony], notes.pitch[harmony]),
+    }
+    metrics['score'] = sum(weight * metrics[name] for name, weight in SCORE_WEIGHTS.items())
+    return metrics
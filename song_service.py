@@ -0,0 +1,348 @@
+import asyncio
+import json
+import math
+import time
+import traceback
+from collections import deque
+from functools import partial
+
+from gen_song import ViralMusicGenerator, spec_to_elements
+from parallel import percentile
+from song_scheduler import PRIORITY_CLASSES, DeadlineExceeded, SchedulerBusy, SongScheduler
+
+MAX_HEAD_BYTES = 1 << 16    # Request line and headers; longer ones get a 431
+MAX_BODY_BYTES = 1 << 20
+LATENCY_WINDOW = 10000      # Requests kept for the latency percentiles
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+               504: 'Gateway Timeout'}
+
+
+class ServiceBusy(Exception):
+    """Raised when the request queue is full"""
+
+
+class HeadTooLarge(ValueError):
+    """Raised when a request head does not fit in the stream reader's buffer"""
+
+
+class SongService:
+    """Song generation behind an asyncio front end and a song_scheduler.SongScheduler.
+
+    Requests name a priority class (X-Priority, default interactive), a
+    tenant (X-Tenant) and optionally a deadline (X-Deadline-Ms); the
+    scheduler batches them onto a warm process pool, most urgent class
+    first, waiting at most batch_wait seconds for a batch to fill. Requests
+    beyond queue_size waiting are rejected straight away, which is the
+    service's backpressure; a missed deadline is a 504. With a
+    result_cache.ResultCache, seeded requests that were rendered before are
+    answered from it without touching the workers, and those asking for a
+    song already being rendered share that render.
+    """
+
+    def __init__(self, workers=None, batch_size=8, batch_wait=0.005, queue_size=256, cache=None, tenant_limit=None,
+                 reserved=None):
+        self.scheduler = SongScheduler(workers, tenant_limit=tenant_limit, reserved=reserved, queue_size=queue_size,
+                                       batch_sizes={'interactive': batch_size, 'standard': batch_size},
+                                       linger=batch_wait)
+        self.workers = self.scheduler.workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size
+        self.cache = cache
+        self.rendering = {}
+        self.generator = ViralMusicGenerator()
+        self.server = None
+        self.connections = {}
+        self.started = time.time()
+        self.counters = {'requests': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'coalesced': 0, 'expired': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """Warm up the workers and start listening; returns the bound (host, port)"""
+        await self.scheduler.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEAD_BYTES)
+        self.started = time.time()
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Hang up on idle keep-alive clients so their handlers finish cleanly
+            for writer in list(self.connections.values()):
+                writer.close()
+            if self.connections:
+                await asyncio.wait(list(self.connections), timeout=1.0)
+            await self.server.wait_closed()
+        await self.scheduler.close()
+
+    async def generate(self, spec, priority='interactive', tenant='default', timeout=None):
+        """Queue one spec (a prompt and/or element overrides); returns the render result.
+
+        timeout is a deadline in seconds, after which DeadlineExceeded is raised.
+        """
+        self.counters['requests'] += 1
+        queued = time.perf_counter()
+        key, elements = self._cache_key(spec)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            self.counters['completed'] += 1
+            self.latencies.append((time.perf_counter() - queued) * 1000.0)
+            return cached_result(elements, cached)
+        if key is None:
+            result = await self._render(spec, priority, tenant, timeout)
+        else:
+            result = await self._render_shared(key, spec, priority, tenant, timeout)
+        self.latencies.append((time.perf_counter() - queued) * 1000.0)
+        self.counters['completed' if result['status'] == 'ok' else 'failed'] += 1
+        return result
+
+    async def _render(self, spec, priority, tenant, timeout):
+        try:
+            job = self.scheduler.submit(spec, priority, tenant, timeout)
+        except SchedulerBusy as e:
+            self.counters['rejected'] += 1
+            raise ServiceBusy(str(e))
+        try:
+            return await job.future
+        except DeadlineExceeded:
+            self.counters['expired'] += 1
+            raise
+
+    async def _render_shared(self, key, spec, priority, tenant, timeout):
+        """Render a seeded song once for every request waiting on it at the same time.
+
+        The job has no deadline of its own: each request waits with its own
+        timeout, and the job is cancelled only once no request waits for it
+        any more. A more urgent request moves a still queued job up to its
+        class.
+        """
+        shared = self.rendering.get(key)
+        if shared is None:
+            try:
+                job = self.scheduler.submit(spec, priority, tenant)
+            except SchedulerBusy as e:
+                self.counters['rejected'] += 1
+                raise ServiceBusy(str(e))
+            shared = self.rendering[key] = SharedRender(job)
+            job.future.add_done_callback(partial(self._rendered, key, shared))
+        else:
+            # The same seeded song is already being rendered: share that result
+            self.counters['coalesced'] += 1
+            self.scheduler.escalate(shared.job, priority)
+
+        shared.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(shared.job.future), timeout)
+        except asyncio.TimeoutError:
+            self.counters['expired'] += 1
+            raise DeadlineExceeded(f"no song within {timeout:g}s")
+        finally:
+            shared.waiters -= 1
+            if not shared.waiters and self.scheduler.cancel(shared.job):
+                # Nobody wants it any more; a later request starts afresh
+                self._forget(key, shared)
+
+    def _forget(self, key, shared):
+        if self.rendering.get(key) is shared:
+            del self.rendering[key]
+
+    def _rendered(self, key, shared, future):
+        self._forget(key, shared)
+        if not future.cancelled() and future.exception() is None and future.result()['status'] == 'ok':
+            self.cache.put(key, future.result()['tempo'], future.result()['midi_data'])
+
+    def _cache_key(self, spec):
+        """(key, elements) for explicitly seeded specs; unseeded ones are always rendered"""
+        if self.cache is None:
+            return None, None
+        overrides = spec.get('elements', spec)
+        if not isinstance(overrides, dict) or overrides.get('seed', spec.get('seed')) is None:
+            return None, None
+        try:
+            elements = spec_to_elements(self.generator, spec)
+        except (ValueError, TypeError, KeyError):
+            return None, None   # Let the worker report the error
+        return elements.cache_key(), elements
+
+    def metrics(self):
+        """Counters, throughput and latency percentiles since start"""
+        uptime = time.time() - self.started
+        latencies = sorted(self.latencies)
+        scheduler = self.scheduler.metrics()
+        batches = sum(counters['batches'] for counters in scheduler['classes'].values())
+        dispatched = sum(counters['dispatched'] for counters in scheduler['classes'].values())
+        return dict(self.counters, **{
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'uptime_sec': uptime,
+            'queue_depth': scheduler['queue_depth'],
+            'workers': self.workers,
+            'songs_per_sec': self.counters['completed'] / uptime if uptime else 0.0,
+            'batches': batches,
+            'mean_batch_size': dispatched / batches if batches else 0.0,
+            'scheduler': scheduler,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else 0.0,
+            },
+        })
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload, extra = await self._route(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(format_response(status, content_type, payload, extra, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HeadTooLarge as e:
+            writer.write(format_response(431, 'application/json', json_body({'error': str(e)}), {}, False))
+        except ValueError as e:
+            writer.write(format_response(400, 'application/json', json_body({'error': str(e)}), {}, False))
+        except Exception:
+            # A bug of ours: log it and answer rather than hang up on the client
+            traceback.print_exc()
+            writer.write(format_response(500, 'application/json', json_body({'error': "internal error"}), {}, False))
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def _route(self, method, path, headers, body):
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            return 200, 'application/json', json_body({'status': 'ok'}), {}
+        if path == '/metrics':
+            return 200, 'application/json', json_body(self.metrics()), {}
+        if path != '/generate':
+            return 404, 'application/json', json_body({'error': f"no route for {path}"}), {}
+        if method != 'POST':
+            return 405, 'application/json', json_body({'error': "use POST"}), {}
+
+        try:
+            spec = json.loads(body or b'{}')
+        except ValueError as e:
+            return 400, 'application/json', json_body({'error': f"invalid JSON: {e}"}), {}
+        if not isinstance(spec, dict):
+            return 400, 'application/json', json_body({'error': "body must be a JSON object"}), {}
+        priority = headers.get('x-priority', 'interactive')
+        if priority not in PRIORITY_CLASSES:
+            return 400, 'application/json', json_body({'error': f"X-Priority must be one of {PRIORITY_CLASSES}"}), {}
+        timeout = None
+        if 'x-deadline-ms' in headers:
+            try:
+                timeout = float(headers['x-deadline-ms']) / 1000.0
+            except ValueError:
+                timeout = math.nan
+            if not 0 < timeout < math.inf:
+                return 400, 'application/json', json_body({'error': "X-Deadline-Ms must be a positive number"}), {}
+
+        try:
+            result = await self.generate(spec, priority, headers.get('x-tenant', 'default'), timeout)
+        except ServiceBusy as e:
+            return 503, 'application/json', json_body({'error': str(e)}), {'Retry-After': '1'}
+        except DeadlineExceeded as e:
+            return 504, 'application/json', json_body({'error': str(e)}), {}
+        if result['status'] != 'ok':
+            return 400, 'application/json', json_body({'error': result['error']}), {}
+        return 200, 'audio/midi', result['midi_data'], {
+            'X-Song-Seed': result['seed'],
+            'X-Song-Genre': result['genre'],
+            'X-Song-Vibe': result['vibe'],
+            'X-Song-Key': result['key'],
+            'X-Song-Tempo': result['tempo'],
+            'X-Song-Progression': ' '.join(result['chord_progression']),
+        }
+
+
+class SharedRender:
+    """One scheduled render of a seeded song and how many requests wait for it"""
+
+    __slots__ = ('job', 'waiters')
+
+    def __init__(self, job):
+        self.job = job
+        self.waiters = 0
+
+
+def cached_result(elements, cached):
+    """A render result rebuilt from a cache entry"""
+    tempo, midi_data = cached
+    return {
+        'status': 'ok',
+        'genre': elements['genre'],
+        'vibe': elements['vibe'],
+        'key': elements['key'],
+        'tempo': tempo,
+        'chord_progression': list(elements['chord_progression']),
+        'catchiness': elements['catchiness'],
+        'seed': elements['seed'],
+        'midi_data': midi_data,
+    }
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, path, headers, body) or None at EOF"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ValueError("truncated request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HeadTooLarge(f"request head larger than {MAX_HEAD_BYTES} bytes")
+    lines = head.decode('iso-8859-1').split('\r\n')
+    parts = lines[0].split()
+    if len(parts) != 3:
+        raise ValueError(f"bad request line: {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError(f"body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return parts[0].upper(), parts[1], headers, body
+
+
+def format_response(status, content_type, payload, extra_headers, keep_alive):
+    """Encode a response; raises ValueError for header values that would break out of their line"""
+    headers = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+               f"Content-Type: {content_type}",
+               f"Content-Length: {len(payload)}",
+               f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    for name, value in extra_headers.items():
+        value = str(value)
+        if '\r' in value or '\n' in value or not all(ord(char) < 256 for char in value):
+            raise ValueError(f"{name} value is not a single latin-1 line: {value!r}")
+        headers.append(f"{name}: {value}")
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('iso-8859-1') + payload
+
+
+def json_body(data):
+    return json.dumps(data).encode('utf-8')
+
+
+async def serve(host='127.0.0.1', port=8000, **options):
+    """Run the service until cancelled"""
+    service = SongService(**options)
+    bound_host, bound_port = await service.start(host, port)
+    print(f"🎧 Song service listening on http://{bound_host}:{bound_port} "
+          f"({service.workers} workers, batches of up to {service.batch_size})")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
@@ -0,0 +1,156 @@
+import io
+import os
+import struct
+import time
+
+PACK_MAGIC = b'SGPK'
+PACK_HEADER = struct.Struct('>HI')     # name length, data length
+
+
+class Sink:
+    """Destination for rendered MIDI files.
+
+    write(name, data) stores one song and returns where it went. Sinks are
+    context managers; close() flushes anything still buffered.
+    """
+
+    def write(self, name, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MemorySink(Sink):
+    """Keep songs in memory as bytes, keyed by name"""
+
+    def __init__(self):
+        self.songs = {}
+
+    def write(self, name, data):
+        self.songs[name] = data
+        return name
+
+
+class PathSink(Sink):
+    """Write the song to one caller-chosen path, whatever its name"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, name, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        return self.path
+
+
+class DirectorySink(Sink):
+    """Write every song as its own file in a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+class TarSink(Sink):
+    """Append songs as members of one tar archive"""
+
+    def __init__(self, path, append=False):
+        import tarfile
+        self.path = path
+        self.archive = tarfile.open(path, 'a' if append and os.path.exists(path) else 'w')
+        self.member = tarfile.TarInfo
+
+    def write(self, name, data):
+        info = self.member(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+        return f"{self.path}:{name}"
+
+    def close(self):
+        self.archive.close()
+
+
+class ZipSink(Sink):
+    """Append songs as members of one zip archive (stored, MIDI barely compresses)"""
+
+    def __init__(self, path, append=False, compression=None):
+        import zipfile
+        self.path = path
+        if compression is None:
+            compression = zipfile.ZIP_STORED
+        self.archive = zipfile.ZipFile(path, 'a' if append else 'w', compression=compression)
+
+    def write(self, name, data):
+        self.archive.writestr(name, data)
+        return f"{self.path}:{name}"
+
+    def close(self):
+        self.archive.close()
+
+
+class PackSink(Sink):
+    """Append songs to a length-prefixed pack file.
+
+    The file starts with PACK_MAGIC; every record is a big-endian
+    (name length, data length) header, the UTF-8 name, then the MIDI bytes.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        fresh = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'wb' if fresh else 'ab')
+        if fresh:
+            self.file.write(PACK_MAGIC)
+
+    def write(self, name, data):
+        encoded = name.encode('utf-8')
+        self.file.write(PACK_HEADER.pack(len(encoded), len(data)) + encoded)
+        self.file.write(data)
+        return f"{self.path}:{name}"
+
+    def close(self):
+        self.file.close()
+
+
+def read_pack(path):
+    """Yield (name, data) for every song in a pack file"""
+    with open(path, 'rb') as f:
+        if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+            raise ValueError(f"not a song pack file: {path}")
+        while True:
+            header = f.read(PACK_HEADER.size)
+            if not header:
+                return
+            if len(header) < PACK_HEADER.size:
+                raise ValueError(f"truncated pack record in {path}")
+            name_length, data_length = PACK_HEADER.unpack(header)
+            name = f.read(name_length).decode('utf-8')
+            data = f.read(data_length)
+            if len(data) < data_length:
+                raise ValueError(f"truncated pack record in {path}")
+            yield name, data
+
+
+ARCHIVE_SINKS = {'.tar': TarSink, '.zip': ZipSink, '.pack': PackSink}
+
+
+def open_archive(path, append=False):
+    """Open the archive sink matching the file extension (.tar, .zip or .pack)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ARCHIVE_SINKS:
+        raise ValueError(f"unsupported archive type {extension!r}, expected one of {', '.join(ARCHIVE_SINKS)}")
+    return ARCHIVE_SINKS[extension](path, append=append)